@@ -1,8 +1,20 @@
-import os
-from flask import Flask, request, jsonify, render_template
+import io
+import json
+import time
+from flask import Flask, Request, Response, request, jsonify, render_template
+from werkzeug.exceptions import RequestEntityTooLarge
 import logging
 import config
 from inference.predictions import MultimodalPredictor
+from inference.scheduler import MicroBatchScheduler
+from inference.sweep import sweep_records
+from utils.admin import check_admin
+from utils.concurrency import configure_process
+from utils.forms import InvalidRequest, parse_listing_form, parse_prediction_form, parse_sweep_spec, parse_tabular_form
+from utils.metrics import metrics, request_timings
+from utils.prediction_cache import PredictionCache
+from utils.timing import startup_timer
+from utils.shared_weights import memory_report
 
 # Configure logging
 logging.basicConfig(
@@ -11,11 +23,34 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+class InMemoryUploadRequest(Request):
+    """Request that keeps uploaded files in memory instead of spooling to disk."""
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return io.BytesIO()
+
 def create_app():
     """Create and configure the Flask application."""
+    # Thread pools are sized before anything runs a tokenizer or torch op
+    configure_process()
     app = Flask(__name__)
+    app.request_class = InMemoryUploadRequest
+    # Bounds the memory a single in-memory upload can take
+    app.config['MAX_CONTENT_LENGTH'] = config.MAX_UPLOAD_MB * 1024 * 1024
 
-    predictor = MultimodalPredictor()
+    # With LAZY_LOAD the models are loaded by the first request or by warmup()
+    predictor = MultimodalPredictor(lazy=config.LAZY_LOAD)
+    scheduler = MicroBatchScheduler(predictor) if config.SCHEDULER_ENABLED else None
+    prediction_cache = PredictionCache(config.PREDICTION_CACHE_SIZE, config.PREDICTION_CACHE_TTL_SECONDS)
+    app.extensions['predictor'] = predictor
+    app.extensions['prediction_cache'] = prediction_cache
+    _register_gauges(predictor, scheduler, prediction_cache)
+    # Cached prices belong to the model version that computed them
+    predictor.on_model_swap(lambda previous, version: prediction_cache.clear())
+    # A MODEL_VERSION pin is only moved by an explicit activate, never by ACTIVE
+    if predictor.registry is not None and not config.MODEL_VERSION and config.MODEL_REGISTRY_POLL_SECONDS > 0:
+        predictor.watch_registry(config.MODEL_REGISTRY_POLL_SECONDS)
+    if not config.LAZY_LOAD:
+        logger.info(f"Worker memory after model loading: {memory_report()}")
     
     @app.route('/')
     def home():
@@ -26,46 +61,40 @@ def create_app():
     def predict():
         """Handle prediction requests."""
         try:
-            # Get tabular data from form
-            tabular_data = {}
-            for feature in config.FEATURE_NAMES:
-                value = request.form.get(feature)
-                if value is None:
-                    return jsonify({
-                        'error': f'Missing required feature: {feature}'
-                    }), 400
-                tabular_data[feature] = float(value)
-            
-            # Get uploaded image
-            if 'image' not in request.files:
-                return jsonify({'error': 'No image file provided'}), 400
-                
-            image_file = request.files['image']
-            if image_file.filename == '':
-                return jsonify({'error': 'No image selected'}), 400
-                
-            # Save image temporarily
-            image_path = config.TEMP_IMAGE_PATH
-            image_file.save(image_path)
+            tabular_data, image_files, text = parse_prediction_form(request.form, request.files)
             
-            # Get text description
-            text = request.form.get('title', '')
-            if not text:
-                return jsonify({'error': 'No title text provided'}), 400
+            # The uploads are decoded straight from memory, no temp file
+            photos = [image_file.read() for image_file in image_files]
             
             # Make prediction
             logger.info("Making prediction for property")
-            predicted_price = predictor.predict(tabular_data, image_path, text)
-            
-            # Clean up temporary file
-            if os.path.exists(image_path):
-                os.remove(image_path)
+            start = time.perf_counter()
+            predict_fn = scheduler.predict if scheduler is not None else predictor.predict
+            key = PredictionCache.make_key(tabular_data, photos, text, predictor.model_version)
+            with request_timings() as timings:
+                predicted_price, cached = prediction_cache.get_or_compute(
+                    key, lambda: predict_fn(tabular_data, photos, text))
+            breakdown = timings.summary()
+            total_ms = (time.perf_counter() - start) * 1000
+            logger.info(f"Prediction took {total_ms:.1f} ms: " + ', '.join(
+                f"{stage} {entry['ms']:.1f} ms" for stage, entry in breakdown.items()))
                 
             # Return prediction
-            return jsonify({
+            response = {
                 'predicted_price_millions': predicted_price,
-                'currency': 'IDR'
-            })
+                'currency': 'IDR',
+                'cached': cached
+            }
+            # Opt-in per-request stage breakdown
+            if request.values.get('timings', '').lower() in ('1', 'true'):
+                response['timings_ms'] = {'total': total_ms, 'stages': breakdown}
+            return jsonify(response)
+            
+        except InvalidRequest as e:
+            return jsonify({'error': str(e)}), 400
+            
+        except RequestEntityTooLarge:
+            return jsonify({'error': f'Upload larger than {config.MAX_UPLOAD_MB} MB'}), 413
             
         except ValueError as e:
             logger.error(f"Value error in prediction: {str(e)}")
@@ -75,8 +104,200 @@ def create_app():
             logger.error(f"Error in prediction: {str(e)}")
             return jsonify({'error': str(e)}), 500
     
+    @app.route('/listings/<listing_id>/predict', methods=['POST'])
+    def predict_listing(listing_id):
+        """Predict a stored listing from fresh tabular data, skipping both encoders."""
+        if predictor.listing_store is None:
+            return jsonify({'error': 'Listing store disabled'}), 404
+        try:
+            tabular_data = parse_tabular_form(request.form)
+            predicted_price = predictor.predict_by_id(listing_id, tabular_data)
+            return jsonify({
+                'predicted_price_millions': predicted_price,
+                'currency': 'IDR'
+            })
+
+        except KeyError:
+            return jsonify({'error': f'Unknown listing: {listing_id}'}), 404
+
+        except ValueError as e:
+            return jsonify({'error': f'Invalid value: {str(e)}'}), 400
+
+        except Exception as e:
+            logger.error(f"Error in listing prediction: {str(e)}")
+            return jsonify({'error': str(e)}), 500
+
+    @app.route('/listings/<listing_id>', methods=['PUT'])
+    def store_listing(listing_id):
+        """Embed a listing's photos and title and save them under its ID."""
+        if predictor.listing_store is None:
+            return jsonify({'error': 'Listing store disabled'}), 404
+        try:
+            image_files, text = parse_listing_form(request.form, request.files)
+            photos = [image_file.read() for image_file in image_files]
+            added = predictor.store_listings([listing_id], [photos], [text])
+            return jsonify({'listing_id': listing_id, 'created': bool(added)}), 201 if added else 200
+
+        except RequestEntityTooLarge:
+            return jsonify({'error': f'Upload larger than {config.MAX_UPLOAD_MB} MB'}), 413
+
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        except Exception as e:
+            logger.error(f"Error storing listing: {str(e)}")
+            return jsonify({'error': str(e)}), 500
+
+    @app.route('/sweep', methods=['POST'])
+    def sweep():
+        """Price a grid of tabular variants of one listing; the encoders run at most once.
+
+        Takes a JSON body ``{"base": ..., "grid": ..., "listing_id": ...}`` for
+        a stored listing, or a form with the photos, the title and that JSON
+        (without listing_id) in a ``sweep`` field.
+        """
+        listing_id = None
+        try:
+            if request.is_json:
+                spec = request.get_json(silent=True)
+            else:
+                spec = json.loads(request.form.get('sweep') or 'null')
+            base, grid, listing_id = parse_sweep_spec(spec)
+            photos = text = None
+            if listing_id is None:
+                image_files, text = parse_listing_form(request.form, request.files)
+                photos = [image_file.read() for image_file in image_files]
+            elif predictor.listing_store is None:
+                return jsonify({'error': 'Listing store disabled'}), 404
+
+            start = time.perf_counter()
+            variants = predictor.what_if(base, grid, photos, text, listing_id)
+            total_ms = (time.perf_counter() - start) * 1000
+            logger.info(f"Sweep of {len(variants)} variants took {total_ms:.1f} ms")
+            return jsonify({
+                'variants': sweep_records(variants),
+                'currency': 'IDR',
+                'elapsed_ms': total_ms
+            })
+
+        except KeyError:
+            return jsonify({'error': f'Unknown listing: {listing_id}'}), 404
+
+        except RequestEntityTooLarge:
+            return jsonify({'error': f'Upload larger than {config.MAX_UPLOAD_MB} MB'}), 413
+
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        except Exception as e:
+            logger.error(f"Error in sweep: {str(e)}")
+            return jsonify({'error': str(e)}), 500
+
+    @app.route('/models')
+    def models():
+        """Served, pending and registered fusion model versions."""
+        return jsonify(predictor.model_info())
+
+    @app.route('/models/<version>/activate', methods=['POST'])
+    def activate_model(version):
+        """Make a registry version active and switch this worker to it.
+
+        The version is loaded and warmed in the background while requests
+        keep being served by the current one (202). With ``wait=1`` the
+        response is sent after the switch. The registry's ACTIVE file is
+        only updated once the version is serving here, and other workers
+        follow it when MODEL_REGISTRY_POLL_SECONDS is set. Needs ADMIN_TOKEN.
+        """
+        denied = check_admin(request.headers)
+        if denied:
+            return jsonify({'error': denied[0]}), denied[1]
+        if predictor.registry is None:
+            return jsonify({'error': 'Model registry disabled'}), 404
+        try:
+            future = predictor.swap_model_async(version, activate=True)
+            if request.values.get('wait', '').lower() in ('1', 'true'):
+                return jsonify(future.result())
+            return jsonify({'version': version, 'status': 'loading'}), 202
+
+        except KeyError:
+            return jsonify({'error': f'Unknown model version: {version}'}), 404
+
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        except Exception as e:
+            logger.error(f"Error switching model version: {str(e)}")
+            return jsonify({'error': str(e)}), 500
+
+    @app.route('/stats')
+    def stats():
+        """Report scheduler, prediction cache and embedding cache metrics."""
+        listing_store = predictor.listing_store
+        return jsonify({
+            'scheduler': scheduler.stats() if scheduler is not None else 'disabled',
+            'prediction_cache': prediction_cache.stats(),
+            'branches': predictor.branches.stats(),
+            'model': predictor.model_info(),
+            'embedding_cache': predictor.cache_stats(),
+            'listing_store': listing_store.stats() if listing_store is not None else 'disabled',
+            'startup': startup_timer.summary(),
+            'memory': memory_report()
+        })
+    
+    @app.route('/metrics')
+    def metrics_route():
+        """Stage latency and batch size histograms in Prometheus text format."""
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+    
+    @app.route('/warmup', methods=['POST'])
+    def warmup_route():
+        """Load the models and run a dummy prediction (admin)."""
+        denied = check_admin(request.headers)
+        if denied:
+            return jsonify({'error': denied[0]}), denied[1]
+        return jsonify(predictor.warmup())
+    
     return app
 
+def _register_gauges(predictor, scheduler, prediction_cache):
+    """Expose scheduler queue depth and prediction/embedding cache metrics on /metrics."""
+    def cache_stats():
+        """{cache name: (hits, misses, {tier: entries})} of every enabled cache"""
+        stats = prediction_cache.stats()
+        # Requests that joined an in-flight computation count as hits
+        caches = {'predictions': (stats['hits'] + stats['coalesced'], stats['misses'], {'memory': stats['entries']})}
+        for name, entry in predictor.cache_stats().items():
+            if entry is None:
+                continue
+            if 'memory_hits' in entry:
+                # Embedding caches count memory and disk tier hits separately
+                caches[name] = (entry['memory_hits'] + entry['disk_hits'], entry['misses'],
+                                {'memory': entry['memory_entries'], 'disk': entry['disk_entries']})
+            else:
+                caches[name] = (entry['hits'], entry['misses'], {'memory': entry['size']})
+        return caches
+
+    def hit_rates():
+        return {(('cache', name),): hits / (hits + misses) if hits + misses else 0.0
+                for name, (hits, misses, _) in cache_stats().items()}
+
+    # Hits and misses only grow, so they are counters that rate() can be taken of
+    metrics.counter('house_price_cache_hits_total', 'Prediction cache, embedding cache and stem memo hits',
+                    lambda: {(('cache', name),): hits for name, (hits, _, _) in cache_stats().items()})
+    metrics.counter('house_price_cache_misses_total', 'Prediction cache, embedding cache and stem memo misses',
+                    lambda: {(('cache', name),): misses for name, (_, misses, _) in cache_stats().items()})
+    metrics.gauge('house_price_cache_entries', 'Entries held by each cache tier',
+                  lambda: {(('cache', name), ('tier', tier)): count for name, (_, _, tiers) in cache_stats().items()
+                           for tier, count in tiers.items()})
+    metrics.gauge('house_price_cache_hit_rate', 'Share of cache lookups answered from the cache', hit_rates)
+    if scheduler is not None:
+        metrics.gauge('house_price_scheduler_queue_depth', 'Requests waiting for a micro-batch',
+                      lambda: scheduler.stats()['queue_depth'])
+
+def warmup():
+    """Explicit warmup hook, e.g. for a gunicorn post_fork handler."""
+    return app.extensions['predictor'].warmup()
+
 # Create the Flask application
 app = create_app()
 
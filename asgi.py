@@ -0,0 +1,326 @@
+"""ASGI serving mode: async uploads, bounded inference queue, graceful drain.
+
+Run with:
+    uvicorn asgi:app --host 0.0.0.0 --port 5000 --timeout-graceful-shutdown 35
+
+Uploads are received on the event loop, so slow clients do not hold an
+inference thread, and are kept in memory like the Flask app's. Inference goes through BoundedInferenceExecutor. Once
+MAX_PENDING_REQUESTS are queued or running, /predict answers 429 with
+Retry-After, and while shutting down it answers 503. On shutdown the
+admitted requests are drained for up to SHUTDOWN_DRAIN_SECONDS. Needs the
+optional starlette, python-multipart and uvicorn packages
+(pip install -r requirements-asgi.txt).
+"""
+import asyncio
+import contextlib
+import json
+import logging
+import time
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.formparsers import MultiPartException, MultiPartParser, parse_options_header
+from starlette.responses import FileResponse, JSONResponse, PlainTextResponse
+from starlette.routing import Mount, Route
+from starlette.staticfiles import StaticFiles
+
+import config
+from inference.executor import BoundedInferenceExecutor, QueueFullError, ShuttingDownError
+from inference.predictions import MultimodalPredictor
+from inference.scheduler import MicroBatchScheduler
+from inference.sweep import sweep_records
+from utils.admin import check_admin
+from utils.concurrency import configure_process
+from utils.forms import InvalidRequest, parse_listing_form, parse_prediction_form, parse_sweep_spec, parse_tabular_form
+from utils.metrics import metrics, request_timings
+from utils.prediction_cache import PredictionCache
+from utils.shared_weights import memory_report
+from utils.timing import startup_timer
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Seconds a client rejected with 429 is asked to wait
+RETRY_AFTER_SECONDS = 1
+
+class InMemoryMultiPartParser(MultiPartParser):
+    """Multipart parser that keeps uploads up to the upload limit in memory instead of spooling to disk."""
+    spool_max_size = config.MAX_UPLOAD_MB * 1024 * 1024
+
+async def read_form(request):
+    """The request's form, with uploads held in memory like the Flask app's InMemoryUploadRequest"""
+    content_type, _ = parse_options_header(request.headers.get('content-type'))
+    if content_type != b'multipart/form-data':
+        return await request.form()
+    try:
+        return await InMemoryMultiPartParser(request.headers, request.stream()).parse()
+    except MultiPartException as e:
+        raise InvalidRequest(e.message)
+
+def create_app():
+    """Create the Starlette application with its own predictor and executor."""
+    # Thread pools are sized before anything runs a tokenizer or torch op
+    configure_process()
+    max_upload_bytes = config.MAX_UPLOAD_MB * 1024 * 1024
+
+    # With LAZY_LOAD the models are loaded by the first request or by /warmup
+    predictor = MultimodalPredictor(lazy=config.LAZY_LOAD)
+    scheduler = MicroBatchScheduler(predictor) if config.SCHEDULER_ENABLED else None
+    executor = BoundedInferenceExecutor(predictor, scheduler)
+    prediction_cache = PredictionCache(config.PREDICTION_CACHE_SIZE, config.PREDICTION_CACHE_TTL_SECONDS)
+    # Cached prices belong to the model version that computed them
+    predictor.on_model_swap(lambda previous, version: prediction_cache.clear())
+    # A MODEL_VERSION pin is only moved by an explicit activate, never by ACTIVE
+    if predictor.registry is not None and not config.MODEL_VERSION and config.MODEL_REGISTRY_POLL_SECONDS > 0:
+        predictor.watch_registry(config.MODEL_REGISTRY_POLL_SECONDS)
+    metrics.gauge('house_price_pending_requests', 'Requests admitted and not yet answered',
+                  lambda: executor.stats()['pending'])
+
+    def too_large():
+        return JSONResponse({'error': f'Upload larger than {config.MAX_UPLOAD_MB} MB'}, status_code=413)
+
+    async def read_photos(image_files):
+        """Bytes of the uploaded photos, or None when together they exceed the upload limit"""
+        photos = [await image_file.read() for image_file in image_files]
+        return photos if sum(map(len, photos)) <= max_upload_bytes else None
+
+    async def home(request):
+        return FileResponse('templates/index.html')
+
+    async def predict(request):
+        """Handle prediction requests."""
+        if int(request.headers.get('content-length') or 0) > max_upload_bytes:
+            return too_large()
+        try:
+            form = await read_form(request)
+            tabular_data, image_files, text = parse_prediction_form(form, form)
+            photos = await read_photos(image_files)
+            if photos is None:
+                return too_large()
+
+            logger.info("Making prediction for property")
+            start = time.perf_counter()
+            key = PredictionCache.make_key(tabular_data, photos, text, predictor.model_version)
+            with request_timings() as timings:
+                # Cached and coalesced requests take no slot in the executor queue
+                future, cached = prediction_cache.get_or_submit(
+                    key, lambda: executor.submit(tabular_data, photos, text))
+            predicted_price = await asyncio.wrap_future(future)
+            breakdown = timings.summary()
+            total_ms = (time.perf_counter() - start) * 1000
+            logger.info(f"Prediction took {total_ms:.1f} ms: " + ', '.join(
+                f"{stage} {entry['ms']:.1f} ms" for stage, entry in breakdown.items()))
+
+            response = {
+                'predicted_price_millions': predicted_price,
+                'currency': 'IDR',
+                'cached': cached
+            }
+            # Opt-in per-request stage breakdown
+            timings_flag = request.query_params.get('timings') or form.get('timings') or ''
+            if timings_flag.lower() in ('1', 'true'):
+                response['timings_ms'] = {'total': total_ms, 'stages': breakdown}
+            return JSONResponse(response)
+
+        except QueueFullError:
+            return JSONResponse({'error': 'Server busy, retry later'}, status_code=429,
+                                headers={'Retry-After': str(RETRY_AFTER_SECONDS)})
+
+        except ShuttingDownError:
+            return JSONResponse({'error': 'Server shutting down'}, status_code=503)
+
+        except InvalidRequest as e:
+            return JSONResponse({'error': str(e)}, status_code=400)
+
+        except ValueError as e:
+            logger.error(f"Value error in prediction: {str(e)}")
+            return JSONResponse({'error': f'Invalid value: {str(e)}'}, status_code=400)
+
+        except Exception as e:
+            logger.error(f"Error in prediction: {str(e)}")
+            return JSONResponse({'error': str(e)}, status_code=500)
+
+    async def predict_listing(request):
+        """Predict a stored listing from fresh tabular data, skipping both encoders."""
+        listing_id = request.path_params['listing_id']
+        if predictor.listing_store is None:
+            return JSONResponse({'error': 'Listing store disabled'}, status_code=404)
+        try:
+            tabular_data = parse_tabular_form(await read_form(request))
+            # Only the tabular branch and the fusion head run, so no queue slot is taken
+            predicted_price = await run_in_threadpool(predictor.predict_by_id, listing_id, tabular_data)
+            return JSONResponse({
+                'predicted_price_millions': predicted_price,
+                'currency': 'IDR'
+            })
+
+        except KeyError:
+            return JSONResponse({'error': f'Unknown listing: {listing_id}'}, status_code=404)
+
+        except ValueError as e:
+            return JSONResponse({'error': f'Invalid value: {str(e)}'}, status_code=400)
+
+        except Exception as e:
+            logger.error(f"Error in listing prediction: {str(e)}")
+            return JSONResponse({'error': str(e)}, status_code=500)
+
+    async def store_listing(request):
+        """Embed a listing's photos and title and save them under its ID."""
+        listing_id = request.path_params['listing_id']
+        if predictor.listing_store is None:
+            return JSONResponse({'error': 'Listing store disabled'}, status_code=404)
+        if int(request.headers.get('content-length') or 0) > max_upload_bytes:
+            return too_large()
+        try:
+            form = await read_form(request)
+            image_files, text = parse_listing_form(form, form)
+            photos = await read_photos(image_files)
+            if photos is None:
+                return too_large()
+            added = await run_in_threadpool(predictor.store_listings, [listing_id], [photos], [text])
+            return JSONResponse({'listing_id': listing_id, 'created': bool(added)},
+                                status_code=201 if added else 200)
+
+        except ValueError as e:
+            return JSONResponse({'error': str(e)}, status_code=400)
+
+        except Exception as e:
+            logger.error(f"Error storing listing: {str(e)}")
+            return JSONResponse({'error': str(e)}, status_code=500)
+
+    async def sweep(request):
+        """Price a grid of tabular variants of one listing; see the Flask /sweep route."""
+        if int(request.headers.get('content-length') or 0) > max_upload_bytes:
+            return too_large()
+        listing_id = None
+        try:
+            if request.headers.get('content-type', '').startswith('application/json'):
+                form = {}
+                spec = await request.json()
+            else:
+                form = await read_form(request)
+                spec = json.loads(form.get('sweep') or 'null')
+            base, grid, listing_id = parse_sweep_spec(spec)
+            photos = text = None
+            if listing_id is None:
+                image_files, text = parse_listing_form(form, form)
+                photos = await read_photos(image_files)
+                if photos is None:
+                    return too_large()
+            elif predictor.listing_store is None:
+                return JSONResponse({'error': 'Listing store disabled'}, status_code=404)
+
+            start = time.perf_counter()
+            variants = await run_in_threadpool(predictor.what_if, base, grid, photos, text, listing_id)
+            total_ms = (time.perf_counter() - start) * 1000
+            logger.info(f"Sweep of {len(variants)} variants took {total_ms:.1f} ms")
+            return JSONResponse({
+                'variants': sweep_records(variants),
+                'currency': 'IDR',
+                'elapsed_ms': total_ms
+            })
+
+        except KeyError:
+            return JSONResponse({'error': f'Unknown listing: {listing_id}'}, status_code=404)
+
+        except ValueError as e:
+            return JSONResponse({'error': str(e)}, status_code=400)
+
+        except Exception as e:
+            logger.error(f"Error in sweep: {str(e)}")
+            return JSONResponse({'error': str(e)}, status_code=500)
+
+    async def models(request):
+        """Served, pending and registered fusion model versions."""
+        return JSONResponse(predictor.model_info())
+
+    async def activate_model(request):
+        """Make a registry version active and switch this worker to it (see app.py)."""
+        denied = check_admin(request.headers)
+        if denied:
+            return JSONResponse({'error': denied[0]}, status_code=denied[1])
+        if predictor.registry is None:
+            return JSONResponse({'error': 'Model registry disabled'}, status_code=404)
+        version = request.path_params['version']
+        try:
+            future = predictor.swap_model_async(version, activate=True)
+            if (request.query_params.get('wait') or '').lower() in ('1', 'true'):
+                return JSONResponse(await asyncio.wrap_future(future))
+            return JSONResponse({'version': version, 'status': 'loading'}, status_code=202)
+
+        except KeyError:
+            return JSONResponse({'error': f'Unknown model version: {version}'}, status_code=404)
+
+        except ValueError as e:
+            return JSONResponse({'error': str(e)}, status_code=400)
+
+        except Exception as e:
+            logger.error(f"Error switching model version: {str(e)}")
+            return JSONResponse({'error': str(e)}, status_code=500)
+
+    async def stats(request):
+        """Report executor, scheduler, prediction cache and embedding cache metrics."""
+        listing_store = predictor.listing_store
+        return JSONResponse({
+            'executor': executor.stats(),
+            'scheduler': scheduler.stats() if scheduler is not None else 'disabled',
+            'prediction_cache': prediction_cache.stats(),
+            'branches': predictor.branches.stats(),
+            'model': predictor.model_info(),
+            'embedding_cache': predictor.cache_stats(),
+            'listing_store': listing_store.stats() if listing_store is not None else 'disabled',
+            'startup': startup_timer.summary(),
+            'memory': memory_report()
+        })
+
+    async def metrics_route(request):
+        """Stage latency and batch size histograms in Prometheus text format."""
+        return PlainTextResponse(metrics.render(), media_type='text/plain; version=0.0.4')
+
+    async def warmup_route(request):
+        """Load the models and run a dummy prediction (admin)."""
+        denied = check_admin(request.headers)
+        if denied:
+            return JSONResponse({'error': denied[0]}, status_code=denied[1])
+        return JSONResponse(await run_in_threadpool(predictor.warmup))
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        yield
+        # Stop admitting requests and let the admitted ones finish
+        logger.info(f"Draining {executor.stats()['pending']} pending requests")
+        drained = await run_in_threadpool(executor.shutdown, config.SHUTDOWN_DRAIN_SECONDS)
+        logger.info("Drained all requests" if drained else "Shut down with requests still pending")
+
+    app = Starlette(
+        routes=[
+            Route('/', home),
+            Route('/predict', predict, methods=['POST']),
+            Route('/listings/{listing_id}/predict', predict_listing, methods=['POST']),
+            Route('/listings/{listing_id}', store_listing, methods=['PUT']),
+            Route('/sweep', sweep, methods=['POST']),
+            Route('/models', models),
+            Route('/models/{version}/activate', activate_model, methods=['POST']),
+            Route('/stats', stats),
+            Route('/metrics', metrics_route),
+            Route('/warmup', warmup_route, methods=['POST']),
+            Mount('/static', app=StaticFiles(directory='static'), name='static'),
+        ],
+        lifespan=lifespan
+    )
+    app.state.predictor = predictor
+    app.state.executor = executor
+    app.state.prediction_cache = prediction_cache
+    return app
+
+# Create the ASGI application
+app = create_app()
+
+if __name__ == "__main__":
+    import uvicorn
+    # Several workers need the import string so each process builds its own app
+    uvicorn.run('asgi:app' if config.SERVER_WORKERS > 1 else app, host=config.HOST, port=config.PORT,
+                workers=config.SERVER_WORKERS, timeout_graceful_shutdown=int(config.SHUTDOWN_DRAIN_SECONDS) + 5)
@@ -0,0 +1,50 @@
+"""Compare two benchmark runs written by benchmarks/suite.py.
+
+Usage:
+    python -m benchmarks.compare baseline.json candidate.json [--metric p50_ms] [--threshold 0.10]
+
+Prints the relative change of the metric for every stage, thread count and
+batch size present in both runs and exits non-zero when any latency grew by
+more than the threshold (or throughput dropped by more than it).
+"""
+import argparse
+import json
+import sys
+
+def load_results(path):
+    with open(path) as f:
+        run = json.load(f)
+    return {(r['stage'], r['threads'], r['batch_size']): r for r in run['results']}
+
+def compare(baseline, candidate, metric, threshold):
+    """Rows of (key, baseline value, candidate value, relative change, regressed)"""
+    # Higher is better for throughput, lower for everything else
+    higher_is_better = metric == 'items_per_second'
+    rows = []
+    for key in sorted(baseline.keys() & candidate.keys()):
+        before = baseline[key][metric]
+        after = candidate[key][metric]
+        change = (after - before) / before if before else 0.0
+        regressed = -change > threshold if higher_is_better else change > threshold
+        rows.append((key, before, after, change, regressed))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--metric', default='p50_ms',
+                        choices=['p50_ms', 'p95_ms', 'p99_ms', 'mean_ms', 'items_per_second', 'rss_growth_mb'])
+    parser.add_argument('--threshold', type=float, default=0.10, help='Relative change counted as a regression')
+    args = parser.parse_args()
+
+    rows = compare(load_results(args.baseline), load_results(args.candidate), args.metric, args.threshold)
+    for (stage, threads, batch_size), before, after, change, regressed in rows:
+        flag = '  REGRESSION' if regressed else ''
+        print(f"{stage:>16} threads={threads:<3} batch={batch_size:<4} "
+              f"{before:10.2f} -> {after:10.2f} ({change:+.1%}){flag}")
+    if any(row[-1] for row in rows):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""Small randomly initialised encoders with the same interfaces as the real ones.
+
+Benchmarks build their processors from these so they run offline without the
+DINOv2/E5 checkpoints. Absolute timings are not comparable to production, but
+relative changes between two runs on the same machine are.
+"""
+import io
+import random
+
+import numpy as np
+import torch
+
+from config import TABULAR_DIM, IMAGE_DIM, TEXT_DIM
+
+WORDS = ("rumah dijual cepat harga murah baru bagus lokasi strategis dekat tol "
+         "kampus pusat kota perumahan cluster minimalis siap huni kamar tidur "
+         "mandi luas tanah bangunan carport garasi sertifikat shm listrik "
+         "furnished lantai hadap selatan utara taman keamanan jam akses").split()
+
+# A few of NLTK's Indonesian stopwords, so no NLTK data is needed
+STOPWORDS = ['yang', 'dan', 'di', 'ke', 'dari', 'ini', 'itu', 'untuk', 'dengan', 'ada', 'jam']
+
+LISTING = {
+    'Kamar Tidur': 3, 'Kamar Mandi': 2, 'Luas Tanah': 50.0, 'Luas Bangunan': 68.0,
+    'Nama Perumahan': 'Pakuwon City', 'Sertifikat': 'SHM', 'Carpots': 1, 'Daya Listrik': np.nan,
+    'Interior': 'Semi Furnished', 'Jumlah Lantai': 1, 'Orientasi Bangunan': 'Selatan',
+    'Tahun Dibangun': 2021, 'Garasi': 1, 'Latitude': -7.3132, 'Longitude': 112.7672,
+    'City': 'Surabaya', 'District': 'Pakuwon City'
+}
+
+def make_tokenizer(words=WORDS):
+    """Word-level fast tokenizer with XLM-R style special tokens"""
+    from tokenizers import Tokenizer, models, pre_tokenizers, processors
+    from transformers import PreTrainedTokenizerFast
+
+    vocab = {"<s>": 0, "<pad>": 1, "</s>": 2, "<unk>": 3, "passage": 4, ":": 5}
+    for word in words:
+        vocab.setdefault(word, len(vocab))
+    tokenizer = Tokenizer(models.WordLevel(vocab, unk_token="<unk>"))
+    tokenizer.pre_tokenizer = pre_tokenizers.WhitespaceSplit()
+    tokenizer.post_processor = processors.TemplateProcessing(
+        single="<s> $A </s>", special_tokens=[("<s>", 0), ("</s>", 2)])
+    return PreTrainedTokenizerFast(tokenizer_object=tokenizer, bos_token="<s>", eos_token="</s>",
+                                   pad_token="<pad>", unk_token="<unk>")
+
+def make_text_encoder(hidden_size=384, layers=4, heads=6, seed=0):
+    """Randomly initialised XLM-R encoder (E5 shares the architecture)"""
+    from transformers import XLMRobertaConfig, XLMRobertaModel
+
+    torch.manual_seed(seed)
+    config = XLMRobertaConfig(vocab_size=len(WORDS) + 8, hidden_size=hidden_size,
+                              num_hidden_layers=layers, num_attention_heads=heads,
+                              intermediate_size=hidden_size * 4, max_position_embeddings=514,
+                              pad_token_id=1)
+    return XLMRobertaModel(config, add_pooling_layer=False).eval()
+
+def make_image_encoder(hidden_size=IMAGE_DIM, layers=2, heads=16, seed=0):
+    """Randomly initialised DINOv2 encoder at the real patch size and input resolution"""
+    from transformers import Dinov2Config, Dinov2Model
+
+    torch.manual_seed(seed)
+    config = Dinov2Config(hidden_size=hidden_size, num_hidden_layers=layers, num_attention_heads=heads,
+                          image_size=224, patch_size=14)
+    return Dinov2Model(config).eval()
+
+def make_image_preprocessor():
+    """The resize/crop/normalize pipeline of the DINOv2 checkpoints"""
+    from transformers import BitImageProcessor
+
+    return BitImageProcessor(size={"shortest_edge": 256}, crop_size={"height": 224, "width": 224},
+                             do_convert_rgb=True, image_mean=[0.485, 0.456, 0.406],
+                             image_std=[0.229, 0.224, 0.225])
+
+def make_text_processor(token_budget=None, hidden_size=384, layers=4, heads=6, cache=None, cores=None):
+    """TextProcessor wired to the stand-in tokenizer, encoder and stopwords"""
+    from processor.text_preprocessor import TextPreprocessor
+    from processor.text_processor import TextProcessor
+
+    kwargs = {} if token_budget is None else {'token_budget': token_budget}
+    processor = TextProcessor('stand-in/e5', cache=cache, lazy=True, cores=cores, **kwargs)
+    processor.device = torch.device('cpu')
+    processor.tokenizer = make_tokenizer()
+    processor.preprocessor = TextPreprocessor(stopwords=STOPWORDS)
+    processor.model = make_text_encoder(hidden_size, layers, heads)
+    return processor
+
+def make_image_processor(layers=2, cache=None, cores=None):
+    """ImageProcessor wired to the stand-in DINOv2 encoder"""
+    from processor.image_processor import ImageProcessor
+
+    processor = ImageProcessor('stand-in/dinov2', cache=cache, lazy=True, cores=cores)
+    processor.device = torch.device('cpu')
+    processor.image_processor = make_image_preprocessor()
+    processor._target_edge = processor.image_processor.size['shortest_edge']
+    processor.model = make_image_encoder(IMAGE_DIM, layers)
+    return processor
+
+def make_fusion_model(fused=True, seed=0):
+    """Randomly initialised fusion model, in the serving layout by default"""
+    from utils.fused_model import FusedFusionModel
+    from utils.model_loader import EnhancedFusionModel
+
+    torch.manual_seed(seed)
+    model = EnhancedFusionModel(TABULAR_DIM, IMAGE_DIM, TEXT_DIM).eval()
+    return FusedFusionModel.from_model(model) if fused else model
+
+def make_predictor(encoder_layers=2, fused=True, image_cores=None, text_cores=None):
+    """MultimodalPredictor assembled from stand-ins, with the embedding caches off"""
+    from inference.predictions import MultimodalPredictor
+    from processor.tabular_processor import TabularProcessor
+
+    predictor = MultimodalPredictor(lazy=True, embedding_cache=False)
+    predictor.tabular_processor = TabularProcessor()
+    predictor.image_processor = make_image_processor(encoder_layers, cores=image_cores)
+    predictor.text_processor = make_text_processor(hidden_size=TEXT_DIM, layers=encoder_layers, heads=16,
+                                                   cores=text_cores)
+    predictor.model = make_fusion_model(fused)
+    predictor._loaded = True
+    return predictor
+
+def mixed_length_texts(count, long_fraction=0.25, seed=0):
+    """Short listing titles mixed with long descriptions"""
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(count):
+        words = rng.randint(150, 450) if rng.random() < long_fraction else rng.randint(4, 16)
+        texts.append(' '.join(rng.choice(WORDS) for _ in range(words)))
+    return texts
+
+def listing_images(count, seed=0):
+    """JPEG bytes of random photos at typical listing resolutions"""
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    sizes = [(640, 480), (1024, 768), (1600, 1200), (800, 800)]
+    images = []
+    for i in range(count):
+        width, height = sizes[i % len(sizes)]
+        buffer = io.BytesIO()
+        Image.fromarray(rng.integers(0, 255, (height, width, 3), dtype=np.uint8)).save(buffer, format='JPEG')
+        images.append(buffer.getvalue())
+    return images
+
+def listings(count, long_fraction=0.1, seed=0):
+    """(tabular_data, image, text_data) records in the predict_batch format"""
+    rng = random.Random(seed)
+    texts = mixed_length_texts(count, long_fraction, seed)
+    images = listing_images(min(count, 8), seed)
+    records = []
+    for i in range(count):
+        listing = dict(LISTING)
+        listing['Luas Tanah'] = float(rng.randint(30, 300))
+        listing['Kamar Tidur'] = rng.randint(1, 6)
+        records.append((listing, images[i % len(images)], texts[i]))
+    return records
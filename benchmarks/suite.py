@@ -0,0 +1,165 @@
+"""Per-stage latency, throughput and memory benchmarks on stand-in encoders.
+
+Usage:
+    python -m benchmarks.suite [--batch-sizes 1 8 32] [--threads 1 4] [--iterations 10] [--output run.json]
+    python -m benchmarks.compare baseline.json run.json
+
+Every stage (tabular preprocessing, image decode + DINOv2, text preprocessing,
+text preprocessing + E5, the fusion model, a what-if sweep over tabular
+variants of one listing and predict_batch end to end) runs
+at each batch size and torch thread count. The JSON result records p50/p95/p99
+latency, items per second and the peak RSS growth while the stage ran, plus
+enough metadata (commit, torch version, CPU count) to tell runs apart.
+Everything runs offline on the randomly initialised models from
+benchmarks/stand_ins.py with the embedding caches disabled.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import psutil
+import torch
+
+from benchmarks.stand_ins import listings, make_predictor
+from config import TABULAR_DIM, IMAGE_DIM, TEXT_DIM
+
+STAGES = ['tabular', 'image', 'text_preprocess', 'text', 'fusion', 'sweep', 'end_to_end']
+
+class PeakMemory:
+    """Samples process RSS on a background thread while the block runs"""
+    def __init__(self, interval=0.002):
+        self.interval = interval
+        self.process = psutil.Process()
+        self.baseline = 0
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.process.memory_info().rss)
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self.baseline = self.peak = self.process.memory_info().rss
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.process.memory_info().rss)
+
+def stage_functions(predictor, records):
+    """Callables taking a batch size and running one stage over that many items"""
+    tabular = pd.DataFrame([record[0] for record in records])
+    images = [record[1] for record in records]
+    texts = [record[2] for record in records]
+    features = (torch.randn(len(records), TABULAR_DIM), torch.randn(len(records), IMAGE_DIM),
+                torch.randn(len(records), TEXT_DIM))
+
+    def fusion(n):
+        with torch.no_grad():
+            predictor.model(*(feature[:n] for feature in features))
+
+    contexts = []
+    def sweep(n):
+        # The listing is encoded once, as an analyst's session would
+        if not contexts:
+            contexts.append(predictor.sweep_context(images[0], texts[0]))
+        predictor.predict_sweep(contexts[0], tabular.iloc[:n])
+
+    return {
+        'tabular': lambda n: predictor.tabular_processor.process_array(tabular.iloc[:n]),
+        'image': lambda n: predictor.image_processor.process_array(images[:n]),
+        'text_preprocess': lambda n: predictor.text_processor.preprocessor.preprocess_batch(texts[:n]),
+        'text': lambda n: predictor.text_processor.process_array(texts[:n]),
+        'fusion': fusion,
+        'sweep': sweep,
+        'end_to_end': lambda n: predictor.predict_batch(records[:n], batch_size=n),
+    }
+
+def measure(run, batch_size, iterations, warmup):
+    """Latency percentiles, throughput and peak memory of one stage"""
+    for _ in range(warmup):
+        run(batch_size)
+    latencies = []
+    with PeakMemory() as memory:
+        for _ in range(iterations):
+            start = time.perf_counter()
+            run(batch_size)
+            latencies.append((time.perf_counter() - start) * 1000)
+    latencies = np.array(latencies)
+    return {
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'mean_ms': float(latencies.mean()),
+        'items_per_second': float(batch_size * 1000 / latencies.mean()),
+        'peak_rss_mb': memory.peak / 2**20,
+        'rss_growth_mb': (memory.peak - memory.baseline) / 2**20,
+    }
+
+def metadata(args):
+    """What produced a run, so results are only compared like for like"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'torch': torch.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'encoder_layers': args.encoder_layers,
+        'iterations': args.iterations,
+        'warmup': args.warmup,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--threads', type=int, nargs='+', default=sorted({1, torch.get_num_threads()}),
+                        help='torch intra-op thread counts to run at')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES)
+    parser.add_argument('--iterations', type=int, default=10)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--encoder-layers', type=int, default=2, help='Layers of the stand-in encoders')
+    parser.add_argument('--output', help='Write the result as JSON to this path')
+    args = parser.parse_args()
+
+    predictor = make_predictor(args.encoder_layers)
+    records = listings(max(args.batch_sizes))
+    functions = stage_functions(predictor, records)
+
+    results = []
+    for threads in args.threads:
+        torch.set_num_threads(threads)
+        for stage in args.stages:
+            for batch_size in args.batch_sizes:
+                result = {'stage': stage, 'threads': threads, 'batch_size': batch_size}
+                result.update(measure(functions[stage], batch_size, args.iterations, args.warmup))
+                results.append(result)
+                print(f"{stage:>16} threads={threads:<3} batch={batch_size:<4} "
+                      f"p50={result['p50_ms']:9.2f}ms p99={result['p99_ms']:9.2f}ms "
+                      f"{result['items_per_second']:9.1f}/s", flush=True)
+
+    run = {'meta': metadata(args), 'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(run, f, indent=2)
+    else:
+        print(json.dumps(run, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Compare padded-block and length-bucketed E5 batching on mixed-length text.
+
+Usage:
+    python -m benchmarks.text_batching [--texts 512] [--chunk-size 256] [--token-budget 8192] [--output result.json]
+
+Runs offline with the stand-in encoder from benchmarks/stand_ins.py. Each
+chunk of texts goes through TextProcessor._embed once with the token budget
+disabled (every text padded to the longest in its chunk) and once bucketed by
+length, and the padded token counts, wall time and largest embedding
+difference are reported as JSON.
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+import torch
+
+from benchmarks.stand_ins import make_text_processor, mixed_length_texts
+from processor.text_processor import length_buckets
+
+def padded_tokens(lengths, buckets):
+    """Tokens the encoder sees, padding included"""
+    return sum(len(bucket) * max(lengths[i] for i in bucket) for bucket in buckets)
+
+def run(processor, chunks, repeats):
+    """Embeddings and best wall time over the repeats"""
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        embeddings = np.concatenate([processor._embed(chunk) for chunk in chunks])
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return embeddings, best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--texts', type=int, default=512)
+    parser.add_argument('--long-fraction', type=float, default=0.25, help='Share of long descriptions')
+    parser.add_argument('--chunk-size', type=int, default=256, help='Texts passed to one _embed call')
+    parser.add_argument('--token-budget', type=int, default=8192)
+    parser.add_argument('--hidden-size', type=int, default=384)
+    parser.add_argument('--layers', type=int, default=4)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--threads', type=int, default=None, help='torch intra-op threads')
+    parser.add_argument('--output', help='Write the result as JSON to this path')
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    texts = mixed_length_texts(args.texts, args.long_fraction)
+    chunks = [texts[i:i + args.chunk_size] for i in range(0, len(texts), args.chunk_size)]
+
+    padded = make_text_processor(0, args.hidden_size, args.layers)
+    bucketed = make_text_processor(args.token_budget, args.hidden_size, args.layers)
+    bucketed.model = padded.model
+
+    # Token counts straight from the tokenizer, before any padding
+    real = 0
+    block_tokens = 0
+    bucket_tokens = 0
+    for chunk in chunks:
+        lengths = [len(ids) for ids in padded.tokenizer(
+            ["passage: " + text for text in chunk], truncation=True, max_length=512)['input_ids']]
+        real += sum(lengths)
+        block_tokens += len(lengths) * max(lengths)
+        bucket_tokens += padded_tokens(lengths, length_buckets(lengths, args.token_budget))
+
+    block_embeddings, block_seconds = run(padded, chunks, args.repeats)
+    bucket_embeddings, bucket_seconds = run(bucketed, chunks, args.repeats)
+
+    result = {
+        'texts': len(texts),
+        'chunk_size': args.chunk_size,
+        'token_budget': args.token_budget,
+        'threads': torch.get_num_threads(),
+        'real_tokens': real,
+        'padded': {'tokens': block_tokens, 'seconds': block_seconds,
+                   'texts_per_second': len(texts) / block_seconds},
+        'bucketed': {'tokens': bucket_tokens, 'seconds': bucket_seconds,
+                     'texts_per_second': len(texts) / bucket_seconds},
+        'token_reduction': 1 - bucket_tokens / block_tokens,
+        'speedup': block_seconds / bucket_seconds,
+        'max_abs_diff': float(np.abs(block_embeddings - bucket_embeddings).max()),
+    }
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -20,8 +20,149 @@ FEATURE_NAMES = ['Kamar Tidur', 'Kamar Mandi', 'Luas Tanah', 'Luas Bangunan',
  'Tahun Dibangun', 'Garasi', 'Latitude', 'Longitude', 'City',
  'District']
 
-# Temp file storage
-TEMP_IMAGE_PATH = "temp_image.jpg"
+# Startup: LAZY_LOAD defers model loading to the first request or an explicit
+# warmup, OFFLINE_MODE only uses locally cached model files
+LAZY_LOAD = os.environ.get('LAZY_LOAD', 'False') == 'True'
+OFFLINE_MODE = os.environ.get('OFFLINE_MODE', 'False') == 'True'
+NLTK_RESOURCES = {
+    'stopwords': 'corpora/stopwords'
+}
+
+# Directory of memory-mapped weights written by tools/export_shared_weights.py.
+# When set, worker processes map the weights read-only instead of each
+# loading a private copy. Shared fusion weights are served unfused, since
+# FUSED_FUSION_MODEL would copy them into every worker.
+SHARED_WEIGHTS_DIR = os.environ.get('SHARED_WEIGHTS_DIR')
+FUSION_WEIGHTS_NAME = 'fusion_model'
+
+# Dynamic int8 quantization of the encoders (and optionally the fusion model).
+# Quantized models are read from QUANTIZED_MODEL_DIR, see tools/quantize.py.
+QUANTIZED_INFERENCE = os.environ.get('QUANTIZED_INFERENCE', 'False') == 'True'
+QUANTIZE_FUSION_MODEL = os.environ.get('QUANTIZE_FUSION_MODEL', 'False') == 'True'
+QUANTIZED_MODEL_DIR = os.environ.get('QUANTIZED_MODEL_DIR', 'model/quantized')
+
+# Serve the float fusion model through utils/fused_model.py, which folds the
+# length-one attentions and batches the branches (same outputs, fewer kernels).
+# The folded weights are private to each worker, so this is skipped when the
+# fusion weights are mapped from SHARED_WEIGHTS_DIR.
+FUSED_FUSION_MODEL = os.environ.get('FUSED_FUSION_MODEL', 'True') == 'True'
+
+# Inference engine for the fusion model and the encoders: eager, compile
+# (torch.compile), torchscript or onnx (ONNX Runtime on CPU). torchscript and
+# onnx serve the graphs tools/export_models.py writes to EXPORTED_MODEL_DIR.
+# int8 models always run eagerly.
+FUSION_BACKEND = os.environ.get('FUSION_BACKEND', 'eager')
+ENCODER_BACKEND = os.environ.get('ENCODER_BACKEND', 'eager')
+EXPORTED_MODEL_DIR = os.environ.get('EXPORTED_MODEL_DIR', 'model/exported')
+
+# Image decoding: worker threads, batches decoded ahead of the encoder, and
+# the multiple of the model input size large images are shrunk to right after
+# decoding (0 keeps full resolution)
+IMAGE_DECODE_WORKERS = int(os.environ.get('IMAGE_DECODE_WORKERS', min(4, os.cpu_count() or 1)))
+IMAGE_PREFETCH_BATCHES = int(os.environ.get('IMAGE_PREFETCH_BATCHES', 1))
+IMAGE_DOWNSCALE_FACTOR = float(os.environ.get('IMAGE_DOWNSCALE_FACTOR', 2.0))
+
+# Multi-photo listings: photos past MAX_LISTING_PHOTOS are ignored, photos
+# whose difference hash is within PHOTO_DEDUP_DISTANCE bits of an earlier one
+# are dropped before DINOv2 (-1 keeps them all), and the CLS embeddings left
+# are pooled into one vector with IMAGE_POOLING: mean, max or attention
+MAX_LISTING_PHOTOS = int(os.environ.get('MAX_LISTING_PHOTOS', 10))
+PHOTO_DEDUP_DISTANCE = int(os.environ.get('PHOTO_DEDUP_DISTANCE', 4))
+IMAGE_POOLING = os.environ.get('IMAGE_POOLING', 'mean')
+
+# Listing files used for offline scoring and evaluation. The image column
+# holds one path, several joined by PHOTO_PATH_SEPARATOR, or (Parquet) a list.
+IMAGE_COLUMN = 'image_path'
+PHOTO_PATH_SEPARATOR = '|'
+TEXT_COLUMN = 'title'
+LISTING_ID_COLUMN = 'listing_id'
+
+# Batch inference settings
+BATCH_SIZE = int(os.environ.get('BATCH_SIZE', 32))
+MAX_BATCH_MEMORY_MB = int(os.environ.get('MAX_BATCH_MEMORY_MB', 2048))
+# Rough peak activation memory of one image + one text through the encoders
+ENCODER_MEMORY_PER_ITEM_MB = 64
+# Tabular variants per fusion forward in a what-if sweep (small chunks stay in cache)
+SWEEP_BATCH_SIZE = int(os.environ.get('SWEEP_BATCH_SIZE', 512))
+# Largest grid a /sweep request may ask for
+MAX_SWEEP_VARIANTS = int(os.environ.get('MAX_SWEEP_VARIANTS', 100000))
+
+# Embedding cache (size 0 disables the in-memory tier, no dir disables the disk tier)
+EMBEDDING_CACHE_SIZE = int(os.environ.get('EMBEDDING_CACHE_SIZE', 4096))
+EMBEDDING_CACHE_DIR = os.environ.get('EMBEDDING_CACHE_DIR')
+EMBEDDING_CACHE_DISK_CAPACITY = int(os.environ.get('EMBEDDING_CACHE_DISK_CAPACITY', 100000))
+
+# Model registry (tools/model_registry.py): versioned fusion checkpoints and
+# scalers under MODEL_REGISTRY_DIR. Servers start on MODEL_VERSION, else the
+# registry's active version, else MODEL_PATH/SCALER_PATH, and with a poll
+# interval switch to a newly activated version without restarting (0 only
+# switches through POST /models/<version>/activate). A server pinned with
+# MODEL_VERSION does not poll and stays on it until explicitly activated
+MODEL_REGISTRY_DIR = os.environ.get('MODEL_REGISTRY_DIR')
+MODEL_VERSION = os.environ.get('MODEL_VERSION')
+MODEL_REGISTRY_POLL_SECONDS = float(os.environ.get('MODEL_REGISTRY_POLL_SECONDS', 10))
+
+# Admin endpoints (POST /models/<version>/activate and /warmup) change server
+# state, so they need an "Authorization: Bearer <ADMIN_TOKEN>" header and are
+# disabled while ADMIN_TOKEN is unset
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+
+# Listing embedding store: image and text embeddings of known listings by ID,
+# so repeat predictions only run the tabular branch and the fusion head
+# (no dir disables predict-by-ID)
+LISTING_STORE_DIR = os.environ.get('LISTING_STORE_DIR')
+
+# Whole-prediction cache in front of /predict, keyed by the tabular features,
+# photo bytes and title; identical concurrent requests share one computation
+# (size 0 disables storing results, in-flight requests are still shared)
+PREDICTION_CACHE_SIZE = int(os.environ.get('PREDICTION_CACHE_SIZE', 10000))
+PREDICTION_CACHE_TTL_SECONDS = float(os.environ.get('PREDICTION_CACHE_TTL_SECONDS', 300))
+
+# Text preprocessing: bounded word -> stem memo, optionally saved to
+# STEM_CACHE_PATH on exit and loaded again at startup
+STEM_CACHE_SIZE = int(os.environ.get('STEM_CACHE_SIZE', 100000))
+STEM_CACHE_PATH = os.environ.get('STEM_CACHE_PATH')
+
+# Padded tokens (batch size x longest text) per E5 forward pass; texts are
+# grouped by length under this budget. 0 pads each batch as one block.
+TEXT_TOKEN_BUDGET = int(os.environ.get('TEXT_TOKEN_BUDGET', 8192))
+
+# Micro-batching scheduler for /predict
+SCHEDULER_ENABLED = os.environ.get('SCHEDULER_ENABLED', 'True') == 'True'
+SCHEDULER_MAX_BATCH_SIZE = int(os.environ.get('SCHEDULER_MAX_BATCH_SIZE', 16))
+SCHEDULER_MAX_WAIT_MS = float(os.environ.get('SCHEDULER_MAX_WAIT_MS', 10))
+
+# ASGI serving (asgi.py): inference threads when the scheduler is off,
+# requests queued or running before new ones get 429, and how long shutdown
+# waits for admitted requests to finish
+INFERENCE_WORKERS = int(os.environ.get('INFERENCE_WORKERS', 2))
+MAX_PENDING_REQUESTS = int(os.environ.get('MAX_PENDING_REQUESTS', 64))
+SHUTDOWN_DRAIN_SECONDS = float(os.environ.get('SHUTDOWN_DRAIN_SECONDS', 30))
+
+# CPU concurrency. Server processes x request threads x torch intra-op threads
+# should not exceed the cores, or p99 latency collapses under load; see
+# tools/tune_concurrency.py for the best layout on a host. 0 keeps the
+# library default. TOKENIZERS_PARALLELISM is exported for the HF tokenizers.
+TORCH_INTRA_OP_THREADS = int(os.environ.get('TORCH_INTRA_OP_THREADS', 0))
+TORCH_INTEROP_THREADS = int(os.environ.get('TORCH_INTEROP_THREADS', 0))
+TOKENIZERS_PARALLELISM = os.environ.get('TOKENIZERS_PARALLELISM', 'false')
+SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS', 1))
+SERVER_THREADS = int(os.environ.get('SERVER_THREADS', 4))
+# Core sets (e.g. "0-3" and "4-7") the DINOv2 and E5 forwards are pinned to;
+# each encoder then runs on one dedicated thread. Empty disables pinning.
+IMAGE_ENCODER_CORES = os.environ.get('IMAGE_ENCODER_CORES', '')
+TEXT_ENCODER_CORES = os.environ.get('TEXT_ENCODER_CORES', '')
+# The image, text and tabular branches of a prediction run side by side, each
+# on its own pool of this many threads (0 runs the branch in the request
+# thread, all 0 runs them one after another). Torch intra-op threads are
+# shared by the process, so give concurrent encoders disjoint core sets above
+# or an intra-op count that leaves room for both.
+IMAGE_BRANCH_THREADS = int(os.environ.get('IMAGE_BRANCH_THREADS', 2))
+TEXT_BRANCH_THREADS = int(os.environ.get('TEXT_BRANCH_THREADS', 2))
+TABULAR_BRANCH_THREADS = int(os.environ.get('TABULAR_BRANCH_THREADS', 0))
+
+# Uploads are decoded in memory; this caps the request body size
+MAX_UPLOAD_MB = int(os.environ.get('MAX_UPLOAD_MB', 16))
 
 # Flask settings
 DEBUG = os.environ.get('DEBUG', 'False') == 'True'
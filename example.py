@@ -1,4 +1,5 @@
 from inference.predictions import MultimodalPredictor
+from utils.timing import startup_timer
 import numpy as np
 
 def main():
@@ -37,6 +38,10 @@ def main():
 
     print(f"Predicted property price: Rp {price_prediction[0]:,.2f}")
 
+    # Where the startup time went
+    for phase, seconds in startup_timer.summary()['phases'].items():
+        print(f"{phase}: {seconds:.2f}s")
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
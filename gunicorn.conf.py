@@ -0,0 +1,22 @@
+"""Gunicorn settings for app.py, taken from the concurrency section of config.py.
+
+Run with:
+    gunicorn app:app
+
+Each of the SERVER_WORKERS processes loads its own app (with
+SHARED_WEIGHTS_DIR the weights are mapped, not copied) and serves
+SERVER_THREADS requests at a time. tools/tune_concurrency.py reports a good
+worker/thread/intra-op layout for the host.
+"""
+import config
+
+bind = f"{config.HOST}:{config.PORT}"
+workers = config.SERVER_WORKERS
+threads = config.SERVER_THREADS
+worker_class = 'gthread'
+# The app is built after fork, so every worker sizes its own torch thread
+# pools and pins its own encoder threads
+preload_app = False
+# Model loading can take a while without LAZY_LOAD
+timeout = 120
+graceful_timeout = int(config.SHUTDOWN_DRAIN_SECONDS) + 5
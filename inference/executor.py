@@ -0,0 +1,94 @@
+import contextvars
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from config import INFERENCE_WORKERS, MAX_PENDING_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+class QueueFullError(RuntimeError):
+    """More requests are admitted than the executor accepts; the client should retry later"""
+
+class ShuttingDownError(RuntimeError):
+    """The executor is draining and no longer accepts requests"""
+
+class BoundedInferenceExecutor:
+    """Runs predictions off the caller's thread with a cap on admitted work.
+
+    Requests go to the micro-batching scheduler when one is given, otherwise
+    to a pool of ``workers`` threads calling ``predictor.predict``. At most
+    ``max_pending`` requests may be queued or running at once; beyond that
+    ``submit`` raises QueueFullError instead of queueing without bound.
+    ``drain`` stops admitting requests and waits for the admitted ones.
+    """
+    def __init__(self, predictor, scheduler=None, workers=INFERENCE_WORKERS, max_pending=MAX_PENDING_REQUESTS):
+        self.predictor = predictor
+        self.scheduler = scheduler
+        self.max_pending = max_pending
+        self._pool = None
+        if scheduler is None:
+            self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='inference')
+
+        self._condition = threading.Condition()
+        self._pending = 0
+        self._accepted = 0
+        self._rejected = 0
+        self._closing = False
+
+    def submit(self, tabular_data, image, text_data):
+        """Admit a request and return a concurrent Future resolving to its prediction"""
+        with self._condition:
+            if self._closing:
+                raise ShuttingDownError('Server is shutting down')
+            if self._pending >= self.max_pending:
+                self._rejected += 1
+                raise QueueFullError(f'{self._pending} requests already pending')
+            self._pending += 1
+            self._accepted += 1
+
+        try:
+            if self.scheduler is not None:
+                future = self.scheduler.submit(tabular_data, image, text_data)
+            else:
+                # Run in the caller's context so stage timings reach its request
+                future = self._pool.submit(contextvars.copy_context().run, self.predictor.predict,
+                                           tabular_data, image, text_data)
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(lambda _: self._release())
+        return future
+
+    def drain(self, timeout=None):
+        """Stop admitting requests and wait for the pending ones; False on timeout"""
+        with self._condition:
+            self._closing = True
+            drained = self._condition.wait_for(lambda: self._pending == 0, timeout)
+        if not drained:
+            logger.warning(f"Shutdown drain timed out with {self._pending} requests still pending")
+        return drained
+
+    def shutdown(self, timeout=None):
+        """Drain, then stop the worker threads"""
+        drained = self.drain(timeout)
+        if self.scheduler is not None:
+            self.scheduler.close(timeout=0 if not drained else None)
+        if self._pool is not None:
+            self._pool.shutdown(wait=drained, cancel_futures=not drained)
+        return drained
+
+    def stats(self):
+        with self._condition:
+            return {
+                'pending': self._pending,
+                'max_pending': self.max_pending,
+                'accepted': self._accepted,
+                'rejected': self._rejected,
+                'closing': self._closing,
+            }
+
+    def _release(self):
+        with self._condition:
+            self._pending -= 1
+            self._condition.notify_all()
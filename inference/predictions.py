@@ -2,49 +2,480 @@ from processor.tabular_processor import TabularProcessor
 from processor.image_processor import ImageProcessor
 from processor.text_processor import TextProcessor
 
-from utils.model_loader import EnhancedFusionModel
-from utils.dataset import InferenceDataset
+from utils.model_loader import load_fusion_model
+from utils.embedding_cache import EmbeddingCache
+from utils.concurrency import BranchExecutor, parse_cores
+from utils.listing_store import ListingEmbeddingStore
+from utils.model_registry import ModelRegistry
+from inference.sweep import SweepContext, expand_grid
+from utils.metrics import stage_timer
+from utils.timing import startup_timer
 
 import torch
-from torch.utils.data import DataLoader
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+from PIL import Image
 
 from config import IMAGE_MODEL_NAME, TEXT_MODEL_NAME, TABULAR_DIM, IMAGE_DIM, TEXT_DIM, DEVICE, MODEL_PATH, SCALER_PATH
+from config import FEATURE_NAMES, LAZY_LOAD, QUANTIZED_INFERENCE, QUANTIZE_FUSION_MODEL, FUSED_FUSION_MODEL
+from config import FUSION_BACKEND, ENCODER_BACKEND, IMAGE_ENCODER_CORES, TEXT_ENCODER_CORES
+from config import BATCH_SIZE, MAX_BATCH_MEMORY_MB, ENCODER_MEMORY_PER_ITEM_MB, SWEEP_BATCH_SIZE
+from config import EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_DISK_CAPACITY
+from config import LISTING_STORE_DIR, IMAGE_BRANCH_THREADS, TEXT_BRANCH_THREADS, TABULAR_BRANCH_THREADS
+from config import MODEL_REGISTRY_DIR, MODEL_VERSION
+
+logger = logging.getLogger(__name__)
+
+class ServingModel:
+    """Scaler and fusion model of one checkpoint version, swapped as a unit"""
+    __slots__ = ('version', 'tabular_processor', 'model')
+
+    def __init__(self, version, tabular_processor, model):
+        self.version = version
+        self.tabular_processor = tabular_processor
+        self.model = model
 
 class MultimodalPredictor:
-    def __init__(self, model_path=MODEL_PATH):
-        self.tabular_processor = TabularProcessor()
-        self.image_processor = ImageProcessor(model_name=IMAGE_MODEL_NAME)
-        self.text_processor = TextProcessor(model_name=TEXT_MODEL_NAME)
+    def __init__(self, model_path=MODEL_PATH, lazy=LAZY_LOAD, quantized=QUANTIZED_INFERENCE,
+                 quantize_fusion=QUANTIZE_FUSION_MODEL, embedding_cache=True, fused=FUSED_FUSION_MODEL,
+                 backend=FUSION_BACKEND, encoder_backend=ENCODER_BACKEND, listing_store_dir=LISTING_STORE_DIR,
+                 model_registry_dir=MODEL_REGISTRY_DIR, model_version=MODEL_VERSION):
+        self.model_path = model_path
+        self.quantize_fusion = quantize_fusion
+        self.fused = fused
+        self.backend = backend
+        self.image_cache = _embedding_cache(IMAGE_DIM, 'image') if embedding_cache else None
+        self.text_cache = _embedding_cache(TEXT_DIM, 'text') if embedding_cache else None
+        self.listing_store = ListingEmbeddingStore(listing_store_dir, IMAGE_DIM, TEXT_DIM) if listing_store_dir else None
+        self.registry = ModelRegistry(model_registry_dir) if model_registry_dir else None
+        self.startup_version = model_version or (self.registry.active() if self.registry is not None else None)
 
-        self.model = EnhancedFusionModel(
-            tab_dim=TABULAR_DIM,
-            img_dim=IMAGE_DIM,
-            text_dim=TEXT_DIM
-        )
+        # Processors are created unloaded; load() pulls in the weights.
+        # Requests read the scaler and fusion model through one reference, so
+        # a model swap is a single assignment and in-flight requests finish on
+        # the version they started with.
+        self._serving = ServingModel(None, None, None)
+        self.image_processor = ImageProcessor(model_name=IMAGE_MODEL_NAME, cache=self.image_cache,
+                                              lazy=True, quantized=quantized, backend=encoder_backend,
+                                              cores=parse_cores(IMAGE_ENCODER_CORES))
+        self.text_processor = TextProcessor(model_name=TEXT_MODEL_NAME, cache=self.text_cache,
+                                            lazy=True, quantized=quantized, backend=encoder_backend,
+                                            cores=parse_cores(TEXT_ENCODER_CORES))
+        # Image, text and tabular work of a request overlap on these pools
+        self.branches = BranchExecutor({'image': IMAGE_BRANCH_THREADS, 'text': TEXT_BRANCH_THREADS,
+                                        'tabular': TABULAR_BRANCH_THREADS})
+
+        self._loaded = False
+        self._load_lock = threading.Lock()
+        self._swap_lock = threading.Lock()
+        self._swap_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='model-swap')
+        self._swap_listeners = []
+        self.pending_version = None
+        if not lazy:
+            self.load()
+
+    @property
+    def model(self):
+        return self._serving.model
+
+    @model.setter
+    def model(self, model):
+        serving = self._serving
+        self._serving = ServingModel(serving.version, serving.tabular_processor, model)
+
+    @property
+    def tabular_processor(self):
+        return self._serving.tabular_processor
+
+    @tabular_processor.setter
+    def tabular_processor(self, tabular_processor):
+        serving = self._serving
+        self._serving = ServingModel(serving.version, tabular_processor, serving.model)
+
+    @property
+    def model_version(self):
+        """Registry version being served, or None for the MODEL_PATH checkpoint"""
+        return self._serving.version
+
+    def load(self):
+        """Load the scaler, both encoders and the fusion model once.
+
+        Each step is timed in ``utils.timing.startup_timer``. Called
+        automatically by the predict methods when the predictor is lazy.
+        """
+        if self._loaded:
+            return
+        with self._load_lock:
+            if self._loaded:
+                return
+            model_path, scaler_path = self._version_paths(self.startup_version)
+            with startup_timer.phase('tabular_processor'):
+                tabular_processor = TabularProcessor(scaler_path)
+            with startup_timer.phase('image_encoder'):
+                self.image_processor.load()
+            with startup_timer.phase('text_encoder'):
+                self.text_processor.load()
+            with startup_timer.phase('fusion_model'):
+                model = self._load_fusion_model(model_path)
+            self._serving = ServingModel(self.startup_version, tabular_processor, model)
+            self._loaded = True
+
+    def warmup(self):
+        """Load everything and run one dummy input through every stage"""
+        self.load()
+        with startup_timer.phase('warmup'):
+            image = self.image_processor._embed([Image.new('RGB', (224, 224))])
+            text = self.text_processor._embed([self.text_processor.preprocess_text('rumah dijual')])
+            self._warm_head(self._serving, image, text)
+        return startup_timer.summary()
+
+    def load_version(self, version):
+        """Load and warm a registry version's scaler and fusion model without serving it.
+
+        The encoders are shared by every version, so only the scaler and the
+        fusion head are loaded.
+        """
+        self._require_registry()
+        self.load()
+        model_path, scaler_path = self._version_paths(version)
+        serving = ServingModel(version, TabularProcessor(scaler_path), self._load_fusion_model(model_path))
+        self._warm_head(serving, np.zeros((1, IMAGE_DIM), dtype=np.float32),
+                        np.zeros((1, TEXT_DIM), dtype=np.float32))
+        return serving
+
+    def swap_model(self, version):
+        """Load and warm ``version``, then switch new requests to it in one step.
+
+        Requests already running finish on the version they started with.
+        Returns the new and previous versions and the load time in seconds.
+        Listeners registered with on_model_swap are called afterwards.
+        """
+        with self._swap_lock:
+            start = time.perf_counter()
+            serving = self.load_version(version)
+            previous = self._serving.version
+            self._serving = serving
+            seconds = time.perf_counter() - start
+        logger.info(f"Switched fusion model from {previous or 'MODEL_PATH'} to {version} "
+                    f"(loaded and warmed in {seconds:.2f} s)")
+        for listener in list(self._swap_listeners):
+            listener(previous, version)
+        return {'version': version, 'previous': previous, 'load_seconds': seconds}
+
+    def swap_model_async(self, version, activate=False):
+        """swap_model on a background thread; returns its Future.
+
+        With ``activate`` the registry's ACTIVE file is pointed at the
+        version once it is serving, so a version that fails to load is never
+        made active for the other workers.
+        """
+        self._version_paths(version)
+        self.pending_version = version
+
+        def swap():
+            try:
+                result = self.swap_model(version)
+                if activate:
+                    self.registry.set_active(version)
+                return result
+            finally:
+                if self.pending_version == version:
+                    self.pending_version = None
+        return self._swap_pool.submit(swap)
+
+    def on_model_swap(self, listener):
+        """Call listener(previous_version, new_version) after every swap"""
+        self._swap_listeners.append(listener)
+
+    def watch_registry(self, interval):
+        """Follow the registry's ACTIVE version from a daemon thread, polling every ``interval`` seconds"""
+        registry = self._require_registry()
+
+        def watch():
+            failed = None
+            while True:
+                time.sleep(interval)
+                active = registry.active()
+                if not self._loaded or active in (None, failed, self.model_version, self.pending_version):
+                    continue
+                try:
+                    self.swap_model_async(active).result()
+                except Exception as e:
+                    # Retried only once ACTIVE names another version
+                    failed = active
+                    logger.error(f"Could not switch to model version {active}: {str(e)}")
+        thread = threading.Thread(target=watch, name='model-registry-watch', daemon=True)
+        thread.start()
+        return thread
+
+    def model_info(self):
+        """Served, pending and registered model versions"""
+        registry = self.registry
+        return {
+            'version': self.model_version,
+            'pending': self.pending_version,
+            'registry': registry.root if registry is not None else None,
+            'active': registry.active() if registry is not None else None,
+            'versions': registry.versions() if registry is not None else [],
+        }
+
+    def predict(self, tabular_data, image_path, text_data):
+        """Predict the price of one property.
+
+        ``image_path`` may be a file path, encoded image bytes, a binary
+        file-like object or a PIL image, or a list of these for a listing
+        with several photos. The three inputs are processed concurrently
+        on ``self.branches``.
+        """
+        self.load()
+        serving = self._serving
+        processed = self.branches.run(
+            tabular=lambda: serving.tabular_processor.process_array(tabular_data),
+            image=lambda: self.image_processor.process_array([image_path]),
+            text=lambda: self.text_processor.process_array(text_data))
 
-        self.model.load_state_dict(torch.load(model_path, map_location=DEVICE))
-        self.model.to(DEVICE)
-        self.model.eval()
+        predictions = self._run_model(serving.model, processed['tabular'], processed['image'], processed['text'])
+        return [pred * 1000000 for pred in predictions]
 
-    def predict(self, tabular_data, image_path, text_data, batch_size=1):
-        tabular_processed = self.tabular_processor.process(tabular_data)
-        image_processed = self.image_processor.process(image_path)
-        text_processed = self.text_processor.process(text_data)
+    def predict_batch(self, records, batch_size=BATCH_SIZE, max_batch_memory_mb=MAX_BATCH_MEMORY_MB):
+        """Predict prices for many (tabular_data, image, text_data) records.
 
-        dataset = InferenceDataset(tabular_data=tabular_processed, image_features=image_processed, text_features=text_processed)
-        dataloader = DataLoader(dataset, batch_size=batch_size, shuffle=False)
+        Records are scored in chunks. Each chunk runs the tabular processor on
+        one DataFrame, one DINOv2 forward, one E5 forward and a single fusion
+        model call. The chunk size is ``batch_size`` capped so the estimated
+        encoder activations fit in ``max_batch_memory_mb``. As in predict, the
+        image of a record may be a list of photos; each photo counts towards
+        the chunk size.
+        """
+        self.load()
+        # The whole batch is scored by one model version
+        serving = self._serving
+        records = list(records)
+        chunk_size = self._chunk_size(batch_size, max_batch_memory_mb)
+
+        chunks = self._photo_chunks(records, chunk_size)
+        # Images of the next chunk are decoded while the current one is scored
+        image_stream = self.image_processor.process_array_stream([image for _, image, _ in chunk] for chunk in chunks)
 
         predictions = []
+        for chunk in chunks:
+            tabular_data, _, texts = zip(*chunk)
+            # The three branches of a chunk run concurrently
+            processed = self.branches.run(
+                tabular=lambda: serving.tabular_processor.process_array(pd.DataFrame(list(tabular_data))),
+                image=lambda: next(image_stream),
+                text=lambda: self.text_processor.process_array(list(texts)))
+
+            predictions.extend(self._run_model(serving.model, processed['tabular'], processed['image'],
+                                               processed['text']))
+
+        return [pred * 1000000 for pred in predictions]
+
+    def predict_by_id(self, listing_id, tabular_data):
+        """Predict the price of a stored listing from fresh tabular data"""
+        return self.predict_by_ids([listing_id], [tabular_data])
+
+    def predict_by_ids(self, listing_ids, tabular_data):
+        """Predict prices of stored listings without running either encoder.
+
+        The DINOv2 and E5 embeddings come from the listing store, so only the
+        tabular processor and the fusion model run. ``tabular_data`` is a
+        list of feature dicts (or a DataFrame) aligned with ``listing_ids``.
+        Raises KeyError when an ID has not been stored.
+        """
+        store = self._require_listing_store()
+        self.load()
+        if isinstance(tabular_data, pd.DataFrame):
+            tabular_data = tabular_data.to_dict(orient='records')
+        if len(tabular_data) != len(listing_ids):
+            raise ValueError(f"Got {len(listing_ids)} listing IDs but {len(tabular_data)} tabular rows")
+
+        serving = self._serving
+        image_embeddings, text_embeddings = store.get_many(listing_ids)
+        tabular_processed = serving.tabular_processor.process_array(pd.DataFrame(list(tabular_data)))
+        predictions = self._run_model(serving.model, tabular_processed, image_embeddings, text_embeddings)
+        return [pred * 1000000 for pred in predictions]
+
+    def store_listings(self, listing_ids, images, texts, batch_size=BATCH_SIZE,
+                       max_batch_memory_mb=MAX_BATCH_MEMORY_MB):
+        """Embed listings and save them in the listing store; returns how many were new.
+
+        Known IDs are overwritten, which is how a listing whose photo or
+        title changed is refreshed.
+        """
+        store = self._require_listing_store()
+        self.load()
+        listing_ids, images, texts = list(listing_ids), list(images), list(texts)
+        chunk_size = self._chunk_size(batch_size, max_batch_memory_mb)
+
+        chunks = [range(start, min(start + chunk_size, len(listing_ids)))
+                  for start in range(0, len(listing_ids), chunk_size)]
+        image_stream = self.image_processor.process_array_stream([images[i] for i in chunk] for chunk in chunks)
+
+        added = 0
+        for chunk, image_processed in zip(chunks, image_stream):
+            text_processed = self.text_processor.process_array([texts[i] for i in chunk])
+            added += store.upsert([listing_ids[i] for i in chunk], image_processed, text_processed)
+        store.flush()
+        return added
+
+    def sweep_context(self, image=None, text_data=None, listing_id=None):
+        """Encode a listing's photo and title once for predict_sweep.
+
+        Takes either an image and a title, run through DINOv2 and E5, or the
+        ID of a listing in the listing store. The fusion model's image and
+        text branches run here too, so a sweep only runs the tabular branch
+        and the fusion head. Keep the context to run several sweeps; they
+        stay on the model version the context was built with.
+        """
+        self.load()
+        serving = self._serving
+        if listing_id is not None:
+            image_embedding, text_embedding = self._require_listing_store().get_many([listing_id])
+        elif image is not None and text_data:
+            processed = self.branches.run(image=lambda: self.image_processor.process_array([image]),
+                                          text=lambda: self.text_processor.process_array(text_data))
+            image_embedding, text_embedding = processed['image'], processed['text']
+        else:
+            raise ValueError("A sweep needs a listing ID or an image and a title")
+
+        img = _as_tensor(image_embedding)
+        text = _as_tensor(text_embedding)
+        if not hasattr(serving.model, 'forward_tabular'):
+            return SweepContext(img, text, branch_outputs=False, serving=serving)
         with torch.no_grad():
-            for batch in dataloader:
-                tab_batch, img_batch, text_batch = [b.to(DEVICE) for b in batch]
-                outputs = self.model(tab_batch, img_batch, text_batch)
+            img_feat, text_feat = serving.model.encode_context(img, text)
+        return SweepContext(img_feat, text_feat, branch_outputs=True, serving=serving)
+
+    def predict_sweep(self, context, variants, batch_size=SWEEP_BATCH_SIZE):
+        """Prices of tabular variants of the listing behind ``context``.
+
+        ``variants`` is a DataFrame or list of feature dicts, e.g. from
+        ``inference.sweep.expand_grid``. All variants are preprocessed
+        together and scored ``batch_size`` at a time.
+        """
+        self.load()
+        serving = context.serving or self._serving
+        model = serving.model
+        if not isinstance(variants, pd.DataFrame):
+            variants = pd.DataFrame(list(variants))
+        tabular = torch.from_numpy(serving.tabular_processor.process_array(variants)).to(DEVICE)
+        predictions = []
+        with torch.no_grad():
+            for start in range(0, len(tabular), batch_size):
+                tab = tabular[start:start + batch_size]
+                with stage_timer('sweep', len(tab)):
+                    if context.branch_outputs:
+                        outputs = model.forward_tabular(tab, context.image_features, context.text_features)
+                    else:
+                        outputs = model(tab, context.image_features.repeat(len(tab), 1),
+                                        context.text_features.repeat(len(tab), 1))
                 predictions.extend(outputs.cpu().numpy().flatten().tolist())
+        return [pred * 1000000 for pred in predictions]
+
+    def what_if(self, base_tabular, grid, image=None, text_data=None, listing_id=None, context=None):
+        """Price surface over a grid of feature values; returns the variants with a predicted_price column"""
+        variants = expand_grid(base_tabular, grid)
+        if context is None:
+            context = self.sweep_context(image, text_data, listing_id)
+        variants['predicted_price'] = self.predict_sweep(context, variants)
+        return variants
+
+    def cache_stats(self):
+        """Hit and miss counters of the embedding caches and the stem memo"""
+        preprocessor = self.text_processor.preprocessor
+        return {
+            'image': self.image_cache.stats() if self.image_cache is not None else None,
+            'text': self.text_cache.stats() if self.text_cache is not None else None,
+            'stems': preprocessor.stats() if preprocessor is not None else None,
+        }
+
+    def _chunk_size(self, batch_size, max_batch_memory_mb):
+        """Largest chunk that respects both the batch size and memory limits"""
+        memory_cap = max_batch_memory_mb // ENCODER_MEMORY_PER_ITEM_MB
+        return max(1, min(batch_size, memory_cap))
+
+    def _photo_chunks(self, records, chunk_size):
+        """Consecutive records with at most chunk_size photos per chunk (at least one record)"""
+        chunks, chunk, photos = [], [], 0
+        for record in records:
+            image = record[1]
+            count = min(len(image), self.image_processor.max_photos) if isinstance(image, (list, tuple)) else 1
+            if chunk and photos + count > chunk_size:
+                chunks.append(chunk)
+                chunk, photos = [], 0
+            chunk.append(record)
+            photos += count
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    def _version_paths(self, version):
+        """(checkpoint, scaler) of a registry version, or of MODEL_PATH and SCALER_PATH for None"""
+        if version is None:
+            return self.model_path, SCALER_PATH
+        return self._require_registry().paths(version)
+
+    def _load_fusion_model(self, model_path):
+        """Fusion model in the configured serving layout, from the tools' artifacts when built from model_path"""
+        model = load_fusion_model(
+            model_path,
+            tab_dim=TABULAR_DIM,
+            img_dim=IMAGE_DIM,
+            text_dim=TEXT_DIM,
+            quantized=self.quantize_fusion,
+            fused=self.fused,
+            backend=self.backend,
+            prebuilt=True
+        )
+        model.to(DEVICE)
+        model.eval()
+        return model
+
+    def _warm_head(self, serving, image_embedding, text_embedding):
+        """Run one dummy row through a version's scaler and fusion model"""
+        tabular = serving.tabular_processor.process_array(dict.fromkeys(FEATURE_NAMES, np.nan))
+        with torch.no_grad():
+            serving.model(_as_tensor(tabular), _as_tensor(image_embedding), _as_tensor(text_embedding))
 
-        predictions = [pred * 1000000 for pred in predictions]
-        return predictions
+    def _require_registry(self):
+        if self.registry is None:
+            raise RuntimeError("No model registry configured; set MODEL_REGISTRY_DIR")
+        return self.registry
 
+    def _require_listing_store(self):
+        if self.listing_store is None:
+            raise RuntimeError("No listing store configured; set LISTING_STORE_DIR")
+        return self.listing_store
 
+    def _run_model(self, model, tabular_processed, image_processed, text_processed):
+        """Run the fusion model once over already processed features (arrays, or DataFrames)"""
+        # float32 contiguous arrays are shared with the tensors, not copied
+        tab_batch = _as_tensor(tabular_processed)
+        img_batch = _as_tensor(image_processed)
+        text_batch = _as_tensor(text_processed)
 
+        with stage_timer('fusion', len(tab_batch)), torch.no_grad():
+            outputs = model(tab_batch, img_batch, text_batch)
+        return outputs.cpu().numpy().flatten().tolist()
 
+def _as_tensor(features):
+    return torch.from_numpy(np.ascontiguousarray(features, dtype=np.float32)).to(DEVICE)
 
+def _embedding_cache(dim, name):
+    """Build an encoder embedding cache from config, or None when disabled"""
+    disk_dir = os.path.join(EMBEDDING_CACHE_DIR, name) if EMBEDDING_CACHE_DIR else None
+    if EMBEDDING_CACHE_SIZE <= 0 and disk_dir is None:
+        return None
+    return EmbeddingCache(
+        dim,
+        max_entries=EMBEDDING_CACHE_SIZE,
+        disk_dir=disk_dir,
+        disk_capacity=EMBEDDING_CACHE_DISK_CAPACITY
+    )
@@ -0,0 +1,139 @@
+import logging
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+from config import SCHEDULER_MAX_BATCH_SIZE, SCHEDULER_MAX_WAIT_MS
+from utils.metrics import collecting, current_collectors, observe_stage
+
+logger = logging.getLogger(__name__)
+
+# Sentinel placed on the queue to stop the worker thread
+_STOP = object()
+
+class _Request:
+    """A queued record with its future and the timing collectors of its caller"""
+    __slots__ = ('record', 'future', 'collectors', 'submitted')
+
+    def __init__(self, record, future, collectors):
+        self.record = record
+        self.future = future
+        self.collectors = collectors
+        self.submitted = time.monotonic()
+
+class MicroBatchScheduler:
+    """Groups concurrent prediction requests into micro-batches.
+
+    Requests are queued by ``submit`` and a single worker thread waits up to
+    ``max_wait_ms`` after the first request to collect at most
+    ``max_batch_size`` of them. The batch is scored with one
+    ``predictor.predict_batch`` call and each caller receives its own result.
+    Stage timings of a batch are reported to every request in it.
+    """
+    def __init__(self, predictor, max_batch_size=SCHEDULER_MAX_BATCH_SIZE, max_wait_ms=SCHEDULER_MAX_WAIT_MS):
+        self.predictor = predictor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._requests = 0
+        self._batches = 0
+        self._last_batch_size = 0
+        self._batch_sizes = Counter()
+
+        self._worker = threading.Thread(target=self._run, name='micro-batch-scheduler', daemon=True)
+        self._worker.start()
+
+    def submit(self, tabular_data, image, text_data):
+        """Queue a request and return a Future resolving to its prediction"""
+        future = Future()
+        self._queue.put(_Request((tabular_data, image, text_data), future, current_collectors()))
+        return future
+
+    def predict(self, tabular_data, image, text_data, timeout=None):
+        """Blocking equivalent of ``MultimodalPredictor.predict``"""
+        return self.submit(tabular_data, image, text_data).result(timeout)
+
+    def close(self, timeout=None):
+        """Stop the worker once the already queued requests are served"""
+        self._queue.put(_STOP)
+        self._worker.join(timeout)
+
+    def stats(self):
+        """Queue depth and achieved batch size metrics"""
+        with self._stats_lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'requests': self._requests,
+                'batches': self._batches,
+                'last_batch_size': self._last_batch_size,
+                'mean_batch_size': self._requests / self._batches if self._batches else 0.0,
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000.0,
+                'batch_size_histogram': dict(sorted(self._batch_sizes.items())),
+            }
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch, stopping = self._collect()
+            if batch:
+                self._execute(batch)
+
+    def _collect(self):
+        """Block for the first request, then gather more until the deadline"""
+        item = self._queue.get()
+        if item is _STOP:
+            return [], True
+
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _execute(self, batch):
+        records = [request.record for request in batch]
+        futures = [request.future for request in batch]
+        started = time.monotonic()
+        for request in batch:
+            observe_stage('queue_wait', started - request.submitted, len(batch), request.collectors)
+        collectors = [collector for request in batch for collector in request.collectors]
+
+        with self._stats_lock:
+            self._requests += len(batch)
+            self._batches += 1
+            self._last_batch_size = len(batch)
+            self._batch_sizes[len(batch)] += 1
+
+        try:
+            with collecting(collectors):
+                predictions = self.predictor.predict_batch(records, batch_size=len(records))
+        except Exception as e:
+            if len(batch) == 1:
+                futures[0].set_exception(e)
+                return
+            # Retry one by one so a single bad request does not fail the others
+            logger.warning(f"Batch of {len(batch)} requests failed, retrying individually: {str(e)}")
+            for request in batch:
+                try:
+                    with collecting(request.collectors):
+                        request.future.set_result(self.predictor.predict_batch([request.record], batch_size=1))
+                except Exception as record_error:
+                    request.future.set_exception(record_error)
+            return
+
+        for future, prediction in zip(futures, predictions):
+            future.set_result([prediction])
@@ -0,0 +1,48 @@
+import itertools
+
+import pandas as pd
+
+from config import FEATURE_NAMES
+
+class SweepContext:
+    """Image and text side of one listing, computed once for many tabular variants.
+
+    ``image_features``/``text_features`` are the fusion model's branch outputs
+    when it supports ``forward_tabular``; exported graphs only take raw
+    inputs, so for those the encoder embeddings are kept instead. ``serving``
+    is the model version the features belong to.
+    """
+    __slots__ = ('image_features', 'text_features', 'branch_outputs', 'serving')
+
+    def __init__(self, image_features, text_features, branch_outputs, serving=None):
+        self.image_features = image_features
+        self.text_features = text_features
+        self.branch_outputs = branch_outputs
+        self.serving = serving
+
+def expand_grid(base, grid):
+    """One row per combination of the ``grid`` values, other features taken from ``base``.
+
+    ``grid`` maps feature names to the values to try, e.g.
+    ``{'Luas Bangunan': [60, 90, 120], 'Interior': ['Furnished', 'Unfurnished']}``
+    expands to six variants. Raises ValueError for unknown features.
+    """
+    unknown = [feature for feature in list(base) + list(grid) if feature not in FEATURE_NAMES]
+    if unknown:
+        raise ValueError(f"Unknown features: {', '.join(unknown)}")
+    missing = [feature for feature in FEATURE_NAMES if feature not in base and feature not in grid]
+    if missing:
+        raise ValueError(f"Missing base features: {', '.join(missing)}")
+
+    features = list(grid)
+    variants = pd.DataFrame(list(itertools.product(*(list(grid[feature]) for feature in features))),
+                            columns=features)
+    for feature in FEATURE_NAMES:
+        if feature not in grid:
+            variants[feature] = [base[feature]] * len(variants)
+    return variants[FEATURE_NAMES]
+
+def sweep_records(variants):
+    """JSON-ready rows of a what_if result, with prices as predicted_price_millions and NaN as null"""
+    variants = variants.rename(columns={'predicted_price': 'predicted_price_millions'})
+    return variants.astype(object).where(variants.notna(), None).to_dict(orient='records')
@@ -1,31 +1,273 @@
+import contextvars
+import io
+import itertools
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import numpy as np
 import torch
 from PIL import Image
-from transformers import AutoImageProcessor, AutoModel
+from config import OFFLINE_MODE, IMAGE_DECODE_WORKERS, IMAGE_PREFETCH_BATCHES, IMAGE_DOWNSCALE_FACTOR
+from config import MAX_LISTING_PHOTOS, PHOTO_DEDUP_DISTANCE, IMAGE_POOLING
+from utils.concurrency import CorePinnedRunner
+from utils.embedding_cache import EmbeddingCache
+from utils.metrics import stage_timer
+from utils.model_loader import load_encoder
+
+POOLING_METHODS = ('mean', 'max', 'attention')
+# Softmax temperature over cosine similarities in attention pooling
+ATTENTION_POOLING_TEMPERATURE = 0.1
 
 class ImageProcessor:
     """Processes image data and extracts embeddings"""
-    def __init__(self, model_name):
-        self.image_processor = AutoImageProcessor.from_pretrained(model_name)
-        self.model = AutoModel.from_pretrained(model_name)
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.model.to(self.device)
-        self.model.eval()
+    def __init__(self, model_name, cache=None, lazy=False, quantized=False, backend='eager', cores=None,
+                 pooling=IMAGE_POOLING, max_photos=MAX_LISTING_PHOTOS, dedup_distance=PHOTO_DEDUP_DISTANCE):
+        if pooling not in POOLING_METHODS:
+            raise ValueError(f"Unknown image pooling {pooling!r}, expected one of {list(POOLING_METHODS)}")
+        self.model_name = model_name
+        self.pooling = pooling
+        self.max_photos = max_photos
+        self.dedup_distance = dedup_distance
+        self.cache = cache
+        self.quantized = quantized
+        self.backend = backend
+        # int8 embeddings differ slightly, so they get their own cache keys
+        self.cache_name = f"{model_name}:int8" if quantized else model_name
+        # Dynamically quantized kernels and exported graphs only run on CPU
+        on_cpu = quantized or backend in ('torchscript', 'onnx')
+        self.device = torch.device("cuda" if torch.cuda.is_available() and not on_cpu else "cpu")
+        self.image_processor = None
+        self.model = None
+        self._target_edge = None
+        self._pool = ThreadPoolExecutor(max_workers=IMAGE_DECODE_WORKERS, thread_name_prefix='image-decode')
+        # DINOv2 forwards run on a thread pinned to ``cores`` when given
+        self._runner = CorePinnedRunner(cores, 'image-encoder')
+        self._load_lock = threading.Lock()
+        if not lazy:
+            self.load()
+
+    def load(self):
+        """Load the HF image processor and DINOv2 weights once"""
+        if self.model is not None:
+            return
+        with self._load_lock:
+            if self.model is not None:
+                return
+            # Imported here so importing this module stays cheap
+            from transformers import AutoImageProcessor
+            self.image_processor = AutoImageProcessor.from_pretrained(
+                self.model_name, local_files_only=OFFLINE_MODE)
+            size = self.image_processor.size
+            self._target_edge = size.get('shortest_edge') or min(size['height'], size['width'])
+            model = load_encoder(self.model_name, quantized=self.quantized, backend=self.backend)
+            model.to(self.device)
+            model.eval()
+            self.model = model
     
-    def process(self, image_path):
-        """Extract image embeddings"""
-        # Load and process the image
-        image = Image.open(image_path).convert('RGB')
-        inputs = self.image_processor(image, return_tensors="pt")
-        inputs = {k: v.to(self.device) for k, v in inputs.items()}
-        
+    def process(self, images):
+        """Image embeddings as a DataFrame of img_emb_* columns, a view over process_array"""
+        return _frame(self.process_array(images))
+
+    def process_array(self, images):
+        """Extract a contiguous float32 [rows, dim] embedding array for one image or a list of images.
+
+        An image can be a file path, raw encoded bytes, a binary file-like
+        object (e.g. an upload stream) or a PIL image. A list or tuple of
+        images in place of one image is a listing's photos: they are encoded
+        in the same DINOv2 batch and pooled into one embedding row.
+        """
+        if _is_single_image(images):
+            images = [images]
+        return next(self.process_array_stream([images]))
+
+    def process_stream(self, batches, prefetch=IMAGE_PREFETCH_BATCHES):
+        """DataFrame view of process_array_stream"""
+        return map(_frame, self.process_array_stream(batches, prefetch))
+
+    def process_array_stream(self, batches, prefetch=IMAGE_PREFETCH_BATCHES):
+        """Yield an embedding array for each batch of images (or photo lists, see process_array).
+
+        Images are read, decoded and preprocessed on a thread pool, and the
+        next ``prefetch`` batches are prepared while the current batch is in
+        DINOv2, so the encoder does not wait on JPEG decoding.
+        """
+        self.load()
+        batches = iter(batches)
+        pending = deque(self._submit(batch) for batch in itertools.islice(batches, prefetch + 1))
+        while pending:
+            prepared = pending.popleft()
+            for batch in itertools.islice(batches, 1):
+                pending.append(self._submit(batch))
+            yield self._finish(prepared)
+
+    def _submit(self, images):
+        """Queue the photos of each image or listing, one list of futures per row"""
+        groups = []
+        for item in images:
+            photos = [item] if _is_single_image(item) else list(item)[:self.max_photos]
+            if not photos:
+                raise ValueError("A listing needs at least one photo")
+            # Hashes are only needed to compare photos within a listing
+            with_hash = self.dedup_distance >= 0 and len(photos) > 1
+            # Each task runs in a copy of the caller's context so its decode time
+            # is attributed to the requests being served
+            groups.append([self._pool.submit(contextvars.copy_context().run, self._prepare, photo, with_hash)
+                           for photo in photos])
+        return groups
+
+    def _prepare(self, source, with_hash=False):
+        """Cache lookup, or decode and preprocess into pixel values (pool thread).
+
+        Returns (cache key, cached embedding or None, pixel values or None,
+        difference hash or None).
+        """
+        if isinstance(source, Image.Image):
+            content = None
+        elif isinstance(source, (str, os.PathLike)):
+            with open(source, 'rb') as f:
+                content = f.read()
+        elif hasattr(source, 'read'):
+            content = source.read()
+        else:
+            content = bytes(source)
+
+        photo_hash = None
+        if with_hash:
+            # Hashed from a cheap reduced decode, so hits and misses hash alike
+            photo_hash = difference_hash(source if content is None else _draft_decode(content))
+
+        key = None
+        if self.cache is not None:
+            # Key on the encoded bytes so re-uploads of a photo hit the cache
+            if content is None:
+                key = EmbeddingCache.make_key(self.cache_name, _pil_fingerprint(source))
+            else:
+                key = EmbeddingCache.make_key(self.cache_name, content)
+            embedding = self.cache.get(key)
+            if embedding is not None:
+                return key, embedding, None, photo_hash
+
+        with stage_timer('image_decode'):
+            image = self._decode(content) if content is not None else self._shrink(source.convert('RGB'))
+            pixel_values = self.image_processor(image, return_tensors="pt")['pixel_values']
+        return key, None, pixel_values, photo_hash
+
+    def _finish(self, groups):
+        """Run DINOv2 over the prepared cache misses of one batch and pool each listing"""
+        groups = [[future.result() for future in group] for group in groups]
+        if self.dedup_distance >= 0:
+            groups = [drop_near_duplicates(group, self.dedup_distance) for group in groups]
+        prepared = [photo for group in groups for photo in group]
+        embeddings = [embedding for _, embedding, _, _ in prepared]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+
+        if missing:
+            pixel_values = torch.cat([prepared[i][2] for i in missing])
+            computed = self._forward(pixel_values)
+            for i, embedding in zip(missing, computed):
+                embeddings[i] = embedding
+                if self.cache is not None:
+                    self.cache.put(prepared[i][0], embedding)
+
+        if len(embeddings) == len(groups):
+            # One photo per row, nothing to pool
+            if len(missing) == len(embeddings):
+                return np.ascontiguousarray(computed, dtype=np.float32)
+            return np.stack(embeddings).astype(np.float32, copy=False)
+        pooled = np.empty((len(groups), len(embeddings[0])), dtype=np.float32)
+        start = 0
+        for row, group in enumerate(groups):
+            pooled[row] = pool_embeddings(np.stack(embeddings[start:start + len(group)]), self.pooling)
+            start += len(group)
+        return pooled
+
+    def _decode(self, content):
+        """Decode image bytes, shrinking images far larger than the model input"""
+        image = Image.open(io.BytesIO(content))
+        if IMAGE_DOWNSCALE_FACTOR:
+            limit = int(self._target_edge * IMAGE_DOWNSCALE_FACTOR)
+            # Lets the JPEG decoder skip resolution that would be thrown away
+            image.draft('RGB', (limit, limit))
+        return self._shrink(image.convert('RGB'))
+
+    def _shrink(self, image):
+        if not IMAGE_DOWNSCALE_FACTOR:
+            return image
+        limit = int(self._target_edge * IMAGE_DOWNSCALE_FACTOR)
+        if min(image.size) > limit:
+            scale = limit / min(image.size)
+            size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+            image = image.resize(size, Image.BICUBIC, reducing_gap=3.0)
+        return image
+
+    def _embed(self, images):
+        """Run DINOv2 over a list of PIL images as a single batch"""
+        inputs = self.image_processor(images, return_tensors="pt")
+        return self._forward(inputs['pixel_values'])
+
+    def _forward(self, pixel_values):
+        with stage_timer('image_encoder', len(pixel_values)):
+            return self._runner.run(self._encode, pixel_values)
+
+    def _encode(self, pixel_values):
         # Extract embeddings
         with torch.no_grad():
-            outputs = self.model(**inputs)
+            outputs = self.model(pixel_values=pixel_values.to(self.device))
             # DINOv2 uses CLS token embedding
-            embedding = outputs.last_hidden_state[:, 0, :].cpu().numpy()
-        
-        # Create feature names and dataframe
-        columns = [f'img_emb_{i}' for i in range(embedding.shape[1])]
-        return pd.DataFrame(embedding, columns=columns)
\ No newline at end of file
+            return outputs.last_hidden_state[:, 0, :].cpu().numpy()
+
+def pool_embeddings(embeddings, method='mean'):
+    """Pool the [photos, dim] CLS embeddings of one listing into one vector.
+
+    ``attention`` weighs each photo by the softmax of its cosine similarity to
+    the listing's mean embedding, so photos unlike the rest (a floor plan
+    among room shots) count less. It needs no trained weights. A single photo
+    is returned unchanged by every method.
+    """
+    if len(embeddings) == 1:
+        return embeddings[0]
+    if method == 'mean':
+        return embeddings.mean(axis=0)
+    if method == 'max':
+        return embeddings.max(axis=0)
+    if method == 'attention':
+        mean = embeddings.mean(axis=0)
+        norms = np.linalg.norm(embeddings, axis=1) * np.linalg.norm(mean)
+        scores = embeddings @ mean / np.maximum(norms, 1e-12) / ATTENTION_POOLING_TEMPERATURE
+        weights = np.exp(scores - scores.max())
+        return (weights / weights.sum()) @ embeddings
+    raise ValueError(f"Unknown image pooling {method!r}, expected one of {list(POOLING_METHODS)}")
+
+def difference_hash(image):
+    """64-bit dHash: whether each pixel of a 9x8 grayscale thumbnail is brighter than its right neighbour"""
+    pixels = np.asarray(image.convert('L').resize((9, 8), Image.BILINEAR), dtype=np.int16)
+    return int(np.packbits(pixels[:, :-1] > pixels[:, 1:]).view('>u8')[0])
+
+def drop_near_duplicates(photos, max_distance):
+    """Keep the photos (prepared tuples ending in a hash) not within max_distance bits of an earlier one"""
+    kept = []
+    for photo in photos:
+        photo_hash = photo[-1]
+        if photo_hash is None or all((photo_hash ^ other[-1]).bit_count() > max_distance for other in kept):
+            kept.append(photo)
+    return kept
+
+def _draft_decode(content):
+    """Decode at the smallest scale the JPEG decoder offers, enough for a dHash"""
+    image = Image.open(io.BytesIO(content))
+    image.draft('L', (64, 64))
+    return image
+
+def _frame(embeddings):
+    """Compatibility DataFrame with img_emb_* columns over an embedding array"""
+    return pd.DataFrame(embeddings, columns=[f'img_emb_{i}' for i in range(embeddings.shape[1])], copy=False)
+
+def _is_single_image(images):
+    return isinstance(images, (str, os.PathLike, bytes, bytearray, memoryview, Image.Image)) or hasattr(images, 'read')
+
+def _pil_fingerprint(image):
+    """Cache key content for an already decoded PIL image"""
+    header = f"{image.mode}:{image.width}x{image.height}:".encode('ascii')
+    return header + image.tobytes()
\ No newline at end of file
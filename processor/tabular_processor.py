@@ -1,6 +1,8 @@
 import pandas as pd
+import numpy as np
 import pickle
-from config import SCALER_PATH
+from config import SCALER_PATH, FEATURE_NAMES
+from utils.metrics import stage_timer
 
 # Data processing modules
 class TabularProcessor:
@@ -146,8 +148,44 @@ class TabularProcessor:
             }
         }
 
+        self._compile()
+
     def process(self, data):
         """Process tabular data with comprehensive preprocessing"""
+        scaled_data = self.process_array(data, dtype=np.float64)
+        return pd.DataFrame(scaled_data, columns=self.feature_names)
+
+    def process_array(self, data, dtype=np.float32):
+        """Vectorized preprocessing straight to the scaled feature matrix.
+
+        Produces the same values as ``process_reference`` without per-row
+        Python work: every column is imputed and encoded with array
+        operations and the scaler is applied as one affine transform.
+        """
+        data = self._as_frame(data)
+        with stage_timer('tabular', len(data)):
+            features = np.empty((len(data), len(self.feature_names)), dtype=np.float64)
+            for i, (col, encode) in enumerate(self._column_encoders):
+                features[:, i] = encode(data[col])
+
+            features *= self._scale
+            features += self._offset
+            return features.astype(dtype, copy=False)
+
+    def process_reference(self, data):
+        """Original column-by-column preprocessing, kept for parity checks"""
+        data = self._as_frame(data)
+        
+        # Apply preprocessing steps
+        self._handle_missing_values(data)
+        self._apply_manual_encoding(data)
+        self._handle_special_cases(data)
+        
+        # Apply the scaler
+        scaled_data = self.scaler.transform(data)
+        return pd.DataFrame(scaled_data, columns=data.columns)
+
+    def _as_frame(self, data):
         # Convert to DataFrame if needed
         if not isinstance(data, pd.DataFrame):
             data = pd.DataFrame([data])
@@ -164,15 +202,49 @@ class TabularProcessor:
         for col in expected_cols:
             if col not in data.columns:
                 raise ValueError(f"Missing required column: {col}")
-        
-        # Apply preprocessing steps
-        self._handle_missing_values(data)
-        self._apply_manual_encoding(data)
-        self._handle_special_cases(data)
-        
-        # Apply the scaler
-        scaled_data = self.scaler.transform(data)
-        return pd.DataFrame(scaled_data, columns=data.columns)
+        return data
+
+    def _compile(self):
+        """Precompute per-column encoders and fold the scaler into an affine map"""
+        self.feature_names = list(getattr(self.scaler, 'feature_names_in_', FEATURE_NAMES))
+
+        mean = self.scaler.mean_ if self.scaler.with_mean else 0.0
+        scale = self.scaler.scale_ if self.scaler.with_std else 1.0
+        self._scale = np.ones(len(self.feature_names)) / scale
+        self._offset = -mean * self._scale
+
+        imputation = {**self.imputation_values['numerical'], **self.imputation_values['categorical']}
+        self._column_encoders = []
+        for col in self.feature_names:
+            if col == 'Orientasi Bangunan':
+                # _handle_special_cases maps the already encoded values through
+                # the string mapping again, so every row falls back to the
+                # default. The scaler and model were fitted on that output.
+                encode = _constant_encoder(self.default_values[col])
+            elif col in self.encoding_mappings:
+                encode = self._lookup_encoder(col)
+            else:
+                encode = _numeric_encoder(imputation.get(col, 0))
+            self._column_encoders.append((col, encode))
+
+    def _lookup_encoder(self, col):
+        """Category lookup through a precomputed index array"""
+        mapping = self.encoding_mappings[col]
+        categories = pd.Index(list(mapping))
+        # Unknown categories get index -1, which selects the trailing default
+        codes = np.array(list(mapping.values()) + [self.default_values[col]], dtype=np.float64)
+        # Missing values become "Unknown" for these columns and 'nan' (so the default) otherwise
+        if col in ('Interior', 'Orientasi Bangunan', 'Nama Perumahan'):
+            missing_code = mapping.get('Unknown', self.default_values[col])
+        else:
+            missing_code = self.default_values[col]
+
+        def encode(series):
+            # Encode each distinct value once, then broadcast to the rows
+            row_codes, uniques = pd.factorize(series)
+            unique_codes = codes[categories.get_indexer(pd.Index(uniques).astype(str))]
+            return np.append(unique_codes, missing_code)[row_codes]
+        return encode
     
     def _handle_missing_values(self, data):
         """Handle missing values according to training logic"""
@@ -220,4 +292,15 @@ class TabularProcessor:
                 elif data[col].dtype.kind in 'biufc':  # numeric
                     data[col].fillna(0, inplace=True)
                 else:
-                    data[col].fillna("Unknown", inplace=True)
\ No newline at end of file
+                    data[col].fillna("Unknown", inplace=True)
+
+def _numeric_encoder(fill_value):
+    def encode(series):
+        values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+        return np.where(np.isnan(values), fill_value, values)
+    return encode
+
+def _constant_encoder(value):
+    def encode(series):
+        return np.full(len(series), value, dtype=np.float64)
+    return encode
\ No newline at end of file
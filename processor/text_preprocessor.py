@@ -0,0 +1,142 @@
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+# The regexes the preprocessing used to run one after the other (drop digits,
+# punctuation to spaces, collapse whitespace) leave exactly the runs of word
+# characters with their digits removed, so a single findall gives the tokens.
+_WORD = re.compile(r'\w+')
+_DIGITS = re.compile(r'\d+')
+
+# On text reduced to word characters and single spaces, NLTK's word_tokenize
+# only differs from str.split() in these whole-token splits (Treebank
+# CONTRACTIONS2); the apostrophe contractions cannot occur any more.
+_CONTRACTIONS = {
+    'cannot': ('can', 'not'),
+    'gimme': ('gim', 'me'),
+    'gonna': ('gon', 'na'),
+    'gotta': ('got', 'ta'),
+    'lemme': ('lem', 'me'),
+    'wanna': ('wan', 'na'),
+}
+
+class TextPreprocessor:
+    """Lowercases, tokenizes, drops Indonesian stopwords and stems listing text"""
+    def __init__(self, stem_cache_size=100000, stem_cache_path=None, stopwords=None):
+        from Sastrawi.Dictionary.ArrayDictionary import ArrayDictionary
+        from Sastrawi.Stemmer.Stemmer import Stemmer
+        from Sastrawi.Stemmer.StemmerFactory import StemmerFactory
+
+        if stopwords is None:
+            from nltk.corpus import stopwords as nltk_stopwords
+            stopwords = nltk_stopwords.words('indonesian')
+        self.stopwords = frozenset(stopwords)
+        # The plain stemmer: the factory's CachedStemmer memoizes without bound
+        self.stemmer = Stemmer(ArrayDictionary(StemmerFactory().get_words()))
+        self.stem_cache_size = stem_cache_size
+        self.stem_cache_path = stem_cache_path
+        self._stems = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if stem_cache_path and os.path.exists(stem_cache_path):
+            self.load_stem_cache(stem_cache_path)
+
+    def tokenize(self, text):
+        """Split lowercased text into word tokens without digits"""
+        text = text.lower()
+        tokens = _WORD.findall(text)
+        if _DIGITS.search(text):
+            tokens = [token for token in (_DIGITS.sub('', t) for t in tokens) if token]
+        if _CONTRACTIONS.keys().isdisjoint(tokens):
+            return tokens
+        split = []
+        for token in tokens:
+            split.extend(_CONTRACTIONS.get(token, (token,)))
+        return split
+
+    def content_tokens(self, text):
+        """Tokens of a text with stopwords removed"""
+        return [token for token in self.tokenize(text) if token not in self.stopwords]
+
+    def stem_words(self, words):
+        """Map each distinct word to its stem, stemming memo misses only"""
+        stems = {}
+        missing = []
+        with self._lock:
+            for word in set(words):
+                stem = self._stems.get(word)
+                if stem is None:
+                    missing.append(word)
+                else:
+                    self._stems.move_to_end(word)
+                    stems[word] = stem
+            self.hits += len(stems)
+            self.misses += len(missing)
+        # Stemming runs outside the lock; a word stemmed twice concurrently
+        # gives the same result either way
+        computed = {word: self.stemmer.stem(word) for word in missing}
+        if computed:
+            with self._lock:
+                self._remember(computed)
+        stems.update(computed)
+        return stems
+
+    def preprocess(self, text):
+        """Apply text preprocessing"""
+        return self.preprocess_batch([text])[0]
+
+    def preprocess_batch(self, texts):
+        """Preprocess many texts, tokenizing repeats once and stemming each distinct word once"""
+        tokens = {text: self.content_tokens(text) for text in dict.fromkeys(texts)}
+        stems = self.stem_words(word for words in tokens.values() for word in words)
+        processed = {text: ' '.join(stems[word] for word in words) for text, words in tokens.items()}
+        return [processed[text] for text in texts]
+
+    def _remember(self, stems):
+        """Add stems to the memo, evicting the least recently used words"""
+        if self.stem_cache_size <= 0:
+            return
+        self._stems.update(stems)
+        while len(self._stems) > self.stem_cache_size:
+            self._stems.popitem(last=False)
+
+    def load_stem_cache(self, path=None):
+        """Load a memo table written by save_stem_cache"""
+        path = path or self.stem_cache_path
+        with open(path, encoding='utf-8') as f:
+            stems = json.load(f)
+        with self._lock:
+            self._remember(stems)
+        return len(stems)
+
+    def save_stem_cache(self, path=None):
+        """Write the memo table as JSON, most recently used words last"""
+        path = path or self.stem_cache_path
+        if not path:
+            return 0
+        with self._lock:
+            stems = dict(self._stems)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Write then rename so concurrent workers never leave a torn file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(stems, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        return len(stems)
+
+    def stats(self):
+        """Memo table size and hit rate"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._stems),
+                'capacity': self.stem_cache_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
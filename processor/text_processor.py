@@ -1,72 +1,164 @@
-import re
+import atexit
+import threading
 import torch
 import numpy as np
 import pandas as pd
-import nltk
-from nltk.tokenize import word_tokenize
-from nltk.corpus import stopwords
-from Sastrawi.Stemmer.StemmerFactory import StemmerFactory
-from transformers import AutoTokenizer, AutoModel
-nltk.download('punkt')
-nltk.download('stopwords')
+from config import OFFLINE_MODE, NLTK_RESOURCES, STEM_CACHE_SIZE, STEM_CACHE_PATH, TEXT_TOKEN_BUDGET
+from processor.text_preprocessor import TextPreprocessor
+from utils.concurrency import CorePinnedRunner
+from utils.embedding_cache import EmbeddingCache
+from utils.metrics import stage_timer
+from utils.model_loader import load_encoder
+
+def ensure_nltk_resources():
+    """Check that the NLTK data used for preprocessing is installed locally"""
+    import nltk
+    missing = []
+    for name, path in NLTK_RESOURCES.items():
+        try:
+            nltk.data.find(path)
+        except LookupError:
+            missing.append(name)
+    if missing:
+        raise LookupError(
+            f"Missing NLTK resources: {', '.join(missing)}. "
+            f"Install them with: python -m nltk.downloader {' '.join(missing)}")
 
 class TextProcessor:
     """Processes text data and extracts embeddings"""
-    def __init__(self, model_name):
-        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
-        self.model = AutoModel.from_pretrained(model_name)
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.model.to(self.device)
-        self.model.eval()
-        
-        # Initialize Sastrawi stemmer
-        factory = StemmerFactory()
-        self.stemmer = factory.create_stemmer()
+    def __init__(self, model_name, cache=None, lazy=False, quantized=False, backend='eager',
+                 token_budget=TEXT_TOKEN_BUDGET, cores=None):
+        self.model_name = model_name
+        self.cache = cache
+        self.token_budget = token_budget
+        self.quantized = quantized
+        self.backend = backend
+        # int8 embeddings differ slightly, so they get their own cache keys
+        self.cache_name = f"{model_name}:int8" if quantized else model_name
+        # Dynamically quantized kernels and exported graphs only run on CPU
+        on_cpu = quantized or backend in ('torchscript', 'onnx')
+        self.device = torch.device("cuda" if torch.cuda.is_available() and not on_cpu else "cpu")
+        self.tokenizer = None
+        self.model = None
+        self.preprocessor = None
+        # E5 forwards run on a thread pinned to ``cores`` when given
+        self._runner = CorePinnedRunner(cores, 'text-encoder')
+        self._load_lock = threading.Lock()
+        if not lazy:
+            self.load()
+
+    def load(self):
+        """Load the tokenizer, E5 weights and Sastrawi stemmer once"""
+        if self.model is not None:
+            return
+        with self._load_lock:
+            if self.model is not None:
+                return
+            # Imported here so importing this module stays cheap
+            ensure_nltk_resources()
+            from transformers import AutoTokenizer
+
+            # Stopwords, Sastrawi stemmer and the word -> stem memo
+            self.preprocessor = TextPreprocessor(STEM_CACHE_SIZE, STEM_CACHE_PATH)
+            if STEM_CACHE_PATH:
+                atexit.register(self.preprocessor.save_stem_cache)
+
+            self.tokenizer = AutoTokenizer.from_pretrained(self.model_name, local_files_only=OFFLINE_MODE)
+            model = load_encoder(self.model_name, quantized=self.quantized, backend=self.backend)
+            model.to(self.device)
+            model.eval()
+            self.model = model
     
     def preprocess_text(self, text):
         """Apply text preprocessing"""
-        text = text.lower()
-        text = re.sub(r'\d+', '', text)
-        text = re.sub(r'[^\w\s]', ' ', text)
-        text = re.sub(r'\s+', ' ', text).strip()
-        
-        # Tokenize and remove stopwords
-        tokens = word_tokenize(text)
-        indonesian_stopwords = set(stopwords.words('indonesian'))
-        tokens = [word for word in tokens if word not in indonesian_stopwords]
-        
-        # Apply stemming
-        tokens = [self.stemmer.stem(word) for word in tokens]
-        return ' '.join(tokens)
+        self.load()
+        return self.preprocessor.preprocess(text)
     
     def process(self, texts):
-        """Extract text embeddings"""
+        """Text embeddings as a DataFrame of e5_* columns, a view over process_array"""
+        embeddings = self.process_array(texts)
+        columns = [f'e5_{i}' for i in range(embeddings.shape[1])]
+        return pd.DataFrame(embeddings, columns=columns, copy=False)
+
+    def process_array(self, texts):
+        """Extract a contiguous float32 [texts, dim] embedding array for one text or a list"""
+        self.load()
         if isinstance(texts, str):
             texts = [texts]
         
         # Preprocess texts
-        processed_texts = [self.preprocess_text(text) for text in texts]
+        with stage_timer('text_preprocess', len(texts)):
+            processed_texts = self.preprocessor.preprocess_batch(texts)
         
+        if self.cache is None:
+            embeddings = self._embed(processed_texts)
+        else:
+            keys = [EmbeddingCache.make_key(self.cache_name, text) for text in processed_texts]
+            embeddings = self.cache.get_or_compute(keys, processed_texts, self._embed)
+        return np.ascontiguousarray(embeddings, dtype=np.float32)
+
+    def _embed(self, processed_texts):
+        """Run E5 over a list of preprocessed texts, batching texts of similar length"""
         # Add E5 prefix
         batch = ["passage: " + text for text in processed_texts]
-        
-        # Tokenize and get embeddings
-        inputs = self.tokenizer(
-            batch,
-            return_tensors="pt",
-            truncation=True,
-            padding=True,
-            max_length=512
-        ).to(self.device)
-        
+        if self.token_budget <= 0 or len(batch) == 1:
+            inputs = self.tokenizer(
+                batch,
+                return_tensors="pt",
+                truncation=True,
+                padding=True,
+                max_length=512
+            )
+            return self._forward(inputs)
+
+        # Token lengths first, then each length bucket is padded on its own
+        lengths = [len(ids) for ids in self.tokenizer(batch, truncation=True, max_length=512)['input_ids']]
+        embeddings = None
+        for indices in length_buckets(lengths, self.token_budget):
+            inputs = self.tokenizer(
+                [batch[i] for i in indices],
+                return_tensors="pt",
+                truncation=True,
+                padding=True,
+                max_length=512
+            )
+            bucket = self._forward(inputs)
+            if embeddings is None:
+                embeddings = np.empty((len(batch), bucket.shape[1]), dtype=bucket.dtype)
+            embeddings[indices] = bucket
+        return embeddings
+
+    def _forward(self, inputs):
+        """CLS embeddings of one padded batch of tokenized texts"""
+        with stage_timer('text_encoder', len(inputs['input_ids'])):
+            return self._runner.run(self._encode, inputs)
+
+    def _encode(self, inputs):
+        inputs = inputs.to(self.device)
         with torch.no_grad():
             outputs = self.model(**inputs)
             # E5 uses CLS token embedding
             embeddings = outputs.last_hidden_state[:, 0].cpu().numpy()
             
             # Normalize embeddings
-            embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
-        
-        # Create feature names and dataframe
-        columns = [f'e5_{i}' for i in range(embeddings.shape[1])]
-        return pd.DataFrame(embeddings, columns=columns)
\ No newline at end of file
+            return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+def length_buckets(lengths, token_budget):
+    """Group indices by token length so each padded batch stays within token_budget.
+
+    Indices are visited shortest first and a batch is closed once one more
+    item would push batch size times longest length over the budget, so
+    short titles are never padded to the length of a long description.
+    """
+    order = sorted(range(len(lengths)), key=lengths.__getitem__)
+    buckets = []
+    current = []
+    for i in order:
+        # Sorted ascending, so lengths[i] is the padded length with i added
+        if current and (len(current) + 1) * lengths[i] > token_budget:
+            buckets.append(current)
+            current = []
+        current.append(i)
+    if current:
+        buckets.append(current)
+    return buckets
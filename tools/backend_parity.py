@@ -0,0 +1,69 @@
+"""Check that every inference backend predicts the same prices as eager PyTorch.
+
+Usage:
+    python -m tools.backend_parity --input heldout.csv [--backends compile torchscript onnx] [--encoders]
+
+The input needs the config.FEATURE_NAMES columns plus an image path column
+and a title column. torchscript and onnx read the graphs written by
+tools/export_models.py. Exits non-zero when any price differs from the eager
+prediction by more than --rtol.
+"""
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from config import BATCH_SIZE, IMAGE_COLUMN, TEXT_COLUMN
+from inference.predictions import MultimodalPredictor
+from utils.dataset import records_from_frame
+
+def predict(records, batch_size, backend, encoder_backend):
+    """Prices and ms per listing from a predictor on the given backends"""
+    # MODEL_PATH, the checkpoint tools/export_models.py exports, not a registry version
+    predictor = MultimodalPredictor(backend=backend, encoder_backend=encoder_backend, embedding_cache=False,
+                                    model_registry_dir=None, model_version=None)
+    predictor.warmup()
+    start = time.perf_counter()
+    prices = np.array(predictor.predict_batch(records, batch_size=batch_size))
+    return prices, (time.perf_counter() - start) * 1000 / len(records)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--input', required=True, help='CSV of held-out listings')
+    parser.add_argument('--image-column', default=IMAGE_COLUMN)
+    parser.add_argument('--text-column', default=TEXT_COLUMN)
+    parser.add_argument('--limit', type=int, default=None, help='Only use the first N listings')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--backends', nargs='+', default=['compile', 'torchscript', 'onnx'])
+    parser.add_argument('--encoders', action='store_true', help='Run the encoders on each backend too')
+    parser.add_argument('--rtol', type=float, default=1e-4, help='Largest allowed relative price difference')
+    parser.add_argument('--output', help='Write the report as JSON to this path')
+    args = parser.parse_args()
+
+    frame = pd.read_csv(args.input, nrows=args.limit)
+    records = records_from_frame(frame, args.image_column, args.text_column)
+
+    reference, reference_ms = predict(records, args.batch_size, 'eager', 'eager')
+    report = {'listings': len(records), 'eager': {'ms_per_listing': reference_ms}}
+    for backend in args.backends:
+        prices, ms = predict(records, args.batch_size, backend, backend if args.encoders else 'eager')
+        relative = np.abs(prices - reference) / np.maximum(np.abs(reference), 1e-9)
+        report[backend] = {
+            'ms_per_listing': ms,
+            'max_abs_diff_millions': float(np.abs(prices - reference).max()),
+            'max_rel_diff': float(relative.max()),
+            'passed': bool(relative.max() <= args.rtol),
+        }
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if not all(report[backend]['passed'] for backend in args.backends):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Fill the listing embedding store from a CSV or Parquet dump of listings.
+
+Usage:
+    python -m tools.backfill_listings --input listings.parquet --store model/listings
+    python -m tools.backfill_listings --input changed.csv --store model/listings --update
+
+Rows need a listing ID column plus an image path column (several photos
+joined by config.PHOTO_PATH_SEPARATOR) and a title column.
+Each chunk is embedded with DINOv2 and E5 and written to the store. By
+default listings already in the store are skipped, so rerunning after an
+interruption or on a dump with new listings only embeds what is missing.
+``--update`` re-embeds every row instead, for listings whose photo or title
+changed. Afterwards ``MultimodalPredictor.predict_by_id`` can score these
+listings from tabular data alone.
+"""
+import argparse
+import logging
+
+from config import BATCH_SIZE, IMAGE_COLUMN, LISTING_ID_COLUMN, LISTING_STORE_DIR, TEXT_COLUMN
+from inference.predictions import MultimodalPredictor
+from tools.score import iter_chunks
+from utils.dataset import photo_paths
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--input', required=True, help='CSV or .parquet file of listings')
+    parser.add_argument('--store', default=LISTING_STORE_DIR, help='Listing store directory (default LISTING_STORE_DIR)')
+    parser.add_argument('--id-column', default=LISTING_ID_COLUMN)
+    parser.add_argument('--image-column', default=IMAGE_COLUMN)
+    parser.add_argument('--text-column', default=TEXT_COLUMN)
+    parser.add_argument('--chunk-size', type=int, default=1024, help='Rows read per chunk')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Listings per encoder batch')
+    parser.add_argument('--update', action='store_true', help='Re-embed listings that are already stored')
+    args = parser.parse_args()
+    if not args.store:
+        parser.error('--store is required when LISTING_STORE_DIR is not set')
+
+    predictor = MultimodalPredictor(listing_store_dir=args.store)
+    store = predictor.listing_store
+
+    embedded = added = 0
+    for frame in iter_chunks(args.input, args.chunk_size):
+        missing = [col for col in (args.id_column, args.image_column, args.text_column) if col not in frame.columns]
+        if missing:
+            raise ValueError(f"Missing required columns: {', '.join(missing)}")
+        # The last row wins when an ID repeats within a chunk
+        frame = frame.drop_duplicates(args.id_column, keep='last')
+        ids = frame[args.id_column].astype(str)
+        if not args.update:
+            keep = ids.isin(store.missing(ids.tolist())).values
+            frame, ids = frame[keep], ids[keep]
+
+        if len(frame):
+            added += predictor.store_listings(
+                ids.tolist(),
+                [photo_paths(value) for value in frame[args.image_column].tolist()],
+                frame[args.text_column].fillna('').astype(str).tolist(),
+                batch_size=args.batch_size
+            )
+            embedded += len(frame)
+        logger.info(f"Embedded {embedded} listings, {len(store)} in store")
+
+    logger.info(f"Finished: {embedded} listings embedded, {added} new, {len(store)} in store")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Export the fusion model, and optionally the encoders, to TorchScript or ONNX.
+
+Usage:
+    python -m tools.export_models --backend torchscript [--encoders] [--output model/exported]
+    python -m tools.export_models --backend onnx [--encoders] [--reference-layout]
+
+Start the server with FUSION_BACKEND (and ENCODER_BACKEND when the encoders
+were exported) set to the same backend to serve the graphs, then run
+tools/backend_parity.py to confirm the prices match the eager models. The
+ONNX backend needs the onnx and onnxruntime packages
+(pip install -r requirements-onnx.txt).
+"""
+import argparse
+import logging
+
+import torch
+
+from config import IMAGE_MODEL_NAME, TEXT_MODEL_NAME, MODEL_PATH, TABULAR_DIM, IMAGE_DIM, TEXT_DIM
+from config import EXPORTED_MODEL_DIR, FUSION_WEIGHTS_NAME, OFFLINE_MODE
+from utils.backends import EXPORTED_FILES, FUSION_INPUTS, IMAGE_ENCODER_INPUTS, TEXT_ENCODER_INPUTS
+from utils.backends import EncoderGraph, export_model, exported_path, require_backend
+from utils.checkpoints import record_source
+from utils.model_loader import load_encoder, load_fusion_model
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def image_example(image_size):
+    """Two preprocessed images, the layout ImageProcessor feeds DINOv2"""
+    return (torch.randn(2, 3, image_size, image_size),)
+
+def text_example():
+    """Two tokenized texts of different lengths, padded like TextProcessor does"""
+    from transformers import AutoTokenizer
+    tokenizer = AutoTokenizer.from_pretrained(TEXT_MODEL_NAME, local_files_only=OFFLINE_MODE)
+    inputs = tokenizer(["passage: rumah dijual", "passage: rumah minimalis siap huni dekat tol"],
+                       return_tensors="pt", padding=True)
+    return tuple(inputs[name] for name in TEXT_ENCODER_INPUTS)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', required=True, choices=list(EXPORTED_FILES))
+    parser.add_argument('--output', default=EXPORTED_MODEL_DIR, help='Directory for the exported graphs')
+    parser.add_argument('--model-path', default=MODEL_PATH, help='Fusion model checkpoint')
+    parser.add_argument('--reference-layout', action='store_true',
+                        help='Export EnhancedFusionModel as written instead of the fused layout')
+    parser.add_argument('--encoders', action='store_true', help='Also export DINOv2 and E5')
+    parser.add_argument('--image-size', type=int, default=224, help='Crop size DINOv2 is traced at')
+    args = parser.parse_args()
+    try:
+        require_backend(args.backend, export=True)
+    except ImportError as e:
+        parser.error(str(e))
+
+    # Always from --model-path, never from shared or previously exported weights
+    model = load_fusion_model(args.model_path, TABULAR_DIM, IMAGE_DIM, TEXT_DIM, fused=not args.reference_layout,
+                              prebuilt=False)
+    example = (torch.randn(2, TABULAR_DIM), torch.randn(2, IMAGE_DIM), torch.randn(2, TEXT_DIM))
+    path = export_model(model, example, FUSION_INPUTS, args.backend,
+                        exported_path(args.output, FUSION_WEIGHTS_NAME, args.backend))
+    record_source(path, args.model_path)
+    logger.info(f"Exported fusion model to {path}")
+
+    if args.encoders:
+        for name, input_names, inputs in [
+            (IMAGE_MODEL_NAME, IMAGE_ENCODER_INPUTS, image_example(args.image_size)),
+            (TEXT_MODEL_NAME, TEXT_ENCODER_INPUTS, text_example()),
+        ]:
+            graph = EncoderGraph(load_encoder(name), input_names)
+            path = export_model(graph, inputs, input_names, args.backend, exported_path(args.output, name, args.backend))
+            logger.info(f"Exported {name} to {path}")
+
+if __name__ == "__main__":
+    main()
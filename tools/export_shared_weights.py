@@ -0,0 +1,46 @@
+"""Export model weights for memory-mapped sharing across worker processes.
+
+Usage:
+    python -m tools.export_shared_weights --output model/shared
+
+Then start the server with SHARED_WEIGHTS_DIR=model/shared. Each worker maps
+the exported files read-only, so the weights are held in memory once per
+node instead of once per worker.
+"""
+import argparse
+import logging
+import os
+
+from config import IMAGE_MODEL_NAME, TEXT_MODEL_NAME, MODEL_PATH, FUSION_WEIGHTS_NAME, TABULAR_DIM, IMAGE_DIM, TEXT_DIM
+from utils.checkpoints import record_source
+from utils.model_loader import load_encoder, load_fusion_model
+from utils.shared_weights import WEIGHTS_FILE, export_shared_weights
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', required=True, help='Directory to write the shared weights to')
+    parser.add_argument('--model-path', default=MODEL_PATH, help='Fusion model checkpoint')
+    args = parser.parse_args()
+
+    # Always from the hub weights and --model-path in the checkpoint layout,
+    # never from a registry version or weights already mapped from
+    # SHARED_WEIGHTS_DIR (which may be --output itself)
+    for name, load in [
+        (IMAGE_MODEL_NAME, lambda: load_encoder(IMAGE_MODEL_NAME, prebuilt=False)),
+        (TEXT_MODEL_NAME, lambda: load_encoder(TEXT_MODEL_NAME, prebuilt=False)),
+        (FUSION_WEIGHTS_NAME, lambda: load_fusion_model(args.model_path, TABULAR_DIM, IMAGE_DIM, TEXT_DIM)),
+    ]:
+        directory = export_shared_weights(load(), args.output, name)
+        if name == FUSION_WEIGHTS_NAME:
+            # Servers only map them for the checkpoint they came from
+            record_source(os.path.join(directory, WEIGHTS_FILE), args.model_path)
+        logger.info(f"Exported {name} to {directory}")
+
+if __name__ == "__main__":
+    main()
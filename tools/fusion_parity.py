@@ -0,0 +1,74 @@
+"""Check that the fused fusion model matches EnhancedFusionModel.
+
+Usage:
+    python -m tools.fusion_parity [--model-path model/best_model.pth] [--random-weights] [--atol 1e-4]
+
+Loads the checkpoint into both layouts, runs the same random features through
+each at several batch sizes, and reports the largest absolute difference and
+the per-forward latency of both. Exits non-zero when a difference exceeds the
+tolerance, so it can gate a deploy.
+"""
+import argparse
+import json
+import sys
+import time
+
+import torch
+
+from config import MODEL_PATH, TABULAR_DIM, IMAGE_DIM, TEXT_DIM
+from utils.fused_model import FusedFusionModel
+from utils.model_loader import EnhancedFusionModel, load_fusion_model
+
+def latency_ms(model, inputs, repeats):
+    """Mean milliseconds per forward after a short warmup"""
+    for _ in range(5):
+        model(*inputs)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        model(*inputs)
+    return (time.perf_counter() - start) * 1000 / repeats
+
+def check_parity(reference, fused, batch_sizes=(1, 8, 64), atol=1e-4, repeats=50, seed=0):
+    """Compare both models on random features, one report entry per batch size"""
+    generator = torch.Generator().manual_seed(seed)
+    report = []
+    with torch.inference_mode():
+        for batch_size in batch_sizes:
+            inputs = (
+                torch.randn(batch_size, TABULAR_DIM, generator=generator),
+                torch.randn(batch_size, IMAGE_DIM, generator=generator),
+                torch.randn(batch_size, TEXT_DIM, generator=generator)
+            )
+            max_abs_diff = (reference(*inputs) - fused(*inputs)).abs().max().item()
+            report.append({
+                'batch_size': batch_size,
+                'max_abs_diff': max_abs_diff,
+                'passed': max_abs_diff <= atol,
+                'reference_ms': latency_ms(reference, inputs, repeats),
+                'fused_ms': latency_ms(fused, inputs, repeats),
+            })
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model-path', default=MODEL_PATH, help='Fusion model checkpoint')
+    parser.add_argument('--random-weights', action='store_true', help='Use a randomly initialised model instead')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 64])
+    parser.add_argument('--atol', type=float, default=1e-4)
+    parser.add_argument('--repeats', type=int, default=50)
+    args = parser.parse_args()
+
+    if args.random_weights:
+        torch.manual_seed(0)
+        reference = EnhancedFusionModel(TABULAR_DIM, IMAGE_DIM, TEXT_DIM).eval()
+    else:
+        reference = load_fusion_model(args.model_path, TABULAR_DIM, IMAGE_DIM, TEXT_DIM, prebuilt=False)
+    fused = FusedFusionModel.from_model(reference)
+
+    report = check_parity(reference, fused, args.batch_sizes, args.atol, args.repeats)
+    print(json.dumps(report, indent=2))
+    if not all(entry['passed'] for entry in report):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
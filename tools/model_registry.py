@@ -0,0 +1,102 @@
+"""Manage the local registry of fusion checkpoint and scaler versions.
+
+Usage:
+    python -m tools.model_registry register v2 --model retrained/best_model.pth [--scaler retrained/scaler.pkl]
+    python -m tools.model_registry list
+    python -m tools.model_registry activate v2
+
+The registry lives in --registry (default MODEL_REGISTRY_DIR). register
+checks that the checkpoint loads into EnhancedFusionModel and that the scaler
+unpickles, then copies both in as a new immutable version. A version that
+only changes the fusion head can reuse the active version's scaler (the
+default), or SCALER_PATH before any version is active. activate points the
+registry's ACTIVE file at a version. Servers polling the registry
+(MODEL_REGISTRY_POLL_SECONDS) then load and warm it in the background and
+switch to it without dropping requests.
+"""
+import argparse
+import json
+import logging
+import pickle
+import sys
+import time
+
+import torch
+
+from config import IMAGE_DIM, MODEL_REGISTRY_DIR, SCALER_PATH, TABULAR_DIM, TEXT_DIM
+from utils.model_loader import EnhancedFusionModel
+from utils.model_registry import ModelRegistry
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def check_checkpoint(model_path, scaler_path):
+    """Raise if the checkpoint does not fit EnhancedFusionModel or the scaler does not unpickle"""
+    model = EnhancedFusionModel(tab_dim=TABULAR_DIM, img_dim=IMAGE_DIM, text_dim=TEXT_DIM)
+    model.load_state_dict(torch.load(model_path, map_location='cpu'))
+    with open(scaler_path, 'rb') as f:
+        scaler = pickle.load(f)
+    if getattr(scaler, 'n_features_in_', TABULAR_DIM) != TABULAR_DIM:
+        raise ValueError(f"Scaler expects {scaler.n_features_in_} features, the model {TABULAR_DIM}")
+
+def register(registry, args):
+    scaler_path = args.scaler
+    if scaler_path is None:
+        active = registry.active()
+        scaler_path = registry.paths(active)[1] if active else SCALER_PATH
+        logger.info(f"Reusing the scaler of {active or 'SCALER_PATH'}")
+    check_checkpoint(args.model, scaler_path)
+    metadata = registry.register(args.version, args.model, scaler_path,
+                                 {'note': args.note} if args.note else None)
+    logger.info(f"Registered model version {args.version}")
+    if args.activate:
+        registry.set_active(args.version)
+        logger.info(f"Activated model version {args.version}")
+    print(json.dumps(metadata, indent=2))
+
+def list_versions(registry, args):
+    active = registry.active()
+    for version in registry.versions():
+        metadata = registry.metadata(version)
+        registered = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(metadata['registered_at']))
+        marker = '*' if version == active else ' '
+        print(f"{marker} {version:<20} {registered}  {metadata.get('note', '')}")
+
+def activate(registry, args):
+    registry.set_active(args.version)
+    logger.info(f"Activated model version {args.version}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--registry', default=MODEL_REGISTRY_DIR, help='Registry directory (default MODEL_REGISTRY_DIR)')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    register_parser = commands.add_parser('register', help='Add a checkpoint and scaler as a new version')
+    register_parser.add_argument('version')
+    register_parser.add_argument('--model', required=True, help='Fusion model state dict (.pth)')
+    register_parser.add_argument('--scaler', help="Fitted scaler (.pkl), default the active version's")
+    register_parser.add_argument('--note', help='Free text stored in the version metadata')
+    register_parser.add_argument('--activate', action='store_true', help='Make the new version active')
+    register_parser.set_defaults(run=register)
+
+    commands.add_parser('list', help='Show the versions, * marks the active one').set_defaults(run=list_versions)
+
+    activate_parser = commands.add_parser('activate', help='Point the registry at a version')
+    activate_parser.add_argument('version')
+    activate_parser.set_defaults(run=activate)
+
+    args = parser.parse_args()
+    if not args.registry:
+        parser.error("--registry or MODEL_REGISTRY_DIR is required")
+
+    try:
+        args.run(ModelRegistry(args.registry), args)
+    except (KeyError, ValueError) as e:
+        logger.error(e.args[0] if e.args else str(e))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
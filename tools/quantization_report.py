@@ -0,0 +1,87 @@
+"""Compare int8 and float32 inference on a held-out set of listings.
+
+Usage:
+    python -m tools.quantization_report --input heldout.csv [--output report.json]
+
+The input needs the config.FEATURE_NAMES columns plus an image path column
+and a title column. Both predictors run with the embedding cache disabled so
+latencies reflect the encoder forwards.
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from config import BATCH_SIZE, IMAGE_COLUMN, TEXT_COLUMN
+from inference.predictions import MultimodalPredictor
+from utils.dataset import records_from_frame
+
+def measure(predictor, records, batch_size, single_requests):
+    """Batched predictions plus batched and single-request latency"""
+    predictor.warmup()
+
+    start = time.perf_counter()
+    predictions = predictor.predict_batch(records, batch_size=batch_size)
+    batch_seconds = time.perf_counter() - start
+
+    single_ms = []
+    for record in records[:single_requests]:
+        start = time.perf_counter()
+        predictor.predict_batch([record], batch_size=1)
+        single_ms.append((time.perf_counter() - start) * 1000)
+
+    return np.array(predictions), {
+        'batched_ms_per_listing': batch_seconds * 1000 / len(records),
+        'single_p50_ms': float(np.percentile(single_ms, 50)) if single_ms else None,
+        'single_p95_ms': float(np.percentile(single_ms, 95)) if single_ms else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--input', required=True, help='CSV of held-out listings')
+    parser.add_argument('--image-column', default=IMAGE_COLUMN)
+    parser.add_argument('--text-column', default=TEXT_COLUMN)
+    parser.add_argument('--limit', type=int, default=None, help='Only use the first N listings')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--single-requests', type=int, default=20, help='Listings timed one at a time')
+    parser.add_argument('--quantize-fusion', action='store_true', help='Also use the int8 fusion model')
+    parser.add_argument('--output', help='Write the report as JSON to this path')
+    args = parser.parse_args()
+
+    frame = pd.read_csv(args.input, nrows=args.limit)
+    records = records_from_frame(frame, args.image_column, args.text_column)
+
+    # Both on MODEL_PATH, the checkpoint tools/quantize.py builds from, not a registry version
+    float_predictor = MultimodalPredictor(quantized=False, quantize_fusion=False, embedding_cache=False,
+                                          model_registry_dir=None, model_version=None)
+    float_prices, float_latency = measure(float_predictor, records, args.batch_size, args.single_requests)
+    del float_predictor
+
+    int8_predictor = MultimodalPredictor(quantized=True, quantize_fusion=args.quantize_fusion, embedding_cache=False,
+                                         model_registry_dir=None, model_version=None)
+    int8_prices, int8_latency = measure(int8_predictor, records, args.batch_size, args.single_requests)
+
+    abs_error = np.abs(int8_prices - float_prices)
+    relative_error = abs_error / np.maximum(np.abs(float_prices), 1e-9)
+    report = {
+        'listings': len(records),
+        'accuracy': {
+            'mean_abs_diff': float(abs_error.mean()),
+            'max_abs_diff': float(abs_error.max()),
+            'mean_rel_diff': float(relative_error.mean()),
+            'p95_rel_diff': float(np.percentile(relative_error, 95)),
+            'correlation': float(np.corrcoef(float_prices, int8_prices)[0, 1]) if len(records) > 1 else None,
+        },
+        'latency': {'float32': float_latency, 'int8': int8_latency},
+        'speedup_batched': float_latency['batched_ms_per_listing'] / int8_latency['batched_ms_per_listing'],
+    }
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""Build and save dynamic int8 versions of the encoders and fusion model.
+
+Usage:
+    python -m tools.quantize [--output model/quantized] [--skip-fusion]
+
+Start the server with QUANTIZED_INFERENCE=True (and QUANTIZE_FUSION_MODEL=True
+for the fusion model) to serve the saved int8 models.
+"""
+import argparse
+import logging
+
+from config import IMAGE_MODEL_NAME, TEXT_MODEL_NAME, MODEL_PATH, TABULAR_DIM, IMAGE_DIM, TEXT_DIM
+from config import QUANTIZED_MODEL_DIR, FUSION_WEIGHTS_NAME
+from utils.model_loader import load_encoder, load_fusion_model
+from utils.checkpoints import record_source
+from utils.quantization import quantize_dynamic_int8, save_quantized
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', default=QUANTIZED_MODEL_DIR, help='Directory for the int8 models')
+    parser.add_argument('--model-path', default=MODEL_PATH, help='Fusion model checkpoint')
+    parser.add_argument('--skip-fusion', action='store_true', help='Only quantize the encoders')
+    args = parser.parse_args()
+
+    for name in [IMAGE_MODEL_NAME, TEXT_MODEL_NAME]:
+        model = quantize_dynamic_int8(load_encoder(name))
+        logger.info(f"Saved int8 {name} to {save_quantized(model, args.output, name)}")
+
+    if not args.skip_fusion:
+        # Always from --model-path, never from a previously saved int8 model
+        model = load_fusion_model(args.model_path, TABULAR_DIM, IMAGE_DIM, TEXT_DIM, quantized=True, prebuilt=False)
+        path = save_quantized(model, args.output, FUSION_WEIGHTS_NAME)
+        # Servers only load it for the checkpoint it was built from
+        record_source(path, args.model_path)
+        logger.info(f"Saved int8 fusion model to {path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""Stream a CSV or Parquet dump of listings through the prediction pipeline.
+
+Usage:
+    python -m tools.score --input listings.parquet --output prices.csv
+
+Rows need the config.FEATURE_NAMES columns plus an image path column (several
+photos joined by config.PHOTO_PATH_SEPARATOR) and a title column. The input is read in chunks and predictions are appended to
+the output CSV after every chunk, so memory stays flat regardless of input
+size. Progress is checkpointed next to the output; rerunning the same command
+after an interruption resumes from the last completed chunk.
+"""
+import argparse
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+from config import BATCH_SIZE, IMAGE_COLUMN, TEXT_COLUMN
+from inference.predictions import MultimodalPredictor
+from utils.dataset import records_from_frame
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def iter_chunks(path, chunk_size, skip_rows=0):
+    """Yield DataFrames of at most ``chunk_size`` rows, skipping the first ``skip_rows`` records"""
+    if path.endswith('.parquet'):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Reading Parquet input requires pyarrow: pip install pyarrow")
+        skipped = 0
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            if skipped + batch.num_rows <= skip_rows:
+                skipped += batch.num_rows
+                continue
+            frame = batch.to_pandas()
+            yield frame.iloc[max(0, skip_rows - skipped):].reset_index(drop=True)
+            skipped = skip_rows
+    else:
+        # skiprows counts physical lines, which quoted multi-line titles break,
+        # so skipped records are parsed and dropped a chunk at a time instead
+        skipped = 0
+        for frame in pd.read_csv(path, chunksize=chunk_size):
+            if skipped + len(frame) <= skip_rows:
+                skipped += len(frame)
+                continue
+            yield frame.iloc[max(0, skip_rows - skipped):].reset_index(drop=True)
+            skipped = skip_rows
+
+def score_chunk(predictor, records, batch_size):
+    """Predict a chunk, isolating the rows that fail instead of dropping the chunk"""
+    try:
+        return predictor.predict_batch(records, batch_size=batch_size), [''] * len(records)
+    except Exception as e:
+        logger.warning(f"Chunk failed, scoring its rows one by one: {str(e)}")
+
+    prices, errors = [], []
+    for record in records:
+        try:
+            prices.extend(predictor.predict_batch([record], batch_size=1))
+            errors.append('')
+        except Exception as e:
+            prices.append(np.nan)
+            errors.append(str(e))
+    return prices, errors
+
+class Checkpoint:
+    """Rows completed so far and the output size they correspond to"""
+    def __init__(self, path, input_path):
+        self.path = path
+        self.input_path = os.path.abspath(input_path)
+        self.rows_done = 0
+        self.output_bytes = 0
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path) as f:
+            state = json.load(f)
+        if state['input'] != self.input_path:
+            raise ValueError(f"Checkpoint {self.path} belongs to {state['input']}, use --restart to start over")
+        self.rows_done = state['rows_done']
+        self.output_bytes = state['output_bytes']
+        return True
+
+    def save(self):
+        # Write then rename so an interruption never leaves a torn checkpoint
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'input': self.input_path, 'rows_done': self.rows_done,
+                       'output_bytes': self.output_bytes}, f)
+        os.replace(tmp_path, self.path)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--input', required=True, help='CSV or .parquet file of listings')
+    parser.add_argument('--output', required=True, help='CSV file to append predictions to')
+    parser.add_argument('--id-column', help='Column copied to the output to identify each listing')
+    parser.add_argument('--image-column', default=IMAGE_COLUMN)
+    parser.add_argument('--text-column', default=TEXT_COLUMN)
+    parser.add_argument('--chunk-size', type=int, default=1024, help='Rows read and written per chunk')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Listings per model batch')
+    parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint')
+    args = parser.parse_args()
+
+    checkpoint = Checkpoint(args.output + '.checkpoint', args.input)
+    if not args.restart and checkpoint.load():
+        logger.info(f"Resuming after {checkpoint.rows_done} rows")
+    # Drop output written after the last checkpoint so no row is duplicated
+    mode = 'r+b' if os.path.exists(args.output) else 'wb'
+    with open(args.output, mode) as out:
+        out.truncate(checkpoint.output_bytes)
+
+    predictor = MultimodalPredictor()
+
+    for frame in iter_chunks(args.input, args.chunk_size, skip_rows=checkpoint.rows_done):
+        records = records_from_frame(frame, args.image_column, args.text_column)
+        prices, errors = score_chunk(predictor, records, args.batch_size)
+
+        result = pd.DataFrame({'row': np.arange(len(frame)) + checkpoint.rows_done})
+        if args.id_column:
+            result[args.id_column] = frame[args.id_column].values
+        result['predicted_price'] = prices
+        result['error'] = errors
+
+        with open(args.output, 'a', newline='') as out:
+            result.to_csv(out, header=checkpoint.rows_done == 0, index=False)
+            out.flush()
+            os.fsync(out.fileno())
+            checkpoint.output_bytes = out.tell()
+        checkpoint.rows_done += len(frame)
+        checkpoint.save()
+        logger.info(f"Scored {checkpoint.rows_done} rows")
+
+    logger.info(f"Finished, predictions written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""Search process, thread and core-pinning layouts for the prediction pipeline on this host.
+
+Usage:
+    python -m tools.tune_concurrency [--duration 20] [--p99-budget-ms 1000] [--output tuning.json]
+    python -m tools.tune_concurrency --stand-ins --duration 5
+
+Each candidate layout sets worker processes x request threads per process x
+torch intra-op threads. Some layouts also pin DINOv2 and E5 to disjoint core
+sets. Every candidate runs in fresh processes, because torch thread pools are
+fixed once used. Every process loads the predictor and warms it up. Its
+request threads then call predict (through the micro-batching scheduler when
+SCHEDULER_ENABLED) on synthetic listings for --duration seconds. Throughput
+and p50/p95/p99 latency are aggregated over the processes. The best layout is
+the highest throughput within the p99 budget. It is printed as the config.py
+environment variables to set. --stand-ins uses the small offline encoders of
+benchmarks/stand_ins.py instead of the real checkpoints. With the real models,
+set SHARED_WEIGHTS_DIR so the worker processes share one copy of the weights.
+"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def available_cores():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+def core_spec(cores):
+    return ','.join(map(str, cores))
+
+def candidate_layouts(cores, thread_counts):
+    """Layouts that do not oversubscribe the cores more than request threads already do"""
+    layouts = []
+    intra_op = 1
+    while intra_op <= len(cores):
+        for processes in sorted({1, max(1, len(cores) // intra_op)}):
+            for threads in thread_counts:
+                layouts.append({'processes': processes, 'threads': threads, 'intra_op': intra_op,
+                                'image_cores': None, 'text_cores': None})
+        # One process with each encoder pinned to its own intra_op cores
+        if intra_op * 2 <= len(cores):
+            for threads in thread_counts:
+                layouts.append({'processes': 1, 'threads': threads, 'intra_op': intra_op,
+                                'image_cores': core_spec(cores[:intra_op]),
+                                'text_cores': core_spec(cores[intra_op:2 * intra_op])})
+        intra_op *= 2
+    return layouts
+
+def layout_env(layout):
+    """Environment variables of a layout, as read by config.py"""
+    return {
+        'TORCH_INTRA_OP_THREADS': str(layout['intra_op']),
+        'TOKENIZERS_PARALLELISM': 'false',
+        'SERVER_WORKERS': str(layout['processes']),
+        'SERVER_THREADS': str(layout['threads']),
+        'INFERENCE_WORKERS': str(layout['threads']),
+        'IMAGE_ENCODER_CORES': layout['image_cores'] or '',
+        'TEXT_ENCODER_CORES': layout['text_cores'] or '',
+    }
+
+def run_layout(layout, duration, stand_ins):
+    """Start the layout's processes, release them together and merge their results"""
+    env = dict(os.environ, **layout_env(layout))
+    command = [sys.executable, '-m', 'tools.tune_concurrency', '--worker',
+               '--threads', str(layout['threads']), '--duration', str(duration)]
+    if stand_ins:
+        command.append('--stand-ins')
+    workers = [subprocess.Popen(command, env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+               for _ in range(layout['processes'])]
+    try:
+        for worker in workers:
+            if worker.stdout.readline().strip() != 'ready':
+                raise RuntimeError(f"Worker failed to start for layout {layout}")
+        for worker in workers:
+            worker.stdin.write('go\n')
+            worker.stdin.flush()
+        results = [json.loads(worker.stdout.readline()) for worker in workers]
+    finally:
+        for worker in workers:
+            worker.stdin.close()
+            worker.wait()
+
+    latencies = np.concatenate([result['latencies_ms'] for result in results] or [[]])
+    if not len(latencies):
+        return {'requests_per_second': 0.0, 'p50_ms': None, 'p95_ms': None, 'p99_ms': None}
+    return {
+        'requests_per_second': float(len(latencies) / duration),
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+    }
+
+def worker(threads, duration, stand_ins):
+    """One server process: load, warm up, then run request threads when told to"""
+    from utils.concurrency import configure_process, parse_cores
+    configure_process()
+
+    import config
+    from benchmarks.stand_ins import listings, make_predictor
+    from inference.predictions import MultimodalPredictor
+    from inference.scheduler import MicroBatchScheduler
+
+    if stand_ins:
+        predictor = make_predictor(image_cores=parse_cores(config.IMAGE_ENCODER_CORES),
+                                   text_cores=parse_cores(config.TEXT_ENCODER_CORES))
+    else:
+        # Repeated synthetic listings would otherwise be cache hits
+        predictor = MultimodalPredictor(embedding_cache=False)
+    scheduler = MicroBatchScheduler(predictor) if config.SCHEDULER_ENABLED else None
+    predict = scheduler.predict if scheduler is not None else predictor.predict
+    records = listings(64)
+    for record in records[:2]:
+        predict(*record)
+
+    print('ready', flush=True)
+    sys.stdin.readline()
+    deadline = time.perf_counter() + duration
+    latencies = [[] for _ in range(threads)]
+
+    def client(index):
+        i = index
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            predict(*records[i % len(records)])
+            latencies[index].append((time.perf_counter() - start) * 1000)
+            i += threads
+
+    clients = [threading.Thread(target=client, args=(i,)) for i in range(threads)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    if scheduler is not None:
+        scheduler.close()
+    print(json.dumps({'latencies_ms': [ms for thread in latencies for ms in thread]}), flush=True)
+
+def best_layout(results, p99_budget_ms):
+    """Highest throughput within the p99 budget, else the lowest p99"""
+    measured = [result for result in results if result['p99_ms'] is not None]
+    within = [result for result in measured if result['p99_ms'] <= p99_budget_ms]
+    if within:
+        return max(within, key=lambda result: result['requests_per_second'])
+    return min(measured, key=lambda result: result['p99_ms']) if measured else None
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--duration', type=float, default=20, help='Seconds of load per layout')
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4], help='Request threads per process to try')
+    parser.add_argument('--p99-budget-ms', type=float, default=1000)
+    parser.add_argument('--stand-ins', action='store_true', help='Use the offline stand-in encoders')
+    parser.add_argument('--output', help='Write all results as JSON to this path')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker(args.threads[0], args.duration, args.stand_ins)
+        return
+
+    cores = available_cores()
+    layouts = candidate_layouts(cores, args.threads)
+    logger.info(f"Trying {len(layouts)} layouts on {len(cores)} cores, {args.duration:g} s each")
+
+    results = []
+    for layout in layouts:
+        result = dict(layout, **run_layout(layout, args.duration, args.stand_ins))
+        results.append(result)
+        p99 = f"{result['p99_ms']:.1f}" if result['p99_ms'] is not None else '-'
+        print(f"processes={layout['processes']:<3} threads={layout['threads']:<3} intra_op={layout['intra_op']:<3} "
+              f"pinned={'yes' if layout['image_cores'] else 'no ':<4} "
+              f"{result['requests_per_second']:8.2f} req/s  p99={p99} ms", flush=True)
+
+    best = best_layout(results, args.p99_budget_ms)
+    if best is None:
+        logger.error("No layout completed a request")
+        sys.exit(1)
+    if best['p99_ms'] > args.p99_budget_ms:
+        logger.warning(f"No layout met the {args.p99_budget_ms:g} ms p99 budget, showing the lowest p99")
+    print(f"\nBest layout: {best['requests_per_second']:.2f} req/s, p50 {best['p50_ms']:.1f} ms, "
+          f"p99 {best['p99_ms']:.1f} ms")
+    for name, value in layout_env(best).items():
+        print(f"{name}={value}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'cores': len(cores), 'duration': args.duration, 'p99_budget_ms': args.p99_budget_ms,
+                       'results': results, 'best': best}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
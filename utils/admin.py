@@ -0,0 +1,12 @@
+import hmac
+
+from config import ADMIN_TOKEN
+
+def check_admin(headers):
+    """None when the request may use an admin endpoint, else (error message, HTTP status)"""
+    if not ADMIN_TOKEN:
+        return 'Admin endpoints disabled, set ADMIN_TOKEN to enable them', 404
+    scheme, _, token = (headers.get('Authorization') or '').partition(' ')
+    if scheme.lower() != 'bearer' or not hmac.compare_digest(token.strip().encode(), ADMIN_TOKEN.encode()):
+        return 'Admin token required', 401
+    return None
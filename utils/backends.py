@@ -0,0 +1,121 @@
+import importlib.util
+import json
+import os
+
+import torch
+import torch.nn as nn
+
+BACKENDS = ('eager', 'compile', 'torchscript', 'onnx')
+EXPORTED_FILES = {'torchscript': 'model.ts', 'onnx': 'model.onnx'}
+# Optional packages (requirements-onnx.txt) a backend needs to run or to export
+RUNTIME_PACKAGES = {'onnx': 'onnxruntime'}
+EXPORT_PACKAGES = {'onnx': 'onnx'}
+
+# Positional inputs of the exported graphs
+FUSION_INPUTS = ['tab', 'img', 'text']
+IMAGE_ENCODER_INPUTS = ['pixel_values']
+TEXT_ENCODER_INPUTS = ['input_ids', 'attention_mask']
+
+class EncoderGraph(nn.Module):
+    """HF encoder reduced to positional tensors in, last_hidden_state out, for export"""
+    def __init__(self, model, input_names):
+        super().__init__()
+        self.model = model
+        self.input_names = input_names
+
+    def forward(self, *inputs):
+        return self.model(**dict(zip(self.input_names, inputs)), return_dict=False)[0]
+
+class ExportedModel:
+    """Runs a TorchScript module or ONNX Runtime session like the eager module.
+
+    Fusion graphs are called positionally and return a tensor; encoder graphs
+    are called with the HF keyword inputs and return an object with
+    last_hidden_state, so the processors need no backend-specific code.
+    """
+    def __init__(self, run, input_names, encoder):
+        self._run = run
+        self.input_names = input_names
+        self.encoder = encoder
+
+    def __call__(self, *args, **kwargs):
+        inputs = list(args) + [kwargs[name] for name in self.input_names[len(args):]]
+        output = self._run(inputs)
+        if not self.encoder:
+            return output
+        from transformers.modeling_outputs import BaseModelOutput
+        return BaseModelOutput(last_hidden_state=output)
+
+    def to(self, device):
+        # Exported graphs are loaded for CPU
+        return self
+
+    def eval(self):
+        return self
+
+def require_backend(backend, export=False):
+    """Raise ImportError naming the missing package when a backend's optional dependency is not installed"""
+    package = (EXPORT_PACKAGES if export else RUNTIME_PACKAGES).get(backend)
+    if package is not None and importlib.util.find_spec(package) is None:
+        action = 'exporting to' if export else 'running'
+        raise ImportError(f"{action.capitalize()} the {backend} backend needs the {package} package, "
+                          f"install it with pip install -r requirements-onnx.txt")
+
+def exported_path(root, name, backend):
+    return os.path.join(root, name.replace('/', '--'), EXPORTED_FILES[backend])
+
+def has_exported(root, name, backend):
+    return root is not None and backend in EXPORTED_FILES and os.path.exists(exported_path(root, name, backend))
+
+def export_model(model, example_inputs, input_names, backend, path):
+    """Trace a module with positional inputs to a TorchScript or ONNX file"""
+    if backend not in EXPORTED_FILES:
+        raise ValueError(f"Cannot export to backend {backend!r}, expected one of {list(EXPORTED_FILES)}")
+    require_backend(backend, export=True)
+    model.eval()
+    example_inputs = tuple(example_inputs)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with torch.no_grad():
+        if backend == 'torchscript':
+            traced = torch.jit.freeze(torch.jit.trace(model, example_inputs, check_trace=False))
+            torch.jit.save(traced, path, _extra_files={'input_names.json': json.dumps(input_names)})
+        else:
+            # Batch size always varies; token sequences vary in length too
+            dynamic_axes = {'output': {0: 'batch'}}
+            for name in input_names:
+                dynamic_axes[name] = {0: 'batch', 1: 'sequence'} if name in TEXT_ENCODER_INPUTS else {0: 'batch'}
+            if set(input_names) & set(TEXT_ENCODER_INPUTS):
+                dynamic_axes['output'][1] = 'sequence'
+            torch.onnx.export(model, example_inputs, path, input_names=input_names, output_names=['output'],
+                              dynamic_axes=dynamic_axes, opset_version=17)
+    return path
+
+def load_exported(path, backend, encoder=False):
+    """Load a graph written by export_model for CPU inference"""
+    if backend == 'torchscript':
+        extra_files = {'input_names.json': ''}
+        module = torch.jit.load(path, map_location='cpu', _extra_files=extra_files)
+        module.eval()
+        input_names = json.loads(extra_files['input_names.json'])
+
+        def run(inputs):
+            with torch.no_grad():
+                return module(*inputs)
+    elif backend == 'onnx':
+        require_backend(backend)
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = torch.get_num_threads()
+        session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        input_names = [node.name for node in session.get_inputs()]
+
+        def run(inputs):
+            feed = {name: tensor.detach().cpu().numpy() for name, tensor in zip(input_names, inputs)}
+            return torch.from_numpy(session.run(None, feed)[0])
+    else:
+        raise ValueError(f"Cannot load backend {backend!r}, expected one of {list(EXPORTED_FILES)}")
+    return ExportedModel(run, input_names, encoder)
+
+def compile_model(model):
+    """torch.compile with dynamic shapes, since batch and sequence sizes vary"""
+    return torch.compile(model, dynamic=True)
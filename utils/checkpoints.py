@@ -0,0 +1,35 @@
+import hashlib
+import json
+import os
+
+SOURCE_SUFFIX = '.source.json'
+
+_digests = {}
+
+def checkpoint_digest(path):
+    """SHA-256 of a checkpoint file, memoised on its path, size and mtime"""
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    digest = _digests.get(memo_key)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha.update(block)
+        digest = _digests[memo_key] = sha.hexdigest()
+    return digest
+
+def record_source(artifact_path, checkpoint_path):
+    """Note next to a derived artifact (int8, exported or shared weights) which checkpoint it was built from"""
+    with open(artifact_path + SOURCE_SUFFIX, 'w') as f:
+        json.dump({'checkpoint': os.path.abspath(checkpoint_path),
+                   'sha256': checkpoint_digest(checkpoint_path)}, f, indent=2)
+
+def built_from(artifact_path, checkpoint_path):
+    """Whether the artifact was recorded as built from this exact checkpoint"""
+    try:
+        with open(artifact_path + SOURCE_SUFFIX) as f:
+            source = json.load(f)
+        return source.get('sha256') == checkpoint_digest(checkpoint_path)
+    except (OSError, ValueError):
+        return False
@@ -0,0 +1,160 @@
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import torch
+
+from config import TORCH_INTRA_OP_THREADS, TORCH_INTEROP_THREADS, TOKENIZERS_PARALLELISM
+from config import IMAGE_ENCODER_CORES, TEXT_ENCODER_CORES
+from utils.metrics import metrics, observe_stage
+
+logger = logging.getLogger(__name__)
+
+# Sum of the branch times over the wall time of the section running them:
+# 1.0 when the branches ran one after another, up to the branch count
+BRANCH_OVERLAP = metrics.histogram(
+    'house_price_branch_overlap', 'Branch time over wall time of one parallel branch section',
+    (1.0, 1.1, 1.25, 1.5, 1.75, 2.0, 2.5, 3.0))
+
+_configured = None
+_configure_lock = threading.Lock()
+
+def parse_cores(spec):
+    """Core IDs of a spec like "0-3,8", or None for an empty spec"""
+    if not spec or not spec.strip():
+        return None
+    cores = set()
+    for part in spec.split(','):
+        start, _, end = part.strip().partition('-')
+        try:
+            cores.update(range(int(start), int(end or start) + 1))
+        except ValueError:
+            raise ValueError(f"Invalid core set {spec!r}, expected e.g. '0-3,8'")
+    if hasattr(os, 'sched_getaffinity'):
+        unavailable = cores - os.sched_getaffinity(0)
+        if unavailable:
+            raise ValueError(f"Cores {sorted(unavailable)} of {spec!r} are not available to this process")
+    return frozenset(cores)
+
+def configure_process():
+    """Apply the config.py thread settings to this process, once.
+
+    Call before the first tokenizer or torch op runs: the inter-op pool cannot
+    be resized after that. With pinned encoders and no explicit intra-op
+    count, torch uses as many threads as the larger encoder core set.
+    Returns the settings in effect.
+    """
+    global _configured
+    with _configure_lock:
+        if _configured is not None:
+            return _configured
+        os.environ['TOKENIZERS_PARALLELISM'] = TOKENIZERS_PARALLELISM
+
+        intra_op = TORCH_INTRA_OP_THREADS
+        core_sets = [cores for cores in map(parse_cores, (IMAGE_ENCODER_CORES, TEXT_ENCODER_CORES)) if cores]
+        if not intra_op and core_sets:
+            intra_op = max(len(cores) for cores in core_sets)
+        if intra_op:
+            torch.set_num_threads(intra_op)
+        if TORCH_INTEROP_THREADS:
+            try:
+                torch.set_num_interop_threads(TORCH_INTEROP_THREADS)
+            except RuntimeError as e:
+                logger.warning(f"Could not set inter-op threads, keeping {torch.get_num_interop_threads()}: {str(e)}")
+
+        _configured = {
+            'intra_op_threads': torch.get_num_threads(),
+            'interop_threads': torch.get_num_interop_threads(),
+            'tokenizers_parallelism': TOKENIZERS_PARALLELISM,
+            'image_encoder_cores': IMAGE_ENCODER_CORES or None,
+            'text_encoder_cores': TEXT_ENCODER_CORES or None,
+        }
+        logger.info(f"CPU concurrency: {_configured}")
+        return _configured
+
+class CorePinnedRunner:
+    """Runs calls on one thread pinned to a core set, or inline without one.
+
+    Linux applies sched_setaffinity to the calling thread, and the intra-op
+    worker threads torch starts from the pinned thread inherit its affinity,
+    so an encoder forward stays on its cores. Calls from several request
+    threads queue for the pinned thread.
+    """
+    def __init__(self, cores, name):
+        self.cores = cores
+        self._pool = None
+        if cores and not hasattr(os, 'sched_setaffinity'):
+            logger.warning(f"Core pinning is not supported on this platform, {name} runs unpinned")
+        elif cores:
+            self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name,
+                                            initializer=os.sched_setaffinity, initargs=(0, cores))
+
+    def run(self, fn, *args, **kwargs):
+        if self._pool is None:
+            return fn(*args, **kwargs)
+        return self._pool.submit(contextvars.copy_context().run, fn, *args, **kwargs).result()
+
+class BranchExecutor:
+    """Runs the independent branches of a prediction (image, text, tabular) side by side.
+
+    Each branch has its own pool of ``budgets[name]`` threads, so the calls
+    of one branch queue only behind each other. A branch without threads
+    runs in the calling thread while the pooled ones are in flight. Every
+    run is recorded as the 'branches' stage, and the ratio of branch time to
+    wall time goes into BRANCH_OVERLAP and ``stats()``.
+    """
+    def __init__(self, budgets):
+        self.budgets = dict(budgets)
+        self._pools = {name: ThreadPoolExecutor(max_workers=threads, thread_name_prefix=f'{name}-branch')
+                       for name, threads in self.budgets.items() if threads > 0}
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.branch_seconds = 0.0
+        self.wall_seconds = 0.0
+
+    def run(self, **branches):
+        """Call every zero-argument branch and return {name: result} once all have finished"""
+        start = time.perf_counter()
+        # Branches run in copies of the caller's context so their stages are
+        # attributed to the requests being served
+        futures = {name: self._pools[name].submit(contextvars.copy_context().run, _timed, fn)
+                   for name, fn in branches.items() if name in self._pools}
+        try:
+            timed = {name: _timed(fn) for name, fn in branches.items() if name not in futures}
+        except BaseException:
+            for future in futures.values():
+                future.cancel()
+            raise
+        finally:
+            # A failed inline branch is raised only once the pooled ones have
+            # stopped, so no encoder forward outlives its request
+            wait(futures.values())
+        timed.update((name, future.result()) for name, future in futures.items())
+        wall = time.perf_counter() - start
+
+        branch_seconds = sum(seconds for _, seconds in timed.values())
+        observe_stage('branches', wall, len(branches))
+        BRANCH_OVERLAP.observe(branch_seconds / wall if wall > 0 else 1.0)
+        with self._lock:
+            self.runs += 1
+            self.branch_seconds += branch_seconds
+            self.wall_seconds += wall
+        return {name: value for name, (value, _) in timed.items()}
+
+    def stats(self):
+        with self._lock:
+            return {
+                'threads': self.budgets,
+                'runs': self.runs,
+                'branch_ms': self.branch_seconds * 1000,
+                'wall_ms': self.wall_seconds * 1000,
+                # 1.0 means the branches ran one after another
+                'overlap': self.branch_seconds / self.wall_seconds if self.wall_seconds > 0 else None,
+            }
+
+def _timed(fn):
+    start = time.perf_counter()
+    return fn(), time.perf_counter() - start
@@ -1,16 +1,19 @@
-import torch
-from torch.utils.data import Dataset
+from config import FEATURE_NAMES, IMAGE_COLUMN, TEXT_COLUMN, PHOTO_PATH_SEPARATOR
 
-class InferenceDataset(Dataset):
-    def __init__(self, tabular_data, image_features, text_features):
-        self.tabular_data = torch.FloatTensor(tabular_data.values)
-        self.image_features = torch.FloatTensor(image_features.values)
-        self.text_features = torch.FloatTensor(text_features.values)
+def records_from_frame(frame, image_column=IMAGE_COLUMN, text_column=TEXT_COLUMN):
+    """Turn a listings DataFrame into (tabular_data, image, text) records"""
+    missing = [col for col in FEATURE_NAMES + [image_column, text_column] if col not in frame.columns]
+    if missing:
+        raise ValueError(f"Missing required columns: {', '.join(missing)}")
 
-    def __len__(self):
-        return len(self.tabular_data)
-    
-    def __getitem__(self, index):
-        return self.tabular_data[index], self.image_features[index], self.text_features[index]    
-    
+    tabular = frame[FEATURE_NAMES].to_dict(orient='records')
+    images = [photo_paths(value) for value in frame[image_column].tolist()]
+    return list(zip(tabular, images, frame[text_column].fillna('').astype(str).tolist()))
+
+def photo_paths(value):
+    """One image path, or the list of photo paths of a multi-photo listing"""
+    if isinstance(value, str):
+        return value.split(PHOTO_PATH_SEPARATOR) if PHOTO_PATH_SEPARATOR in value else value
+    # Parquet list columns arrive as arrays
+    return list(value) if hasattr(value, '__len__') else value
 
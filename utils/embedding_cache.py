@@ -0,0 +1,218 @@
+import fcntl
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+class EmbeddingCache:
+    """Content-addressed cache for encoder embeddings.
+
+    Entries are keyed by a SHA-256 digest of the model name and the encoder
+    input (image bytes or preprocessed text). Lookups go through an in-memory
+    LRU tier first and then through an optional memory-mapped float16 tier on
+    disk that survives restarts.
+    """
+    def __init__(self, dim, max_entries=4096, disk_dir=None, disk_capacity=100000):
+        self.dim = dim
+        self.max_entries = max_entries
+        self.disk = _DiskTier(disk_dir, dim, disk_capacity) if disk_dir else None
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model_name, content):
+        """Digest of the model name and the raw encoder input"""
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        digest = hashlib.sha256(model_name.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(content)
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Return the cached embedding for ``key`` or None"""
+        with self._lock:
+            embedding = self._memory.get(key)
+            if embedding is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return embedding
+
+            if self.disk is not None:
+                embedding = self.disk.get(key)
+                if embedding is not None:
+                    self._remember(key, embedding)
+                    self.disk_hits += 1
+                    return embedding
+
+            self.misses += 1
+            return None
+
+    def put(self, key, embedding):
+        """Store a 1-D float embedding in every enabled tier"""
+        embedding = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            self._remember(key, embedding)
+            if self.disk is not None:
+                self.disk.put(key, embedding)
+
+    def get_or_compute(self, keys, inputs, compute):
+        """Embeddings for ``inputs``, calling ``compute`` only on cache misses.
+
+        ``compute`` receives the list of missing inputs (each distinct key
+        once) and must return one embedding per input.
+        """
+        results = [self.get(key) for key in keys]
+
+        pending = {}
+        for i, (key, embedding) in enumerate(zip(keys, results)):
+            if embedding is None:
+                pending.setdefault(key, i)
+
+        if pending:
+            computed = compute([inputs[i] for i in pending.values()])
+            computed = dict(zip(pending, np.asarray(computed, dtype=np.float32)))
+            for key, embedding in computed.items():
+                self.put(key, embedding)
+            results = [computed[key] if embedding is None else embedding
+                       for key, embedding in zip(keys, results)]
+        return np.stack(results)
+
+    def stats(self):
+        """Hit and miss counters for both tiers"""
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            hits = self.memory_hits + self.disk_hits
+            return {
+                'memory_entries': len(self._memory),
+                'disk_entries': len(self.disk) if self.disk is not None else 0,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': hits / lookups if lookups else 0.0,
+            }
+
+    def flush(self):
+        """Write pending disk tier pages back to their files"""
+        if self.disk is not None:
+            with self._lock:
+                self.disk.flush()
+
+    def _remember(self, key, embedding):
+        if self.max_entries <= 0:
+            return
+        self._memory[key] = embedding
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+class _DiskTier:
+    """Fixed-capacity ring of float16 embeddings in memory-mapped files.
+
+    ``keys.bin`` holds the hex digest for each slot and ``cursor.bin``
+    the total number of writes, so the index can be rebuilt on open. Once
+    the ring is full the oldest slot is overwritten.
+
+    Worker processes may share a directory. Writes and cursor updates are
+    serialised by an exclusive lock on ``cache.lock``. On a miss, a process
+    indexes the slots written since the cursor it last saw, so entries from
+    other workers are found without a restart. Each process's index can go
+    stale when another process reuses a slot, so a read only counts when the
+    slot still holds the key after the vector has been copied.
+    """
+    def __init__(self, directory, dim, capacity):
+        os.makedirs(directory, exist_ok=True)
+        meta_path = os.path.join(directory, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta['dim'] != dim:
+                raise ValueError(f"Embedding cache in {directory} has dim {meta['dim']}, expected {dim}")
+            capacity = meta['capacity']
+        else:
+            with open(meta_path, 'w') as f:
+                json.dump({'dim': dim, 'capacity': capacity}, f)
+
+        self.capacity = capacity
+        self.embeddings = _open_memmap(os.path.join(directory, 'embeddings.f16'), np.float16, (capacity, dim))
+        self.keys = _open_memmap(os.path.join(directory, 'keys.bin'), 'S64', (capacity,))
+        self.cursor = _open_memmap(os.path.join(directory, 'cursor.bin'), np.int64, (1,))
+        self._lock_file = open(os.path.join(directory, 'cache.lock'), 'a')
+
+        self.index = {}
+        # Key this process indexed for each slot, to drop it when the slot is reused
+        self._slot_keys = {}
+        # Cursor value up to which this process has indexed the writes
+        self._seen = 0
+        self._sync()
+
+    def __len__(self):
+        return len(self.index)
+
+    def get(self, key):
+        slot = self.index.get(key)
+        if slot is None and int(self.cursor[0]) != self._seen:
+            # Other processes wrote since we last looked
+            self._sync()
+            slot = self.index.get(key)
+        if slot is None:
+            return None
+        embedding = self.embeddings[slot].astype(np.float32)
+        # Writers clear the key before touching the vector, so a slot another
+        # process reused (or is rewriting) no longer carries this key
+        if self.keys[slot] != key.encode('ascii'):
+            self.index.pop(key, None)
+            return None
+        return embedding
+
+    def put(self, key, embedding):
+        if key in self.index:
+            return
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            cursor = int(self.cursor[0])
+            slot = cursor % self.capacity
+            # Write the vector before its key so a torn write is never indexed
+            self.keys[slot] = b''
+            self.embeddings[slot] = embedding
+            self.keys[slot] = key.encode('ascii')
+            self.cursor[0] = cursor + 1
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+        self._index_slot(slot, key)
+        if self._seen == cursor:
+            self._seen = cursor + 1
+
+    def _sync(self):
+        """Index the slots written since the cursor this process last saw"""
+        cursor = int(self.cursor[0])
+        # Only the last ``capacity`` writes are still in the ring
+        for write in range(max(self._seen, cursor - self.capacity), cursor):
+            slot = write % self.capacity
+            key = self.keys[slot]
+            self._index_slot(slot, key.decode('ascii') if key else None)
+        self._seen = cursor
+
+    def _index_slot(self, slot, key):
+        old_key = self._slot_keys.pop(slot, None)
+        if old_key is not None and self.index.get(old_key) == slot:
+            del self.index[old_key]
+        if key:
+            self.index[key] = slot
+            self._slot_keys[slot] = key
+
+    def flush(self):
+        self.embeddings.flush()
+        self.keys.flush()
+        self.cursor.flush()
+
+def _open_memmap(path, dtype, shape):
+    mode = 'r+' if os.path.exists(path) else 'w+'
+    return np.memmap(path, dtype=dtype, mode=mode, shape=shape)
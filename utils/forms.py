@@ -0,0 +1,65 @@
+import math
+
+import config
+
+class InvalidRequest(ValueError):
+    """A malformed request, e.g. a form with a missing field; the message is returned to the client"""
+
+def parse_prediction_form(fields, files):
+    """Tabular features, photo uploads and title of a /predict form.
+
+    Works with Flask's ``request.form``/``request.files`` and with a
+    Starlette form passed as both mappings. Raises InvalidRequest for missing
+    fields and ValueError for non-numeric features.
+    """
+    tabular_data = parse_tabular_form(fields)
+    image_files, text = parse_listing_form(fields, files)
+    return tabular_data, image_files, text
+
+def parse_tabular_form(fields):
+    """The config.FEATURE_NAMES values of a form as floats"""
+    tabular_data = {}
+    for feature in config.FEATURE_NAMES:
+        value = fields.get(feature)
+        if value is None:
+            raise InvalidRequest(f'Missing required feature: {feature}')
+        tabular_data[feature] = float(value)
+    return tabular_data
+
+def parse_listing_form(fields, files):
+    """Photo uploads (one or more ``image`` fields) and title of a form"""
+    image_files = [f for f in files.getlist('image') if hasattr(f, 'filename')]
+    if not image_files:
+        raise InvalidRequest('No image file provided')
+    if any(f.filename == '' for f in image_files):
+        raise InvalidRequest('No image selected')
+
+    text = fields.get('title', '')
+    if not text:
+        raise InvalidRequest('No title text provided')
+    return image_files, text
+
+def parse_sweep_spec(spec):
+    """Base features, grid and optional listing ID of a /sweep request.
+
+    ``spec`` is the decoded JSON ``{"base": {...}, "grid": {feature: [values]},
+    "listing_id": ...}``. Raises InvalidRequest when it is malformed or the
+    grid has more than config.MAX_SWEEP_VARIANTS combinations.
+    """
+    if not isinstance(spec, dict):
+        raise InvalidRequest('Sweep must be a JSON object')
+    base = spec.get('base')
+    grid = spec.get('grid')
+    if not isinstance(base, dict):
+        raise InvalidRequest('Sweep needs a "base" object of feature values')
+    if not isinstance(grid, dict) or not grid:
+        raise InvalidRequest('Sweep needs a "grid" object mapping features to lists of values')
+    for feature, values in grid.items():
+        if not isinstance(values, list) or not values:
+            raise InvalidRequest(f'Grid values for {feature} must be a non-empty list')
+
+    variants = math.prod(len(values) for values in grid.values())
+    if variants > config.MAX_SWEEP_VARIANTS:
+        raise InvalidRequest(f'Grid has {variants} variants, at most {config.MAX_SWEEP_VARIANTS} allowed')
+    listing_id = spec.get('listing_id')
+    return base, grid, None if listing_id is None else str(listing_id)
@@ -0,0 +1,189 @@
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+def _stack(tensors):
+    """Stack per-branch parameters into one detached tensor"""
+    return torch.stack([t.detach() for t in tensors]).contiguous()
+
+class StackedResidualBlock(nn.Module):
+    """ResidualBlocks of several branches run as batched matmuls.
+
+    linear1 and the shortcut read the same input, so their weights are
+    concatenated and applied with one bmm. Inputs narrower than the widest
+    branch are zero padded, which leaves the products unchanged.
+    """
+    def __init__(self, blocks):
+        super().__init__()
+        in_dim = max(block.linear1.in_features for block in blocks)
+        self.out_dim = blocks[0].linear1.out_features
+        self.gelu = isinstance(blocks[0].activation, nn.GELU)
+        self.identity_shortcut = isinstance(blocks[0].shortcut, nn.Identity)
+
+        weights, biases = [], []
+        for block in blocks:
+            weight = block.linear1.weight.detach()
+            bias = block.linear1.bias.detach()
+            if not self.identity_shortcut:
+                weight = torch.cat([weight, block.shortcut.weight.detach()])
+                bias = torch.cat([bias, block.shortcut.bias.detach()])
+            weights.append(F.pad(weight, (0, in_dim - weight.shape[1])).t())
+            biases.append(bias.unsqueeze(0))
+        self.in_dim = in_dim
+        self.weight_in = nn.Parameter(_stack(weights), requires_grad=False)
+        self.bias_in = nn.Parameter(_stack(biases), requires_grad=False)
+        self.weight_out = nn.Parameter(_stack([b.linear2.weight.t() for b in blocks]), requires_grad=False)
+        self.bias_out = nn.Parameter(_stack([b.linear2.bias.unsqueeze(0) for b in blocks]), requires_grad=False)
+        self.norm1_weight = nn.Parameter(_stack([b.norm1.weight.unsqueeze(0) for b in blocks]), requires_grad=False)
+        self.norm1_bias = nn.Parameter(_stack([b.norm1.bias.unsqueeze(0) for b in blocks]), requires_grad=False)
+        self.norm2_weight = nn.Parameter(_stack([b.norm2.weight.unsqueeze(0) for b in blocks]), requires_grad=False)
+        self.norm2_bias = nn.Parameter(_stack([b.norm2.bias.unsqueeze(0) for b in blocks]), requires_grad=False)
+        self.eps1 = blocks[0].norm1.eps
+        self.eps2 = blocks[0].norm2.eps
+
+    def _activation(self, x):
+        return F.gelu(x) if self.gelu else F.relu(x)
+
+    def forward(self, x, branches=slice(None)):
+        # x: [branches, batch, in_dim]; ``branches`` selects a subset of them
+        # Rows past the input width only ever meet zero padding
+        h = torch.baddbmm(self.bias_in[branches], x, self.weight_in[branches, :x.shape[-1]])
+        if self.identity_shortcut:
+            residual = x
+        else:
+            h, residual = h[..., :self.out_dim], h[..., self.out_dim:]
+        h = F.layer_norm(h, (self.out_dim,), eps=self.eps1) * self.norm1_weight[branches] + self.norm1_bias[branches]
+        h = self._activation(h)
+        h = torch.baddbmm(self.bias_out[branches], h, self.weight_out[branches])
+        h = F.layer_norm(h, (self.out_dim,), eps=self.eps2) * self.norm2_weight[branches] + self.norm2_bias[branches]
+        return self._activation(h + residual)
+
+class FusedFusionModel(nn.Module):
+    """Inference-only EnhancedFusionModel with the same outputs and fewer kernels.
+
+    Built from a loaded EnhancedFusionModel by from_model(). Every attention
+    runs over a sequence of length one, where the softmax weight is exactly 1,
+    so each is out_proj(v_proj(x)). All six fold into one 3*d x 3*d linear
+    map over the concatenated branch features, together with the residual.
+    The three branch stacks run as batched matmuls and the three bilinear
+    interactions as one bmm against pre-reshaped weights.
+    """
+    def __init__(self, model):
+        super().__init__()
+        d = model.common_dim
+        self.common_dim = d
+        branches = [model.tabular_block, model.image_block, model.text_block]
+        self.branch_blocks = nn.ModuleList(
+            StackedResidualBlock([branch[i] for branch in branches]) for i in range(len(branches[0])))
+
+        # Cross attention: [tab, img, text] -> tab + 0.5 * (tab2img + tab2text), ...
+        attentions = {
+            (0, 1): model.tab2img_attn, (0, 2): model.tab2text_attn,
+            (1, 0): model.img2tab_attn, (1, 2): model.img2text_attn,
+            (2, 0): model.text2tab_attn, (2, 1): model.text2img_attn,
+        }
+        weight = torch.eye(3 * d)
+        bias = torch.zeros(3 * d)
+        for (query, source), attn in attentions.items():
+            value_weight = attn.in_proj_weight.detach()[2 * d:]
+            value_bias = attn.in_proj_bias.detach()[2 * d:]
+            out_weight = attn.out_proj.weight.detach()
+            out_bias = attn.out_proj.bias.detach()
+            rows = slice(query * d, (query + 1) * d)
+            weight[rows, source * d:(source + 1) * d] += 0.5 * out_weight @ value_weight
+            bias[rows] += 0.5 * (out_weight @ value_bias + out_bias)
+        self.attn_weight = nn.Parameter(weight, requires_grad=False)
+        self.attn_bias = nn.Parameter(bias, requires_grad=False)
+        attn_norms = [model.attn_norm_tab, model.attn_norm_img, model.attn_norm_text]
+        self.attn_norm_weight = nn.Parameter(_stack([n.weight for n in attn_norms]), requires_grad=False)
+        self.attn_norm_bias = nn.Parameter(_stack([n.bias for n in attn_norms]), requires_grad=False)
+        self.attn_eps = attn_norms[0].eps
+
+        # Bilinear y_k = x1 A_k x2 + b_k: x1 @ A gives [batch, k, d] rows to dot with x2
+        bilinears = [model.bilinear_tab_img, model.bilinear_tab_text, model.bilinear_img_text]
+        self.inter_dim = bilinears[0].out_features
+        self.bilinear_weight = nn.Parameter(
+            _stack([b.weight.permute(1, 0, 2).reshape(d, -1) for b in bilinears]), requires_grad=False)
+        self.bilinear_bias = nn.Parameter(_stack([b.bias.unsqueeze(0) for b in bilinears]), requires_grad=False)
+        inter_norms = [model.interaction_norm_tab_img, model.interaction_norm_tab_text, model.interaction_norm_img_text]
+        self.inter_norm_weight = nn.Parameter(_stack([n.weight.unsqueeze(0) for n in inter_norms]), requires_grad=False)
+        self.inter_norm_bias = nn.Parameter(_stack([n.bias.unsqueeze(0) for n in inter_norms]), requires_grad=False)
+        self.inter_eps = inter_norms[0].eps
+        # Left and right operands of the three interactions, as branch indices
+        self.register_buffer('bilinear_left', torch.tensor([0, 0, 1]), persistent=False)
+        self.register_buffer('bilinear_right', torch.tensor([1, 2, 2]), persistent=False)
+
+        # Gate k scales segment k of the combined features
+        gate = model.fusion_gate[0]
+        self.gate_weight = nn.Parameter(gate.weight.detach().clone(), requires_grad=False)
+        self.gate_bias = nn.Parameter(gate.bias.detach().clone(), requires_grad=False)
+        segments = [d] * 3 + [self.inter_dim] * 3
+        self.register_buffer('gate_index', torch.repeat_interleave(
+            torch.arange(len(segments)), torch.tensor(segments)), persistent=False)
+
+        # Final head: Linear, GELU, LayerNorm, (Dropout), ResidualBlock, Linear
+        head, _, head_norm, _, head_block, out = model.final
+        self.head_weight = nn.Parameter(head.weight.detach().clone(), requires_grad=False)
+        self.head_bias = nn.Parameter(head.bias.detach().clone(), requires_grad=False)
+        self.head_norm_weight = nn.Parameter(head_norm.weight.detach().clone(), requires_grad=False)
+        self.head_norm_bias = nn.Parameter(head_norm.bias.detach().clone(), requires_grad=False)
+        self.head_eps = head_norm.eps
+        self.head_block = StackedResidualBlock([head_block])
+        self.out_weight = nn.Parameter(out.weight.detach().clone(), requires_grad=False)
+        self.out_bias = nn.Parameter(out.bias.detach().clone(), requires_grad=False)
+        self.eval()
+
+    @classmethod
+    def from_model(cls, model):
+        """Fold a loaded EnhancedFusionModel into the fused layout"""
+        return cls(model)
+
+    def forward(self, tab, img, text):
+        batch = tab.shape[0]
+        x = self._branches((tab, img, text), slice(None))
+        return self._fuse(x.transpose(0, 1).reshape(batch, 3 * self.common_dim))
+
+    def encode_context(self, img, text):
+        """Image and text branch outputs, to reuse across tabular variants"""
+        img_feat, text_feat = self._branches((img, text), slice(1, 3))
+        return img_feat, text_feat
+
+    def forward_tabular(self, tab, img_feat, text_feat):
+        """Predict from tabular inputs and encode_context outputs (one row broadcasts to the batch)"""
+        batch = tab.shape[0]
+        tab_feat = self._branches((tab,), slice(0, 1))[0]
+        return self._fuse(torch.cat([tab_feat, img_feat.expand(batch, -1), text_feat.expand(batch, -1)], dim=1))
+
+    def _branches(self, inputs, branches):
+        # Branch stacks: [branches, batch, widest input dim], narrower inputs zero padded
+        width = max(t.shape[1] for t in inputs)
+        x = torch.stack([F.pad(t, (0, width - t.shape[1])) for t in inputs])
+        for block in self.branch_blocks:
+            x = block(x, branches)
+        return x
+
+    def _fuse(self, feat):
+        batch = feat.shape[0]
+        d = self.common_dim
+
+        # All six attentions plus the residual in one matmul, then the three norms
+        attn = F.linear(feat, self.attn_weight, self.attn_bias).view(batch, 3, d)
+        attn = F.layer_norm(attn, (d,), eps=self.attn_eps) * self.attn_norm_weight + self.attn_norm_bias
+
+        # Bilinear interactions [3, batch, inter_dim]
+        branches = attn.transpose(0, 1)
+        left = branches.index_select(0, self.bilinear_left)
+        right = branches.index_select(0, self.bilinear_right)
+        projected = torch.bmm(left, self.bilinear_weight).view(3, batch, self.inter_dim, d)
+        inter = torch.matmul(projected, right.unsqueeze(-1)).squeeze(-1) + self.bilinear_bias
+        inter = F.gelu(F.layer_norm(inter, (self.inter_dim,), eps=self.inter_eps)
+                       * self.inter_norm_weight + self.inter_norm_bias)
+
+        combined = torch.cat([attn.reshape(batch, 3 * d), inter.transpose(0, 1).reshape(batch, -1)], dim=1)
+        gates = torch.sigmoid(F.linear(combined, self.gate_weight, self.gate_bias))
+        weighted = combined * gates.index_select(1, self.gate_index)
+
+        h = F.gelu(F.linear(weighted, self.head_weight, self.head_bias))
+        h = F.layer_norm(h, (h.shape[1],), self.head_norm_weight, self.head_norm_bias, self.head_eps)
+        h = self.head_block(h.unsqueeze(0)).squeeze(0)
+        return F.linear(h, self.out_weight, self.out_bias)
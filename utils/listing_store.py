@@ -0,0 +1,153 @@
+import fcntl
+import os
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+# Listing IDs are stored as UTF-8 in fixed-width slots
+MAX_ID_BYTES = 64
+
+class ListingEmbeddingStore:
+    """DINOv2 and E5 embeddings of known listings, keyed by listing ID.
+
+    Embeddings live in two float32 memory-mapped arrays with a parallel array
+    of IDs. ``header.bin`` holds the row count and capacity. Rows are appended
+    (or overwritten in place for known IDs) under an exclusive file lock, so
+    several worker processes can share one store. A process picks up rows
+    another one appended the next time it misses an ID.
+    """
+    def __init__(self, directory, image_dim, text_dim, initial_capacity=1024):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.image_dim = image_dim
+        self.text_dim = text_dim
+
+        self._lock = threading.Lock()
+        self._lock_path = os.path.join(directory, 'store.lock')
+        self._header = _open_memmap(os.path.join(directory, 'header.bin'), np.int64, (2,))
+        with self._file_lock():
+            if self._header[1] == 0:
+                self._header[1] = initial_capacity
+        self._capacity = 0
+        self._count = 0
+        self._index = {}
+        self._refresh()
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, listing_id):
+        return self._slot(listing_id) is not None
+
+    def get(self, listing_id):
+        """(image_embedding, text_embedding) of a listing, or None when unknown"""
+        slot = self._slot(listing_id)
+        if slot is None:
+            return None
+        return np.array(self._images[slot]), np.array(self._texts[slot])
+
+    def get_many(self, listing_ids):
+        """Stacked image and text embeddings; raises KeyError naming unknown IDs"""
+        slots = [self._slot(listing_id) for listing_id in listing_ids]
+        missing = [listing_id for listing_id, slot in zip(listing_ids, slots) if slot is None]
+        if missing:
+            raise KeyError(f"Unknown listing IDs: {', '.join(map(str, missing[:10]))}")
+        return self._images[slots], self._texts[slots]
+
+    def upsert(self, listing_ids, image_embeddings, text_embeddings):
+        """Insert new listings and overwrite the embeddings of known ones"""
+        image_embeddings = np.asarray(image_embeddings, dtype=np.float32)
+        text_embeddings = np.asarray(text_embeddings, dtype=np.float32)
+        keys = [_encode_id(listing_id) for listing_id in listing_ids]
+        with self._lock, self._file_lock():
+            self._refresh_locked()
+            new = [key for key in dict.fromkeys(keys) if key not in self._index]
+            if self._count + len(new) > self._capacity:
+                self._grow(max(self._capacity * 2, self._count + len(new)))
+            for key, image, text in zip(keys, image_embeddings, text_embeddings):
+                slot = self._index.get(key)
+                if slot is None:
+                    slot = self._index[key] = self._count
+                    # Vectors first, then the ID, then the count that publishes the row
+                    self._images[slot] = image
+                    self._texts[slot] = text
+                    self._ids[slot] = key
+                    self._count += 1
+                else:
+                    self._images[slot] = image
+                    self._texts[slot] = text
+            self._header[0] = self._count
+        return len(new)
+
+    def missing(self, listing_ids):
+        """The IDs without stored embeddings, for incremental backfills"""
+        return [listing_id for listing_id in listing_ids if self._slot(listing_id) is None]
+
+    def flush(self):
+        with self._lock:
+            for array in (self._images, self._texts, self._ids, self._header):
+                array.flush()
+
+    def stats(self):
+        return {'listings': self._count, 'capacity': self._capacity, 'directory': self.directory}
+
+    def _slot(self, listing_id):
+        key = _encode_id(listing_id)
+        slot = self._index.get(key)
+        if slot is None and self._header[0] != self._count:
+            # Another process appended rows since we last looked
+            self._refresh()
+            slot = self._index.get(key)
+        return slot
+
+    def _refresh(self):
+        # Shared file lock, so the count and capacity are never read halfway
+        # through another process's _grow
+        with self._lock, self._file_lock(fcntl.LOCK_SH):
+            self._refresh_locked()
+
+    def _refresh_locked(self):
+        """Map the arrays at the current capacity and index rows appended since (file lock held)"""
+        capacity = int(self._header[1])
+        if capacity != self._capacity:
+            self._map(capacity)
+        count = int(self._header[0])
+        for slot in range(self._count, count):
+            self._index[bytes(self._ids[slot])] = slot
+        self._count = count
+
+    def _map(self, capacity):
+        self._images = _open_memmap(os.path.join(self.directory, 'image.f32'), np.float32, (capacity, self.image_dim))
+        self._texts = _open_memmap(os.path.join(self.directory, 'text.f32'), np.float32, (capacity, self.text_dim))
+        self._ids = _open_memmap(os.path.join(self.directory, 'ids.bin'), f'S{MAX_ID_BYTES}', (capacity,))
+        self._capacity = capacity
+
+    def _grow(self, capacity):
+        for array in (self._images, self._texts, self._ids):
+            array.flush()
+        self._header[1] = capacity
+        self._map(capacity)
+
+    @contextmanager
+    def _file_lock(self, mode=fcntl.LOCK_EX):
+        with open(self._lock_path, 'a') as f:
+            fcntl.flock(f, mode)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+def _encode_id(listing_id):
+    key = str(listing_id).encode('utf-8')
+    if not key or len(key) > MAX_ID_BYTES or key.endswith(b'\0'):
+        raise ValueError(f"Listing ID must be 1-{MAX_ID_BYTES} bytes of UTF-8: {listing_id!r}")
+    return key
+
+def _open_memmap(path, dtype, shape):
+    """Open (growing the file when needed) or create a memory-mapped array"""
+    size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    if not os.path.exists(path) or os.path.getsize(path) < size:
+        with open(path, 'ab') as f:
+            f.truncate(size)
+    return np.memmap(path, dtype=dtype, mode='r+', shape=shape)
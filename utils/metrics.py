@@ -0,0 +1,157 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Upper bounds in seconds, from a cached tabular row to a cold DINOv2 batch
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+def _format_labels(pairs):
+    """{name="value",...}, or nothing for an unlabelled series"""
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in pairs) + '}'
+
+class Histogram:
+    """Cumulative-bucket histogram with one series per label value tuple"""
+    def __init__(self, name, documentation, buckets, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labels = tuple(labels)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def render(self):
+        """Prometheus text exposition lines"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((labels, list(counts), total) for labels, (counts, total) in self._series.items())
+        for label_values, counts, total in series:
+            pairs = list(zip(self.labels, label_values))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                le = bound if bound == '+Inf' else repr(float(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(pairs + [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(pairs)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(pairs)} {cumulative}")
+        return lines
+
+class MetricsRegistry:
+    """Process-wide histograms plus gauges and counters read from callbacks at scrape time.
+
+    Each worker process keeps its own registry, so with several workers a
+    scrape shows the worker that answered it.
+    """
+    def __init__(self):
+        self._histograms = {}
+        self._callbacks = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name, documentation, buckets=LATENCY_BUCKETS, labels=()):
+        with self._lock:
+            if name not in self._histograms:
+                self._histograms[name] = Histogram(name, documentation, buckets, labels)
+            return self._histograms[name]
+
+    def gauge(self, name, documentation, read):
+        """Register read(), returning a number or {((label, value), ...): number}"""
+        with self._lock:
+            self._callbacks[name] = ('gauge', documentation, read)
+
+    def counter(self, name, documentation, read):
+        """Like gauge, for totals that only grow while the process lives (name them *_total)"""
+        with self._lock:
+            self._callbacks[name] = ('counter', documentation, read)
+
+    def render(self):
+        with self._lock:
+            histograms = list(self._histograms.values())
+            callbacks = list(self._callbacks.items())
+        lines = []
+        for histogram in histograms:
+            lines.extend(histogram.render())
+        for name, (kind, documentation, read) in callbacks:
+            values = read()
+            if values is None:
+                continue
+            lines.extend([f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"])
+            if not isinstance(values, dict):
+                values = {(): values}
+            for labels, value in values.items():
+                lines.append(f"{name}{_format_labels(labels)} {float(value)}")
+        return '\n'.join(lines) + '\n'
+
+class TimingCollector:
+    """Per-request breakdown: milliseconds and batch size of every stage it went through"""
+    def __init__(self):
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds, batch_size=None):
+        with self._lock:
+            entry = self._stages.setdefault(stage, {'ms': 0.0, 'calls': 0})
+            entry['ms'] += seconds * 1000
+            entry['calls'] += 1
+            if batch_size is not None:
+                entry['batch_size'] = batch_size
+
+    def summary(self):
+        with self._lock:
+            return {stage: dict(entry) for stage, entry in self._stages.items()}
+
+metrics = MetricsRegistry()
+STAGE_SECONDS = metrics.histogram(
+    'house_price_stage_seconds', 'Wall time of one inference stage call', LATENCY_BUCKETS, ('stage',))
+STAGE_BATCH_SIZE = metrics.histogram(
+    'house_price_stage_batch_size', 'Items processed by one inference stage call', BATCH_SIZE_BUCKETS, ('stage',))
+
+# Collectors of the requests the current code is working for (several when
+# micro-batched); stage_timer reports into each of them
+_collectors = ContextVar('timing_collectors', default=())
+
+def current_collectors():
+    return _collectors.get()
+
+@contextmanager
+def collecting(collectors):
+    """Attribute the stages run in this block to the given collectors"""
+    token = _collectors.set(tuple(collectors))
+    try:
+        yield
+    finally:
+        _collectors.reset(token)
+
+@contextmanager
+def request_timings():
+    """Collect a timing breakdown for the stages run on behalf of one request"""
+    collector = TimingCollector()
+    with collecting(current_collectors() + (collector,)):
+        yield collector
+
+def observe_stage(stage, seconds, batch_size=1, collectors=None):
+    """Record one stage call in the histograms and the request breakdowns"""
+    STAGE_SECONDS.observe(seconds, stage)
+    STAGE_BATCH_SIZE.observe(batch_size, stage)
+    for collector in _collectors.get() if collectors is None else collectors:
+        collector.add(stage, seconds, batch_size)
+
+@contextmanager
+def stage_timer(stage, batch_size=1):
+    """Record the enclosed block's duration and batch size under a stage name"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start, batch_size)
@@ -1,9 +1,20 @@
+import logging
+import os
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
 from torch.nn import Dropout
 from einops import rearrange
 
+from config import OFFLINE_MODE, SHARED_WEIGHTS_DIR, FUSION_WEIGHTS_NAME, QUANTIZED_MODEL_DIR, EXPORTED_MODEL_DIR
+from utils.shared_weights import WEIGHTS_FILE, has_shared_weights, load_shared_hf_model, load_shared_weights, weights_dir
+from utils.quantization import has_quantized, load_quantized, quantize_dynamic_int8, quantized_path
+from utils.checkpoints import built_from
+from utils.fused_model import FusedFusionModel
+from utils.backends import BACKENDS, compile_model, exported_path, has_exported, load_exported, require_backend
+
+logger = logging.getLogger(__name__)
+
 # Helper components
 class ResidualBlock(nn.Module):
     def __init__(self, in_dim, out_dim, activation='gelu'):
@@ -104,7 +115,18 @@ class EnhancedFusionModel(nn.Module):
         tab_feat = self.tabular_block(tab)
         img_feat = self.image_block(img)
         text_feat = self.text_block(text)
-        
+        return self._fuse(tab_feat, img_feat, text_feat)
+
+    def encode_context(self, img, text):
+        """Image and text branch outputs, to reuse across tabular variants"""
+        return self.image_block(img), self.text_block(text)
+
+    def forward_tabular(self, tab, img_feat, text_feat):
+        """Predict from tabular inputs and encode_context outputs (one row broadcasts to the batch)"""
+        batch = tab.shape[0]
+        return self._fuse(self.tabular_block(tab), img_feat.expand(batch, -1), text_feat.expand(batch, -1))
+
+    def _fuse(self, tab_feat, img_feat, text_feat):
         # Prepare for attention - shape: [seq_len, batch_size, embedding_dim]
         tab_q = tab_feat.unsqueeze(0)  # [1, batch_size, embed_dim]
         img_q = img_feat.unsqueeze(0)  # [1, batch_size, embed_dim]
@@ -164,4 +186,98 @@ class EnhancedFusionModel(nn.Module):
             img_text_inter * img_text_weight
         ], dim=1)
         
-        return self.final(weighted_combined)
\ No newline at end of file
+        return self.final(weighted_combined)
+
+# Loaders
+def _check_backend(backend):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {backend!r}, expected one of {list(BACKENDS)}")
+    require_backend(backend)
+
+def _load_exported_graph(name, backend, encoder):
+    """Exported TorchScript/ONNX graph for a model, or None to serve it eagerly"""
+    if backend not in ('torchscript', 'onnx'):
+        return None
+    if has_exported(EXPORTED_MODEL_DIR, name, backend):
+        return load_exported(exported_path(EXPORTED_MODEL_DIR, name, backend), backend, encoder=encoder)
+    logger.warning(f"No {backend} export of {name} in {EXPORTED_MODEL_DIR}, "
+                   f"running it eagerly (run tools/export_models.py to avoid this)")
+    return None
+
+def load_encoder(model_name, quantized=False, backend='eager', prebuilt=True):
+    """Load a HF encoder from saved int8, exported, shared memory-mapped or hub weights.
+
+    With prebuilt=False the hub weights are loaded, ignoring the artifacts
+    written by the tools.
+    """
+    _check_backend(backend)
+    if quantized:
+        if prebuilt and has_quantized(QUANTIZED_MODEL_DIR, model_name):
+            return load_quantized(QUANTIZED_MODEL_DIR, model_name)
+        if prebuilt:
+            logger.warning(f"No saved int8 model for {model_name} in {QUANTIZED_MODEL_DIR}, "
+                           f"quantizing at startup (run tools/quantize.py to avoid this)")
+        return quantize_dynamic_int8(load_encoder(model_name, prebuilt=prebuilt))
+
+    exported = _load_exported_graph(model_name, backend, encoder=True) if prebuilt else None
+    if exported is not None:
+        return exported
+
+    if prebuilt and has_shared_weights(SHARED_WEIGHTS_DIR, model_name):
+        # Memory-mapped weights shared with the other worker processes
+        model = load_shared_hf_model(SHARED_WEIGHTS_DIR, model_name)
+    else:
+        from transformers import AutoModel
+        model = AutoModel.from_pretrained(model_name, local_files_only=OFFLINE_MODE)
+    return compile_model(model) if backend == 'compile' else model
+
+def load_fusion_model(model_path, tab_dim, img_dim, text_dim, quantized=False, fused=False, backend='eager',
+                      prebuilt=False):
+    """Load the EnhancedFusionModel checkpoint, optionally as int8, fused or exported.
+
+    With ``prebuilt`` the int8, exported and shared-weight artifacts written
+    by the tools are used when they are recorded as built from ``model_path``.
+    Otherwise the checkpoint is loaded from model_path, quantized on the fly
+    and run eagerly (or compiled).
+    """
+    _check_backend(backend)
+    if prebuilt and quantized and has_quantized(QUANTIZED_MODEL_DIR, FUSION_WEIGHTS_NAME):
+        path = quantized_path(QUANTIZED_MODEL_DIR, FUSION_WEIGHTS_NAME)
+        if built_from(path, model_path):
+            return load_quantized(QUANTIZED_MODEL_DIR, FUSION_WEIGHTS_NAME)
+        logger.warning(f"Saved int8 fusion model {path} was not built from {model_path}, "
+                       f"quantizing at startup (rerun tools/quantize.py to avoid this)")
+    if prebuilt and not quantized:
+        if (has_exported(EXPORTED_MODEL_DIR, FUSION_WEIGHTS_NAME, backend)
+                and not built_from(exported_path(EXPORTED_MODEL_DIR, FUSION_WEIGHTS_NAME, backend), model_path)):
+            logger.warning(f"Exported fusion model in {EXPORTED_MODEL_DIR} was not built from {model_path}, "
+                           f"running it eagerly (rerun tools/export_models.py to avoid this)")
+        else:
+            exported = _load_exported_graph(FUSION_WEIGHTS_NAME, backend, encoder=False)
+            if exported is not None:
+                return exported
+
+    model = EnhancedFusionModel(tab_dim=tab_dim, img_dim=img_dim, text_dim=text_dim)
+    shared = prebuilt and has_shared_weights(SHARED_WEIGHTS_DIR, FUSION_WEIGHTS_NAME)
+    if shared and not built_from(os.path.join(weights_dir(SHARED_WEIGHTS_DIR, FUSION_WEIGHTS_NAME), WEIGHTS_FILE),
+                                 model_path):
+        logger.warning(f"Shared fusion weights in {SHARED_WEIGHTS_DIR} were not exported from {model_path}, "
+                       f"loading the checkpoint (rerun tools/export_shared_weights.py to share it)")
+        shared = False
+    if shared:
+        load_shared_weights(model, SHARED_WEIGHTS_DIR, FUSION_WEIGHTS_NAME)
+    else:
+        model.load_state_dict(torch.load(model_path, map_location='cpu'))
+    model.eval()
+
+    # The fusion model is small, so quantizing it on the fly is cheap
+    if quantized:
+        return quantize_dynamic_int8(model)
+    if fused and shared:
+        # Folding copies the weights into new tensors, which would give every
+        # worker a private fusion head again
+        logger.warning(f"Serving the shared fusion weights in {SHARED_WEIGHTS_DIR} unfused, "
+                       f"FUSED_FUSION_MODEL would copy them into every worker")
+    elif fused:
+        model = FusedFusionModel.from_model(model)
+    return compile_model(model) if backend == 'compile' else model
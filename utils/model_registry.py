@@ -0,0 +1,87 @@
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+
+MODEL_FILE = 'best_model.pth'
+SCALER_FILE = 'scaler.pkl'
+METADATA_FILE = 'metadata.json'
+ACTIVE_FILE = 'ACTIVE'
+VERSION_PATTERN = re.compile(r'^[A-Za-z0-9][A-Za-z0-9._-]*$')
+
+class ModelRegistry:
+    """Local directory of versioned fusion checkpoints and scalers.
+
+    Each version is a subdirectory holding ``best_model.pth``,
+    ``scaler.pkl`` and a ``metadata.json``. The ``ACTIVE`` file names the
+    version servers should run. It is replaced atomically, so a server
+    polling it never reads half a name. Versions are immutable once
+    registered; roll out a new checkpoint under a new version name.
+    """
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def register(self, version, model_path, scaler_path, metadata=None):
+        """Copy a checkpoint and scaler in as a new version and return its metadata"""
+        _check_version(version)
+        target = os.path.join(self.root, version)
+        if os.path.exists(target):
+            raise ValueError(f"Model version {version!r} already exists")
+        # Staged next to the target so the final rename is atomic
+        staging = tempfile.mkdtemp(prefix=f'.{version}-', dir=self.root)
+        try:
+            shutil.copyfile(model_path, os.path.join(staging, MODEL_FILE))
+            shutil.copyfile(scaler_path, os.path.join(staging, SCALER_FILE))
+            metadata = dict(metadata or {}, version=version, registered_at=time.time(),
+                            source_model=os.path.abspath(model_path), source_scaler=os.path.abspath(scaler_path))
+            with open(os.path.join(staging, METADATA_FILE), 'w') as f:
+                json.dump(metadata, f, indent=2)
+            os.rename(staging, target)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        return metadata
+
+    def versions(self):
+        """Registered version names, oldest first"""
+        names = [name for name in os.listdir(self.root)
+                 if VERSION_PATTERN.match(name) and os.path.isfile(os.path.join(self.root, name, MODEL_FILE))]
+        return sorted(names, key=lambda name: os.path.getmtime(os.path.join(self.root, name)))
+
+    def metadata(self, version):
+        with open(os.path.join(self._version_dir(version), METADATA_FILE)) as f:
+            return json.load(f)
+
+    def paths(self, version):
+        """(checkpoint path, scaler path) of a version"""
+        directory = self._version_dir(version)
+        return os.path.join(directory, MODEL_FILE), os.path.join(directory, SCALER_FILE)
+
+    def active(self):
+        """The version servers should run, or None before one is activated"""
+        try:
+            with open(os.path.join(self.root, ACTIVE_FILE)) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def set_active(self, version):
+        self._version_dir(version)
+        fd, staging = tempfile.mkstemp(prefix='.active-', dir=self.root)
+        with os.fdopen(fd, 'w') as f:
+            f.write(version + '\n')
+        os.replace(staging, os.path.join(self.root, ACTIVE_FILE))
+
+    def _version_dir(self, version):
+        _check_version(version)
+        directory = os.path.join(self.root, version)
+        if not os.path.isfile(os.path.join(directory, MODEL_FILE)):
+            raise KeyError(f"Unknown model version: {version}")
+        return directory
+
+def _check_version(version):
+    if not VERSION_PATTERN.match(version or ''):
+        raise ValueError(f"Invalid model version {version!r}, use letters, digits, '.', '_' and '-'")
@@ -0,0 +1,159 @@
+import hashlib
+import json
+import math
+import numbers
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+class PredictionCache:
+    """Whole-prediction cache with a TTL, LRU eviction and request coalescing.
+
+    Entries are keyed by ``make_key`` over the model version, the normalised
+    tabular features, the photo bytes and the title. A request whose key is
+    already being computed waits for that computation instead of starting
+    its own; only successful results are stored. Lookups report whether the answer came
+    from the cache or from another request's computation.
+    """
+    def __init__(self, max_entries=10000, ttl_seconds=300, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.coalesced = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(tabular_data, image, text_data, model_version=None):
+        """SHA-256 of the model version, the canonical tabular JSON, the photo bytes and the title"""
+        digest = hashlib.sha256(f"{model_version or ''}\0".encode('utf-8'))
+        digest.update(_canonical_tabular(tabular_data))
+        photos = image if isinstance(image, (list, tuple)) else [image]
+        for photo in photos:
+            content = _photo_bytes(photo)
+            # Length-prefixed so photo boundaries are part of the key
+            digest.update(len(content).to_bytes(8, 'big'))
+            digest.update(content)
+        digest.update(b'\0')
+        digest.update(str(text_data).strip().encode('utf-8'))
+        return digest.hexdigest()
+
+    def get_or_compute(self, key, compute):
+        """(value, cached): a stored or in-flight result, else compute() run in this thread"""
+        future, cached = self._claim(key)
+        if future is not None:
+            return future.result(), cached
+        future = self._in_flight[key]
+        try:
+            value = compute()
+        except BaseException as e:
+            self._fail(key, future, e)
+            raise
+        self._complete(key, future, value)
+        return value, False
+
+    def get_or_submit(self, key, submit):
+        """(future, cached): a stored or in-flight result, else the future submit() returns"""
+        future, cached = self._claim(key)
+        if future is not None:
+            return future, cached
+        shared = self._in_flight[key]
+        try:
+            future = submit()
+        except BaseException as e:
+            self._fail(key, shared, e)
+            raise
+
+        def done(result):
+            if result.exception() is not None:
+                self._fail(key, shared, result.exception())
+            else:
+                self._complete(key, shared, result.result())
+        future.add_done_callback(done)
+        return future, False
+
+    def clear(self):
+        """Drop every stored result, e.g. after the model changed"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'in_flight': len(self._in_flight),
+                'hits': self.hits,
+                'coalesced': self.coalesced,
+                'misses': self.misses,
+                'expired': self.expired,
+                'evictions': self.evictions,
+            }
+
+    def _claim(self, key):
+        """A future to wait on and whether it is a cache hit, or (None, False) when the caller computes"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > self._clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    future = Future()
+                    future.set_result(value)
+                    return future, True
+                del self._entries[key]
+                self.expired += 1
+
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, True
+
+            self.misses += 1
+            self._in_flight[key] = Future()
+            return None, False
+
+    def _complete(self, key, future, value):
+        with self._lock:
+            self._in_flight.pop(key, None)
+            if self.max_entries > 0:
+                self._entries[key] = (self._clock() + self.ttl_seconds, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        future.set_result(value)
+
+    def _fail(self, key, future, error):
+        with self._lock:
+            self._in_flight.pop(key, None)
+        future.set_exception(error)
+
+def _canonical_tabular(tabular_data):
+    """Sorted-key JSON with every number as a float and missing values as null"""
+    normalised = {}
+    for name, value in tabular_data.items():
+        if value is None or (isinstance(value, numbers.Real) and math.isnan(value)):
+            value = None
+        elif isinstance(value, numbers.Real) and not isinstance(value, bool):
+            value = float(value)
+        else:
+            value = str(value).strip()
+        normalised[str(name)] = value
+    return json.dumps(normalised, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+def _photo_bytes(photo):
+    """Encoded bytes of a photo given as bytes or a file path"""
+    if isinstance(photo, (bytes, bytearray, memoryview)):
+        return bytes(photo)
+    if isinstance(photo, (str, os.PathLike)):
+        with open(photo, 'rb') as f:
+            return f.read()
+    raise TypeError(f"Cannot key a prediction on a {type(photo).__name__} image, pass bytes or a path")
@@ -0,0 +1,30 @@
+import os
+
+import torch
+import torch.nn as nn
+
+QUANTIZED_FILE = 'model_int8.pt'
+
+def quantize_dynamic_int8(model):
+    """Dynamic int8 quantization of every Linear layer for CPU inference"""
+    model.eval()
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+def quantized_path(root, name):
+    return os.path.join(root, name.replace('/', '--'), QUANTIZED_FILE)
+
+def has_quantized(root, name):
+    return root is not None and os.path.exists(quantized_path(root, name))
+
+def save_quantized(model, root, name):
+    """Save a quantized module so it can be loaded without re-quantizing"""
+    path = quantized_path(root, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    torch.save(model, path)
+    return path
+
+def load_quantized(root, name):
+    # Whole-module pickle written by save_quantized, so only load trusted files
+    model = torch.load(quantized_path(root, name), map_location='cpu', weights_only=False)
+    model.eval()
+    return model
@@ -0,0 +1,83 @@
+import os
+import tempfile
+
+import torch
+
+WEIGHTS_FILE = 'weights.pt'
+
+def weights_dir(root, name):
+    """Directory holding the exported weights for one model"""
+    return os.path.join(root, name.replace('/', '--'))
+
+def has_shared_weights(root, name):
+    return root is not None and os.path.exists(os.path.join(weights_dir(root, name), WEIGHTS_FILE))
+
+def export_shared_weights(module, root, name):
+    """Save every parameter and buffer of ``module`` in an mmap-able file.
+
+    Non-persistent buffers are included so that a skeleton built on the
+    meta device can be fully populated by ``load_shared_weights``. HF models
+    also get their config saved next to the weights.
+    """
+    directory = weights_dir(root, name)
+    os.makedirs(directory, exist_ok=True)
+    tensors = {key: value.detach().contiguous() for key, value in module.named_parameters()}
+    tensors.update({key: value.contiguous() for key, value in module.named_buffers()})
+    # Written next to the target and renamed over it, so processes that have
+    # the previous file mapped keep their pages instead of seeing it truncated
+    path = os.path.join(directory, WEIGHTS_FILE)
+    fd, staging = tempfile.mkstemp(prefix='.weights-', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            torch.save(tensors, f)
+        os.replace(staging, path)
+    except BaseException:
+        os.unlink(staging)
+        raise
+    if hasattr(module, 'config'):
+        module.config.save_pretrained(directory)
+    return directory
+
+def load_shared_weights(module, root, name):
+    """Point the tensors of ``module`` at a read-only memory map of the file.
+
+    The pages are backed by the file in the OS page cache, so every process
+    that loads the same file shares one physical copy of the weights instead
+    of holding a private one.
+    """
+    path = os.path.join(weights_dir(root, name), WEIGHTS_FILE)
+    tensors = torch.load(path, map_location='cpu', mmap=True, weights_only=True)
+    for key, tensor in tensors.items():
+        module_name, _, attr = key.rpartition('.')
+        owner = module.get_submodule(module_name)
+        if attr in owner._parameters:
+            owner._parameters[attr] = torch.nn.Parameter(tensor, requires_grad=False)
+        elif attr in owner._buffers:
+            owner._buffers[attr] = tensor
+        else:
+            raise KeyError(f"Unexpected tensor '{key}' in {path}")
+
+    for key, tensor in list(module.named_parameters()) + list(module.named_buffers()):
+        if tensor.is_meta:
+            raise ValueError(f"Tensor '{key}' was not found in {path}")
+    return module
+
+def load_shared_hf_model(root, name):
+    """Build an HF model skeleton without allocating weights and map them in"""
+    from transformers import AutoConfig, AutoModel
+    config = AutoConfig.from_pretrained(weights_dir(root, name))
+    with torch.device('meta'):
+        model = AutoModel.from_config(config)
+    return load_shared_weights(model, root, name)
+
+def memory_report():
+    """Resident memory of this process, split into private and shared parts"""
+    import psutil
+    process = psutil.Process()
+    info = process.memory_full_info()
+    report = {'pid': process.pid, 'rss_mb': info.rss / 2**20, 'uss_mb': info.uss / 2**20}
+    # pss and shared are Linux only
+    for field in ('pss', 'shared'):
+        if hasattr(info, field):
+            report[f'{field}_mb'] = getattr(info, field) / 2**20
+    return report
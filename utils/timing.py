@@ -0,0 +1,34 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+class PhaseTimer:
+    """Records the wall-clock duration of named startup phases"""
+    def __init__(self):
+        self._phases = OrderedDict()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        """Time the enclosed block and log its duration"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            with self._lock:
+                self._phases[name] = self._phases.get(name, 0.0) + duration
+            logger.info(f"Startup phase '{name}' took {duration:.2f}s")
+
+    def summary(self):
+        """Seconds spent in each phase, in the order they first ran"""
+        with self._lock:
+            phases = dict(self._phases)
+        return {'phases': phases, 'total': sum(phases.values())}
+
+# Shared timer for model loading and warmup
+startup_timer = PhaseTimer()